@@ -0,0 +1,279 @@
+"""
+Офлайн-бенчмарки горячих путей на синтетических данных.
+
+Запуск:
+    python -m benchmarks.run --output bench_results.json
+
+Результаты пишутся в JSON (с коммитом git), чтобы сравнивать прогоны между коммитами.
+"""
+import argparse
+import asyncio
+import io
+import json
+import platform
+import subprocess
+import tempfile
+import time
+import zipfile
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from db.sqlite_module import Base, DBManager, GroupCommitWriter, apply_sqlite_pragmas
+from services.backtest import run_backtest
+from services.history import load_all_data_to_dataframe, load_columns
+from services.metrics import Counter, Histogram
+from services.portfolio import calculate_balance_from_orders
+from strategies.base import symbol_index, state_memory_report
+from strategies.initial_threshold import InitialThresholdStrategy
+from strategies.martingale_strategy import MartingaleStrategy
+from strategies.moving_average import MovingAverageCrossStrategy
+from strategies.static_initial_threshold import StaticInitialThresholdStrategy
+from strategies.threshold import ThresholdStrategy
+from strategies.trailing_initial_threshold import TrailingInitialThresholdStrategy
+from strategies.volume_spikes import VolumeSpikeStrategy
+
+SYMBOL = "TON/USDT"
+EXCHANGE = "binance"
+
+
+def synthetic_prices(n: int, seed: int = 42) -> tuple[np.ndarray, np.ndarray]:
+    """Случайное блуждание цены и объёма, детерминированное по seed."""
+    rng = np.random.default_rng(seed)
+    close = 3.0 * np.exp(np.cumsum(rng.normal(0, 0.002, n)))
+    volume = rng.uniform(10, 1000, n)
+    return close, volume
+
+
+def timed(fn, *args, repeat: int = 3):
+    """Лучшее время из repeat запусков синхронной функции, сек."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+async def timed_async(factory, repeat: int = 3):
+    """Лучшее время из repeat запусков корутины, создаваемой factory(), сек."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await factory()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+STRATEGY_CASES = {
+    "ThresholdStrategy": lambda: ThresholdStrategy(0.5),
+    "InitialThresholdStrategy": lambda: InitialThresholdStrategy(0.5),
+    "TrailingInitialThresholdStrategy": lambda: TrailingInitialThresholdStrategy(0.5),
+    "StaticInitialThresholdStrategy": lambda: StaticInitialThresholdStrategy(0.5),
+    "MartingaleStrategy": lambda: MartingaleStrategy(1.0, 5, 10),
+    "MovingAverageCrossStrategy": lambda: MovingAverageCrossStrategy(5, 20),
+    "VolumeSpikeStrategy": lambda: VolumeSpikeStrategy(50),
+}
+
+
+async def bench_strategies(ticks: int) -> dict:
+    close, volume = synthetic_prices(ticks)
+    closes, volumes = close.tolist(), volume.tolist()
+    results = {}
+    for name, make in STRATEGY_CASES.items():
+        async def run():
+            strategy = make()
+            for p, v in zip(closes, volumes):
+                await strategy.check(EXCHANGE, SYMBOL, p, v)
+
+        elapsed = await timed_async(run)
+        results[name] = {"ticks": ticks, "seconds": elapsed, "us_per_tick": elapsed / ticks * 1e6}
+    return results
+
+
+def bench_strategies_batch(symbols: int, snapshots: int) -> dict:
+    """Стоимость check_batch() на пару при снимках из symbols пар и память состояния на пару."""
+    close, volume = synthetic_prices(symbols * snapshots)
+    close = close.reshape(snapshots, symbols)
+    volume = volume.reshape(snapshots, symbols)
+    ids = symbol_index.intern_many(EXCHANGE, [f"S{i}/USDT" for i in range(symbols)])
+    results = {}
+    for name, make in STRATEGY_CASES.items():
+        def run():
+            strategy = make()
+            for row in range(snapshots):
+                strategy.check_batch(ids, close[row], volume[row])
+
+        elapsed = timed(run)
+        pairs = symbols * snapshots
+        results[name] = {"symbols": symbols, "snapshots": snapshots, "seconds": elapsed,
+                         "us_per_pair": elapsed / pairs * 1e6}
+
+    memory = state_memory_report([make() for make in STRATEGY_CASES.values()])
+    for name, info in memory["strategies"].items():
+        results[name]["state_bytes_per_pair"] = info["bytes_per_pair"]
+    results["index_bytes_per_pair"] = memory["index_bytes"] / memory["pairs"]
+    return results
+
+
+async def bench_backtest(candles: int) -> dict:
+    close, _ = synthetic_prices(candles)
+    elapsed = await timed_async(
+        lambda: run_backtest([TrailingInitialThresholdStrategy(0.5)], SYMBOL, close))
+    return {"candles": candles, "seconds": elapsed, "candles_per_second": candles / elapsed}
+
+
+async def bench_db(tmp: Path, writes: int, order_counts: list[int]) -> dict:
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp / 'bench.sqlite3'}", echo=False)
+    apply_sqlite_pragmas(engine)
+    session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    results = {}
+    close, volume = synthetic_prices(writes)
+    async with session_factory() as session:
+        db = DBManager(session)
+
+        start = time.perf_counter()
+        for i in range(writes):
+            await db.save_price(EXCHANGE, SYMBOL, close[i], volume[i])
+        elapsed = time.perf_counter() - start
+        results["save_price"] = {"calls": writes, "seconds": elapsed, "ops_per_second": writes / elapsed}
+
+        start = time.perf_counter()
+        for i in range(writes):
+            await db.create_order("bench", EXCHANGE, SYMBOL, "market", "buy" if i % 2 == 0 else "sell",
+                                  1.0, close[i], "closed")
+        elapsed = time.perf_counter() - start
+        results["create_order"] = {"calls": writes, "seconds": elapsed, "ops_per_second": writes / elapsed}
+
+        balance = {}
+        for count in order_counts:
+            await db.delete_all_orders()
+            prices, _ = synthetic_prices(count, seed=count)
+            await db.create_orders_bulk([
+                {"strategy": "bench", "exchange": EXCHANGE, "symbol": SYMBOL, "order_type": "market",
+                 "side": "buy" if i % 2 == 0 else "sell", "amount": 1.0, "price": float(prices[i]),
+                 "status": "closed", "order_id": None}
+                for i in range(count)
+            ])
+            elapsed = await timed_async(lambda: calculate_balance_from_orders(db, {SYMBOL: float(prices[-1])}))
+            balance[str(count)] = {"orders": count, "seconds": elapsed}
+        results["calculate_balance_from_orders"] = balance
+
+    # Одновременные записи (как от нескольких пар сразу): commit на каждую против group commit
+    async def concurrent_orders(writer):
+        async def one(i):
+            async with session_factory() as session:
+                await DBManager(session, writer).create_order("bench", EXCHANGE, SYMBOL, "market", "buy", 1.0,
+                                                              close[i], "closed")
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(writes)))
+        return time.perf_counter() - start
+
+    elapsed = await concurrent_orders(GroupCommitWriter(session_factory))  # Не запущен: commit на каждую запись
+    results["create_order_concurrent"] = {"calls": writes, "seconds": elapsed, "ops_per_second": writes / elapsed}
+    writer = GroupCommitWriter(session_factory)
+    writer.start()
+    elapsed = await concurrent_orders(writer)
+    await writer.close()
+    results["create_order_group_commit"] = {"calls": writes, "seconds": elapsed, "ops_per_second": writes / elapsed,
+                                            "transactions": writer.batches}
+
+    await engine.dispose()
+    return results
+
+
+def bench_metrics(calls: int = 1_000_000) -> dict:
+    """Цена инструментирования горячего пути: observe() гистограммы и inc() счётчика."""
+    histogram = Histogram("bench_seconds", "bench", ("label",)).labels("x")
+    counter = Counter("bench", "bench", ("label",)).labels("x")
+    start = time.perf_counter()
+    for _ in range(calls):
+        histogram.observe(0.003)
+    observe = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(calls):
+        counter.inc()
+    inc = time.perf_counter() - start
+    return {"calls": calls, "observe_ns": observe / calls * 1e9, "inc_ns": inc / calls * 1e9}
+
+
+def write_synthetic_archives(data_dir: Path, days: int):
+    """Архивы в формате Binance klines 1m: по одному zip на день."""
+    data_dir.mkdir(parents=True, exist_ok=True)
+    close, volume = synthetic_prices(days * 1440)
+    t0 = int(datetime(2025, 1, 1, tzinfo=timezone.utc).timestamp() * 1000)
+    for day in range(days):
+        buf = io.StringIO()
+        for i in range(day * 1440, (day + 1) * 1440):
+            ts = t0 + i * 60_000
+            c = close[i]
+            buf.write(f"{ts},{c},{c * 1.001},{c * 0.999},{c},{volume[i]},{ts + 59_999},0,0,0,0,0\n")
+        name = f"TONUSDT-1m-{datetime.fromtimestamp(t0 / 1000 + day * 86_400, tz=timezone.utc):%Y-%m-%d}"
+        with zipfile.ZipFile(data_dir / f"{name}.zip", "w", zipfile.ZIP_DEFLATED) as z:
+            z.writestr(f"{name}.csv", buf.getvalue())
+
+
+def bench_history(tmp: Path, days: int) -> dict:
+    data_dir = tmp / "historydata" / "TON"
+    write_synthetic_archives(data_dir, days)
+    cold = timed(load_all_data_to_dataframe, str(data_dir), repeat=1)  # первая загрузка строит кэш
+    warm = timed(load_all_data_to_dataframe, str(data_dir))
+    # Окно в один день: лишние архивы отсекаются по имени и не открываются
+    day_start = datetime(2025, 1, 1) + timedelta(days=days // 2)
+    window = timed(load_columns, str(data_dir), day_start, day_start + timedelta(hours=23, minutes=59))
+    return {"archives": days, "rows": days * 1440, "cold_seconds": cold, "warm_seconds": warm,
+            "one_day_window_seconds": window}
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(args):
+    report = {
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory(prefix="bench_") as tmp:
+        tmp = Path(tmp)
+        print("⏱ Стратегии: стоимость check() на тик...")
+        report["results"]["strategy_check"] = await bench_strategies(args.ticks)
+        print("⏱ Стратегии: стоимость check_batch() на пару...")
+        report["results"]["strategy_check_batch"] = bench_strategies_batch(args.batch_symbols, args.batch_snapshots)
+        print("⏱ Бэктест: свечей в секунду...")
+        report["results"]["backtest"] = await bench_backtest(args.candles)
+        print("⏱ БД: save_price, create_order (в т.ч. group commit), calculate_balance_from_orders...")
+        report["results"]["db"] = await bench_db(tmp, args.db_writes, args.order_counts)
+        print("⏱ Метрики: стоимость observe()/inc()...")
+        report["results"]["metrics"] = bench_metrics()
+        print("⏱ История: загрузка архивов...")
+        report["results"]["history_load"] = bench_history(tmp, args.days)
+
+    Path(args.output).write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f"✅ Результаты записаны в {args.output}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарки стратегий, бэктеста и слоя хранения")
+    parser.add_argument("--output", default="bench_results.json", help="JSON-файл с результатами")
+    parser.add_argument("--ticks", type=int, default=50_000, help="тиков на стратегию")
+    parser.add_argument("--batch-symbols", type=int, default=1_000, help="пар в снимке для check_batch")
+    parser.add_argument("--batch-snapshots", type=int, default=200, help="снимков для check_batch")
+    parser.add_argument("--candles", type=int, default=200_000, help="свечей в бэктесте")
+    parser.add_argument("--db-writes", type=int, default=500, help="вызовов save_price/create_order")
+    parser.add_argument("--order-counts", type=int, nargs="+", default=[100, 1_000, 5_000],
+                        help="размеры таблицы orders для calculate_balance_from_orders")
+    parser.add_argument("--days", type=int, default=30, help="дневных архивов для загрузки истории")
+    asyncio.run(main(parser.parse_args()))
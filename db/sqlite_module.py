@@ -1,12 +1,22 @@
+import asyncio
 import csv
+import logging
+import time
 from datetime import datetime, timedelta
 
+import numpy as np
+
 # SQLAlchemy импорты для моделей, запросов, асинхронной работы
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy import Column, Integer, String, Float, DateTime, select, delete, desc, update
+from sqlalchemy import Column, Integer, String, Float, DateTime, Index, select, delete, desc, update, insert, tuple_, event, \
+    literal
 from sqlalchemy.sql import func
 
+from services.metrics import db_commit_seconds, queue_depth
+from tgbot.config import SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS, SQLITE_CACHE_SIZE, SQLITE_BUSY_TIMEOUT, \
+    SQLITE_GROUP_COMMIT_MS, SQLITE_GROUP_COMMIT_MAX
+
 # ===============================
 # Настройка подключения к SQLite
 # ===============================
@@ -17,6 +27,24 @@ DATABASE_URL = "sqlite+aiosqlite:///./db.sqlite3"
 # Асинхронный движок базы данных
 engine = create_async_engine(DATABASE_URL, echo=False)
 
+
+def apply_sqlite_pragmas(target_engine):
+    """
+    Настройки SQLite на каждое новое соединение: режим журнала (по умолчанию DELETE, WAL — по
+    SQLITE_JOURNAL_MODE, тогда читатели не ждут писателя), уровень synchronous, размер кэша страниц и ожидание блокировки вместо ошибки "database is locked".
+    """
+    @event.listens_for(target_engine.sync_engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+        cursor.close()
+
+
+apply_sqlite_pragmas(engine)
+
 # Фабрика асинхронных сессий
 AsyncSessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
 
@@ -38,6 +66,43 @@ class PriceEntry(Base):
     volume = Column(Float)                       # Объём
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())  # Дата обновления
 
+# История цен: только добавление, ключ (exchange, symbol, ts)
+class PriceTick(Base):
+    __tablename__ = "price_ticks"
+
+    id = Column(Integer, primary_key=True)
+    exchange = Column(String, nullable=False)    # Биржа
+    symbol = Column(String, nullable=False)      # Валютная пара
+    ts = Column(Integer, nullable=False)         # Время тика, мс (unix)
+    price = Column(Float, nullable=False)        # Цена
+    volume = Column(Float)                       # Объём (24ч, как отдаёт тикер)
+
+    __table_args__ = (
+        Index("ix_price_ticks_exchange_symbol_ts", "exchange", "symbol", "ts"),
+    )
+
+# Свёрнутая история: OHLCV-бары 1m/1h из старых тиков
+class PriceBar(Base):
+    __tablename__ = "price_bars"
+
+    id = Column(Integer, primary_key=True)
+    exchange = Column(String, nullable=False)    # Биржа
+    symbol = Column(String, nullable=False)      # Валютная пара
+    timeframe = Column(String, nullable=False)   # '1m' или '1h'
+    ts = Column(Integer, nullable=False)         # Начало бара, мс (unix)
+    open = Column(Float)
+    high = Column(Float)
+    low = Column(Float)
+    close = Column(Float)
+    volume = Column(Float)                       # Объём на закрытии бара
+
+    __table_args__ = (
+        Index("ix_price_bars_exchange_symbol_tf_ts", "exchange", "symbol", "timeframe", "ts", unique=True),
+    )
+
+# Длительность таймфреймов баров, мс
+TIMEFRAME_MS = {"1m": 60_000, "1h": 3_600_000}
+
 # Таблица с логами алертов
 class StrategyAlert(Base):
     __tablename__ = "strategy_alerts"
@@ -66,13 +131,48 @@ class Order(Base):
     order_id = Column(String)              # ID ордера на бирже
     created_at = Column(DateTime, server_default=func.now())  # Время создания
 
+# Инкрементальный учёт портфеля: итоговое состояние (одна строка)
+class LedgerState(Base):
+    __tablename__ = "ledger_state"
+
+    id = Column(Integer, primary_key=True)       # Всегда 1
+    initial_cash = Column(Float)                 # Стартовый кэш, от которого ведётся учёт
+    cash = Column(Float)                         # Текущий кэш
+    realized_pnl = Column(Float)                 # Реализованный PnL
+    last_order_id = Column(Integer)              # Последний учтённый ордер (orders.id)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+# Инкрементальный учёт портфеля: открытые позиции
+class LedgerPosition(Base):
+    __tablename__ = "ledger_positions"
+
+    symbol = Column(String, primary_key=True)    # Валютная пара
+    amount = Column(Float)                       # Количество (< 0 — шорт)
+    avg_price = Column(Float)                    # Средняя цена входа
+
 # ===============================
 # Слой доступа к данным (DAL)
 # ===============================
 
 class DBManager:
-    def __init__(self, session: AsyncSession):
+    def __init__(self, session: AsyncSession, writer: "GroupCommitWriter" = None):
         self.session = session
+        self.writer = writer or db_writer
+
+    async def _write(self, op):
+        """
+        Выполняет запись op(session) и фиксирует её.
+
+        Если запущен group-commit writer, запись уходит в его общую транзакцию, и вызов завершается,
+        когда она зафиксирована. Иначе — в сессии этого DBManager с отдельным commit.
+        """
+        if self.writer.running:
+            return await self.writer.submit(op)
+        result = await op(self.session)
+        start = time.perf_counter()
+        await self.session.commit()
+        db_commit_seconds.labels("direct").observe(time.perf_counter() - start)
+        return result
 
     # Получить последнюю сохранённую цену по паре и бирже
     async def get_last_price(self, exchange: str, symbol: str) -> float | None:
@@ -86,23 +186,166 @@ class DBManager:
 
     # Сохранить (или обновить) текущую цену и объём
     async def save_price(self, exchange: str, symbol: str, price: float, volume: float):
-        stmt = select(PriceEntry).where(
-            PriceEntry.exchange == exchange,
-            PriceEntry.symbol == symbol
+        async def op(session):
+            stmt = select(PriceEntry).where(
+                PriceEntry.exchange == exchange,
+                PriceEntry.symbol == symbol
+            )
+            result = await session.execute(stmt)
+            entry = result.scalars().first()
+
+            if entry:
+                # Обновляем запись
+                entry.last_price = price
+                entry.volume = volume
+            else:
+                # Добавляем новую
+                entry = PriceEntry(exchange=exchange, symbol=symbol, last_price=price, volume=volume)
+                session.add(entry)
+
+        await self._write(op)
+
+    # Получить все сохранённые цены и объёмы: {(exchange, symbol): (price, volume)}
+    async def get_all_prices(self) -> dict[tuple[str, str], tuple[float, float]]:
+        result = await self.session.execute(select(PriceEntry))
+        return {(e.exchange, e.symbol): (e.last_price, e.volume) for e in result.scalars().all()}
+
+    # Сохранить пачку цен одной транзакцией (upsert по паре exchange+symbol)
+    async def save_prices_bulk(self, prices: dict[tuple[str, str], tuple[float, float]]) -> int:
+        """Обновляет существующие записи и добавляет новые одним SELECT и одним commit."""
+        if not prices:
+            return 0
+
+        async def op(session):
+            result = await session.execute(
+                select(PriceEntry).where(tuple_(PriceEntry.exchange, PriceEntry.symbol).in_(list(prices)))
+            )
+            existing = {(e.exchange, e.symbol): e for e in result.scalars().all()}
+
+            for (exchange, symbol), (price, volume) in prices.items():
+                entry = existing.get((exchange, symbol))
+                if entry:
+                    entry.last_price = price
+                    entry.volume = volume
+                else:
+                    session.add(PriceEntry(exchange=exchange, symbol=symbol, last_price=price, volume=volume))
+            return len(prices)
+
+        return await self._write(op)
+
+    # Добавить пачку тиков в историю одним executemany
+    async def save_ticks(self, ticks: list[tuple[str, str, int, float, float]]) -> int:
+        """Принимает список (exchange, symbol, ts_ms, price, volume)."""
+        if not ticks:
+            return 0
+
+        async def op(session):
+            await session.execute(
+                insert(PriceTick),
+                [{"exchange": e, "symbol": s, "ts": ts, "price": p, "volume": v} for e, s, ts, p, v in ticks],
+            )
+            return len(ticks)
+
+        return await self._write(op)
+
+    # Тики пары за интервал в виде массивов NumPy
+    async def get_ticks_range(self, exchange: str, symbol: str, start_ts: int = None, end_ts: int = None,
+                              limit: int = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Возвращает (ts int64, price float64, volume float64), отсортированные по времени.
+        limit — только последние limit тиков (ORDER BY ts DESC LIMIT по индексу, без чтения всей истории).
+        """
+        stmt = select(PriceTick.ts, PriceTick.price, PriceTick.volume).where(
+            PriceTick.exchange == exchange,
+            PriceTick.symbol == symbol,
         )
-        result = await self.session.execute(stmt)
-        entry = result.scalars().first()
-
-        if entry:
-            # Обновляем запись
-            entry.last_price = price
-            entry.volume = volume
+        if start_ts is not None:
+            stmt = stmt.where(PriceTick.ts >= start_ts)
+        if end_ts is not None:
+            stmt = stmt.where(PriceTick.ts <= end_ts)
+        if limit is None:
+            result = await self.session.execute(stmt.order_by(PriceTick.ts))
+            rows = np.array(result.all(), dtype=np.float64).reshape(-1, 3)
         else:
-            # Добавляем новую
-            entry = PriceEntry(exchange=exchange, symbol=symbol, last_price=price, volume=volume)
-            self.session.add(entry)
+            result = await self.session.execute(stmt.order_by(desc(PriceTick.ts)).limit(limit))
+            rows = np.array(result.all(), dtype=np.float64).reshape(-1, 3)[::-1]
+        return rows[:, 0].astype(np.int64), rows[:, 1].copy(), np.nan_to_num(rows[:, 2])
+
+    # Бары пары за интервал в виде массивов NumPy
+    async def get_bars_range(self, exchange: str, symbol: str, timeframe: str = "1m", start_ts: int = None,
+                             end_ts: int = None, limit: int = None) -> dict[str, np.ndarray]:
+        """
+        Возвращает {"ts", "open", "high", "low", "close", "volume"} — колонки, отсортированные по времени.
+        limit — только последние limit баров.
+        """
+        stmt = select(PriceBar.ts, PriceBar.open, PriceBar.high, PriceBar.low, PriceBar.close, PriceBar.volume).where(
+            PriceBar.exchange == exchange,
+            PriceBar.symbol == symbol,
+            PriceBar.timeframe == timeframe,
+        )
+        if start_ts is not None:
+            stmt = stmt.where(PriceBar.ts >= start_ts)
+        if end_ts is not None:
+            stmt = stmt.where(PriceBar.ts <= end_ts)
+        if limit is None:
+            result = await self.session.execute(stmt.order_by(PriceBar.ts))
+            rows = np.array(result.all(), dtype=np.float64).reshape(-1, 6)
+        else:
+            result = await self.session.execute(stmt.order_by(desc(PriceBar.ts)).limit(limit))
+            rows = np.array(result.all(), dtype=np.float64).reshape(-1, 6)[::-1]
+        bars = {name: rows[:, i].copy() for i, name in enumerate(("ts", "open", "high", "low", "close", "volume"))}
+        bars["ts"] = bars["ts"].astype(np.int64)
+        return bars
+
+    # Свернуть тики (или 1m-бары) старше cutoff_ts в бары таймфрейма и удалить исходные строки
+    async def rollup_history(self, timeframe: str, cutoff_ts: int, source: str = "ticks") -> int:
+        """
+        Компактирует историю: source='ticks' — тики в бары timeframe, source='1m' — минутные бары в часовые.
+        cutoff_ts выравнивается вниз на границу бара, поэтому сворачиваются только завершённые бары.
+        Возвращает количество записанных баров.
+        """
+        bar_ms = TIMEFRAME_MS[timeframe]
+        aligned_ts = cutoff_ts // bar_ms * bar_ms
+        if source == "ticks":
+            model = PriceTick
+            first_col = high_col = low_col = last_col = PriceTick.price
+            source_filter = [PriceTick.ts < aligned_ts]
+        else:
+            model = PriceBar
+            first_col, high_col, low_col, last_col = PriceBar.open, PriceBar.high, PriceBar.low, PriceBar.close
+            source_filter = [PriceBar.timeframe == source, PriceBar.ts < aligned_ts]
+
+        # Агрегация целиком в SQLite (GROUP BY пары и начала бара): строки истории не попадают в Python,
+        # сортировка группировки при нехватке cache_size уходит во временный файл
+        bucket = model.ts - model.ts % bar_ms
+        groups = select(
+            model.exchange, model.symbol, bucket.label("ts"),
+            func.min(model.ts).label("first_ts"), func.max(model.ts).label("last_ts"),
+            func.max(high_col).label("high"), func.min(low_col).label("low"),
+        ).where(*source_filter).group_by(model.exchange, model.symbol, bucket).subquery()
+
+        def at(column, ts, order):
+            """Значение column в строке пары с временем ts (первая/последняя строка бара) — по индексу."""
+            return select(column).where(
+                model.exchange == groups.c.exchange, model.symbol == groups.c.symbol, model.ts == ts,
+                *source_filter[:-1],
+            ).order_by(order).limit(1).scalar_subquery()
+
+        bars = select(
+            groups.c.exchange, groups.c.symbol, literal(timeframe), groups.c.ts,
+            at(first_col, groups.c.first_ts, model.id), groups.c.high, groups.c.low,
+            at(last_col, groups.c.last_ts, desc(model.id)),
+            at(func.coalesce(model.volume, 0.0), groups.c.last_ts, desc(model.id)),
+        )
 
-        await self.session.commit()
+        async def op(session):
+            result = await session.execute(
+                insert(PriceBar).prefix_with("OR REPLACE").from_select(
+                    ["exchange", "symbol", "timeframe", "ts", "open", "high", "low", "close", "volume"], bars))
+            await session.execute(delete(model).where(*source_filter))
+            return max(result.rowcount, 0)
+
+        return await self._write(op)
 
     # Записать алерт стратегии в лог
     async def log_alert(self, strategy: str, exchange: str, symbol: str, old: float, new: float, volume: float):
@@ -114,18 +357,24 @@ class DBManager:
             new_price=new,
             volume=volume,
         )
-        self.session.add(alert)
-        await self.session.commit()
+
+        async def op(session):
+            session.add(alert)
+
+        await self._write(op)
 
     # Удалить алерты старше N дней
     async def delete_old_alerts(self, days: int = 7) -> int:
         """Удаляет алерты старше N дней. Возвращает количество удалённых записей."""
         cutoff_date = datetime.utcnow() - timedelta(days=days)
-        result = await self.session.execute(
-            delete(StrategyAlert).where(StrategyAlert.created_at < cutoff_date)
-        )
-        await self.session.commit()
-        return result.rowcount
+
+        async def op(session):
+            result = await session.execute(
+                delete(StrategyAlert).where(StrategyAlert.created_at < cutoff_date)
+            )
+            return result.rowcount
+
+        return await self._write(op)
 
     # Получить алерты постранично, начиная с самых новых
     async def get_alerts_paginated(self, page: int = 1, page_size: int = 20) -> list[StrategyAlert]:
@@ -184,16 +433,49 @@ class DBManager:
             order_id=order_id,
             created_at=created_at or datetime.utcnow()
         )
-        self.session.add(order)
-        await self.session.commit()
-        await self.session.refresh(order)
-        return order
+
+        async def op(session):
+            session.add(order)
+            await session.flush()  # Назначает order.id; остальные поля заданы явно, refresh не нужен
+            return order
+
+        return await self._write(op)
+
+    # Создать несколько ордеров одной транзакцией и вернуть их строки (с id)
+    async def create_orders(self, orders: list[dict]) -> list[Order]:
+        """Как create_order для каждого словаря аргументов, но с одним commit на всю пачку."""
+        rows = [Order(**{**o, "created_at": o.get("created_at") or datetime.utcnow()}) for o in orders]
+        if not rows:
+            return []
+
+        async def op(session):
+            session.add_all(rows)
+            await session.flush()
+            return rows
+
+        return await self._write(op)
+
+    # Создать пачку ордеров одной транзакцией (например, сделки бэктеста)
+    async def create_orders_bulk(self, orders: list[dict]) -> int:
+        """Каждый элемент — аргументы create_order в виде словаря."""
+        if not orders:
+            return 0
+        rows = [{**o, "created_at": o.get("created_at") or datetime.utcnow()} for o in orders]
+
+        async def op(session):
+            await session.execute(insert(Order), rows)
+            return len(rows)
+
+        return await self._write(op)
 
     # Обновить статус ордера по id
     async def update_order_status(self, order_id: int, new_status: str):
         stmt = update(Order).where(Order.id == order_id).values(status=new_status)
-        await self.session.execute(stmt)
-        await self.session.commit()
+
+        async def op(session):
+            await session.execute(stmt)
+
+        await self._write(op)
 
     # Получить ордер по id
     async def get_order_by_id(self, order_id: int):
@@ -201,6 +483,11 @@ class DBManager:
         result = await self.session.execute(stmt)
         return result.scalars().first()
 
+    # Получить ордера по списку id
+    async def get_orders_by_ids(self, order_ids: list[int]) -> list[Order]:
+        result = await self.session.execute(select(Order).where(Order.id.in_(order_ids)).order_by(Order.id))
+        return result.scalars().all()
+
     # Получить все ордера по фильтрам (например, по бирже, символу, статусу)
     async def get_orders(self, exchange: str = None, symbol: str = None, status: str = None, limit: int = 50):
         stmt = select(Order).order_by(desc(Order.created_at)).limit(limit)
@@ -213,13 +500,177 @@ class DBManager:
         result = await self.session.execute(stmt)
         return result.scalars().all()
 
+    # Закрытые ордера с id больше заданного, в порядке создания (для догоняющего пересчёта учёта)
+    async def get_closed_orders_after(self, order_id: int = 0) -> list[Order]:
+        result = await self.session.execute(
+            select(Order).where(Order.status == "closed", Order.id > order_id).order_by(Order.created_at, Order.id)
+        )
+        return result.scalars().all()
+
     # Удалить все ордера из таблицы
     async def delete_all_orders(self) -> int:
-        """Удаляет все записи из таблицы orders. Возвращает количество удалённых ордеров."""
-        result = await self.session.execute(delete(Order))
-        await self.session.commit()
-        return result.rowcount
+        """Удаляет все записи из таблицы orders и сбрасывает учёт портфеля. Возвращает количество удалённых ордеров."""
+        async def op(session):
+            result = await session.execute(delete(Order))
+            await session.execute(delete(LedgerPosition))
+            await session.execute(delete(LedgerState))
+            return result.rowcount
+
+        return await self._write(op)
+
+    # Загрузить учёт портфеля: (LedgerState | None, {symbol: (amount, avg_price)})
+    async def get_ledger(self) -> tuple[LedgerState | None, dict[str, tuple[float, float]]]:
+        state = (await self.session.execute(select(LedgerState).where(LedgerState.id == 1))).scalars().first()
+        positions = (await self.session.execute(select(LedgerPosition))).scalars().all()
+        return state, {p.symbol: (p.amount, p.avg_price) for p in positions}
+
+    # Сохранить учёт портфеля: итоговые значения и только изменившиеся позиции
+    async def save_ledger(self, initial_cash: float, cash: float, realized_pnl: float, last_order_id: int,
+                          positions: dict[str, tuple[float, float] | None], statuses: dict[int, str] = None):
+        """
+        positions: {symbol: (amount, avg_price)} для изменённых позиций, None — позиция закрыта.
+        statuses: {id ордера: новый статус} — открытые ордера, которые переводятся в той же транзакции.
+        """
+        async def op(session):
+            for order_id, status in (statuses or {}).items():
+                await session.execute(
+                    update(Order).where(Order.id == order_id, Order.status == "open").values(status=status)
+                )
+            await session.merge(LedgerState(id=1, initial_cash=initial_cash, cash=cash,
+                                            realized_pnl=realized_pnl, last_order_id=last_order_id))
+            for symbol, position in positions.items():
+                if position is None:
+                    await session.execute(delete(LedgerPosition).where(LedgerPosition.symbol == symbol))
+                else:
+                    await session.merge(LedgerPosition(symbol=symbol, amount=position[0], avg_price=position[1]))
+
+        await self._write(op)
+
+
+
+# ===============================
+# Group commit: один писатель, пачки записей в одной транзакции
+# ===============================
 
+class GroupCommitWriter:
+    """
+    Единственный писатель в БД. Записи (функции op(session)) копятся в очереди, и фоновая задача
+    выполняет их пачкой в одной транзакции: пачка закрывается через max_delay_ms после первой
+    записи или при max_batch записях. submit() возвращает future, который завершается результатом op
+    после commit пачки — то есть когда запись надёжно сохранена (в пределах PRAGMA synchronous).
+
+    Если одна запись в пачке падает (в op или при flush после неё), транзакция откатывается,
+    её future получает исключение, а остальные записи пачки выполняются заново. Если падает сама
+    пачка (сессия, commit, rollback), исключение получают все её записи, а писатель работает дальше.
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal, max_delay_ms: float = SQLITE_GROUP_COMMIT_MS,
+                 max_batch: int = SQLITE_GROUP_COMMIT_MAX):
+        self.session_factory = session_factory
+        self.max_delay = max_delay_ms / 1000
+        self.max_batch = max_batch
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self.batches = 0
+        self.writes = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.running:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    def submit(self, op) -> asyncio.Future:
+        """Ставит запись в очередь; future завершится после commit её пачки."""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((op, future))
+        return future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                # Сначала забираем всё, что уже накопилось, потом ждём остаток окна
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._commit_batch(batch)
+            except Exception as e:
+                logging.error(f"Ошибка записи пачки из {len(batch)} записей: {e!r}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    async def _commit_batch(self, batch: list):
+        while batch:
+            async with self.session_factory() as session:
+                results = []
+                failed = None
+                for i, (op, future) in enumerate(batch):
+                    try:
+                        results.append(await op(session))
+                        # Ошибки ограничений проявляются при flush: ловим их на своей записи, а не на commit
+                        await session.flush()
+                    except Exception as e:
+                        failed = i, e
+                        break
+
+                if failed is None:
+                    start = time.perf_counter()
+                    try:
+                        await session.commit()
+                    except Exception as e:
+                        logging.error(f"Ошибка commit пачки из {len(batch)} записей: {e!r}")
+                        for _, future in batch:
+                            if not future.done():
+                                future.set_exception(e)
+                        return
+                    db_commit_seconds.labels("group").observe(time.perf_counter() - start)
+                    self.batches += 1
+                    self.writes += len(batch)
+                    for (_, future), result in zip(batch, results):
+                        if not future.done():
+                            future.set_result(result)
+                    return
+
+                i, error = failed
+                _, future = batch.pop(i)
+                if not future.done():
+                    future.set_exception(error)
+                await session.rollback()
+
+    async def close(self):
+        """Дожидается записи всего, что уже в очереди, и останавливает писателя."""
+        if not self.running:
+            self._task = None
+            return
+        done = asyncio.get_running_loop().create_future()
+
+        async def barrier(session):
+            return None
+
+        self._queue.put_nowait((barrier, done))
+        await done
+        self._task.cancel()
+        self._task = None
+
+
+# Общий на процесс писатель (запускается в main при SQLITE_GROUP_COMMIT=1)
+db_writer = GroupCommitWriter()
+queue_depth.labels("db_writer").set_function(lambda: db_writer._queue.qsize() if db_writer._queue else 0)
 
 
 # ===============================
@@ -0,0 +1,102 @@
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from services.backtest import run_backtest
+from services.profiling import Profiler
+from strategies.initial_threshold import InitialThresholdStrategy
+from strategies.martingale_strategy import MartingaleStrategy
+from strategies.static_initial_threshold import StaticInitialThresholdStrategy
+from strategies.trailing_initial_threshold import TrailingInitialThresholdStrategy
+
+# Стратегии, доступные для перебора (воркеру передаётся имя, а не объект)
+STRATEGY_CLASSES = {
+    "InitialThresholdStrategy": InitialThresholdStrategy,
+    "TrailingInitialThresholdStrategy": TrailingInitialThresholdStrategy,
+    "StaticInitialThresholdStrategy": StaticInitialThresholdStrategy,
+    "MartingaleStrategy": MartingaleStrategy,
+}
+
+# Данные, открытые в процессе-воркере (memmap на общий файл, без копирования)
+_worker_close: np.ndarray | None = None
+
+
+def parameter_grid(grid: dict[str, list]) -> list[dict]:
+    """{"threshold_percent": [1, 2], "max_steps": [3, 5]} -> список всех комбинаций параметров."""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+
+
+def _init_worker(close_path: str):
+    global _worker_close
+    _worker_close = np.load(close_path, mmap_mode="r")
+
+
+def _run_one(strategy_name: str, params: dict, symbol: str, long_only: bool, profile_interval_ms: float = 0) -> dict:
+    strategy = STRATEGY_CLASSES[strategy_name](**params)
+    # Выборочный профиль воркера: стеки возвращаются вместе с результатом и сливаются в профиль родителя
+    profiler = Profiler("sweep", mode="sample" if profile_interval_ms else "off", interval_ms=profile_interval_ms)
+    profiler.start()
+    try:
+        result = asyncio.run(run_backtest([strategy], symbol, _worker_close, long_only=long_only,
+                                          profiler=profiler if profiler.enabled else None, curves=False))
+    finally:
+        profiler.stop(write=False)
+    row = {
+        **params,
+        "equity": result.equity,
+        "cash": result.cash,
+        "realized": result.realized_pnl,
+        "unrealized": result.unrealized_pnl,
+        "trades": len(result.trades),
+    }
+    if profiler.enabled:
+        row["_stacks"] = dict(profiler.stacks)
+    return row
+
+
+def run_sweep(strategy_name: str, grid: dict[str, list], close: np.ndarray, symbol: str,
+              long_only: bool = False, processes: int = None, sort_by: str = "equity",
+              profiler: Profiler = None) -> list[dict]:
+    """
+    Параллельный перебор параметров стратегии: каждая комбинация — в своём процессе.
+
+    Цены записываются один раз во временный .npy, воркеры открывают его через memmap,
+    так что данные делятся между процессами через page cache без копирования.
+
+    :param grid: Значения по каждому параметру конструктора стратегии
+    :param profiler: Профиль родителя; в режиме sample воркеры профилируются сами, их стеки попадают в фазу «sweep»
+    :return: Результаты по всем комбинациям, отсортированные по sort_by (по убыванию)
+    """
+    combos = parameter_grid(grid)
+    processes = processes or min(len(combos), os.cpu_count() or 1)
+    interval_ms = profiler.interval * 1000 if profiler is not None and profiler.mode == "sample" else 0
+
+    with tempfile.TemporaryDirectory(prefix="sweep_") as tmp:
+        close_path = os.path.join(tmp, "close.npy")
+        np.save(close_path, np.ascontiguousarray(close, dtype=np.float64))
+
+        # Перебор запускается из потока (asyncio.to_thread) процесса с циклом событий и открытыми
+        # соединениями: fork копировал бы их в воркеры, forkserver запускает воркеры с чистого листа
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("forkserver"),
+                                 initializer=_init_worker, initargs=(close_path,)) as pool:
+            futures = [pool.submit(_run_one, strategy_name, params, symbol, long_only, interval_ms) for params in combos]
+            results = []
+            for params, future in zip(combos, futures):
+                try:
+                    row = future.result()
+                    if "_stacks" in row:
+                        profiler.merge(row.pop("_stacks"), "sweep")
+                    results.append(row)
+                except Exception as e:
+                    logging.error(f"Ошибка прогона {strategy_name} {params}: {e!r}")
+
+    results.sort(key=lambda r: r[sort_by], reverse=True)
+    logging.info(f"Перебор {strategy_name}: {len(results)} комбинаций на {processes} процессах")
+    return results
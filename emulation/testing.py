@@ -1,11 +1,15 @@
+import asyncio
 import logging
 from datetime import datetime
 
-from db.sqlite_module import DBManager, AsyncSessionLocal
-from services.history import load_all_data_to_dataframe
+from db.sqlite_module import DBManager
+from emulation.sweep import run_sweep
+from services.backtest import run_backtest
+from services.history import load_columns
+from services.profiling import Profiler
 from strategies.initial_threshold import InitialThresholdStrategy
 from strategies.trailing_initial_threshold import TrailingInitialThresholdStrategy
-from tgbot.config import COIN_NAME, POSITION_SIZE
+from tgbot.config import COIN_NAME
 
 import numpy as np
 
@@ -45,97 +49,25 @@ def frange(start, stop, step):
         start += step
 
 async def emulate_prices_for_strategy() -> tuple[float, float, dict, float, float]:
-    cash = 1_000.0
-    commission_rate = 0.001
-    portfolio = {}
-    realized_pnl = 0.0
-
     start = datetime(2025, 7, 1)
     end = datetime(2025, 7, 6)
 
-    df = load_all_data_to_dataframe(f"historydata/{COIN_NAME}", start, end)
-    if df.empty:
+    candles = load_columns(f"historydata/{COIN_NAME}", start, end, columns=["open_time", "close"])
+    if not len(candles["close"]):
         logging.error("Нет данных для эмуляции.")
         return 0.0, 0.0, {}, 0.0, 0.0
     symbol=COIN_NAME
     try:
-        async with AsyncSessionLocal() as session:
-            db = DBManager(session)
-
-            for _, row in df.iterrows():
-                    try:
-                        date = row["datetime"]
-                        close = row["close"]
-                        volume = row["volume"]
-                        current_prices = {symbol: close}
-
-
-
-
-
-                        exchange = "binance"
-                        current_prices = {symbol: close}
-
-                        old_price = await db.get_last_price(exchange, symbol)
-                        await db.save_price(exchange, symbol, close, volume)
-
-                        for strategy in strategies:
-                            alerts = await strategy.check(exchange, symbol, close)
-
-                            for alert in alerts:
-                                print(f'{alert["action"]} {date} O:{row["open"]} H:{row["high"]} L:{row["low"]} C:{row["close"]} V:{row["volume"]}' )
-                                alert.setdefault("pair", symbol)
-                                alert.setdefault("old", old_price)
-                                alert.setdefault("new", close)
-                                alert.setdefault("action", "none")
-                                alert.setdefault("strategy", "unknown")
-
-                                action = alert["action"]
-                                strategy_name = alert["strategy"]
-                                amount = alert.get("amount")
-                                if amount is None:
-                                    amount = POSITION_SIZE / close if POSITION_SIZE else 10 / close
-
-                                # BUY
-                                if action == "buy":
-                                    trade_price = close * (1 + commission_rate)
-                                    cost = trade_price * amount
-                                    if cash >= cost:
-                                        cash -= cost
-                                        if symbol not in portfolio or portfolio[symbol]["amount"] <= 0:
-                                            portfolio[symbol] = {"amount": amount, "avg_price": close}
-                                        else:
-                                            pos = portfolio[symbol]
-                                            total = pos["amount"] + amount
-                                            avg_price = (pos["avg_price"] * pos["amount"] + close * amount) / total
-                                            portfolio[symbol] = {"amount": total, "avg_price": avg_price}
-
-                                # SELL
-                                elif action == "sell":
-                                    trade_price = close * (1 - commission_rate)
-                                    revenue = trade_price * amount
-                                    cash += revenue
-
-                                    if symbol in portfolio and portfolio[symbol]["amount"] > 0:
-                                        pos = portfolio[symbol]
-                                        closed_amount = min(pos["amount"], amount)
-                                        pnl = (close - pos["avg_price"]) * closed_amount
-                                        realized_pnl += pnl
-                                        pos["amount"] -= closed_amount
-
-                                        if pos["amount"] <= 0:
-                                            del portfolio[symbol]
-
-                    except Exception as e:
-                        logging.error(f"Ошибка в свече: {e}")
-
-        # Финальный расчёт equity
-        final_price = close
-        portfolio_value = sum(pos["amount"] * final_price for pos in portfolio.values())
-        unrealized_pnl = sum((final_price - pos["avg_price"]) * pos["amount"] for pos in portfolio.values())
-        equity = cash + portfolio_value
-
-        return cash, equity, portfolio, unrealized_pnl, realized_pnl
+        result = await run_backtest(
+            strategies, symbol,
+            close=candles["close"],
+            timestamps=candles["open_time"].astype("datetime64[ms]"),
+            exchange="binance",
+            long_only=True,
+        )
+        for trade in result.trades:
+            print(f'{trade["side"]} {trade["datetime"]} C:{trade["price"]}')
+        return result.as_tuple()
 
     except Exception as e:
         logging.critical(f"Ошибка в emulate_prices_for_strategy: {e}")
@@ -144,32 +76,63 @@ async def emulate_prices_for_strategy() -> tuple[float, float, dict, float, floa
 
 
 async def optimize_threshold():
-    results = []
-
-    for threshold in np.arange(0.5, 5.5, 0.5):  # от 0.5% до 5.0%
-        print(f"\n🧪 Тестируем стратегию с порогом: {threshold:.1f}%")
-        strategy = TrailingInitialThresholdStrategy(threshold_percent=threshold)
-        global strategies
-        strategies = [strategy]
-
-        cash, equity, portfolio, unrealized, realized = await emulate_prices_for_strategy()
+    start = datetime(2025, 7, 1)
+    end = datetime(2025, 7, 6)
+    profiler = Profiler("optimize_threshold")  # PROFILE_MODE: фазы load, sweep (стеки воркеров), reporting
+    profiler.start()
 
-        results.append({
-            "threshold": threshold,
-            "equity": equity,
-            "cash": cash,
-            "realized": realized,
-            "unrealized": unrealized
-        })
+    try:
+        # История загружается один раз и делится между процессами перебора
+        with profiler.phase("load"):
+            candles = load_columns(f"historydata/{COIN_NAME}", start, end, columns=["open_time", "close"])
+        if not len(candles["close"]):
+            logging.error("Нет данных для эмуляции.")
+            return None
+
+        thresholds = [round(float(t), 2) for t in np.arange(0.5, 5.5, 0.5)]  # от 0.5% до 5.0%
+        print(f"\n🧪 Тестируем стратегию с порогами: {thresholds}")
+        with profiler.phase("sweep"):
+            results = await asyncio.to_thread(
+                run_sweep, "TrailingInitialThresholdStrategy", {"threshold_percent": thresholds},
+                candles["close"], COIN_NAME, long_only=True, profiler=profiler,
+            )
+        if not results:
+            logging.error("Перебор порогов не дал ни одного результата.")
+            return None
+
+        with profiler.phase("reporting"):
+            print("\n📊 Результаты оптимизации (по Equity):")
+            for res in results:
+                print(f"Threshold: {res['threshold_percent']:.1f}% | Equity: {res['equity']:.2f} | Realized: {res['realized']:.2f} | Unrealized: {res['unrealized']:.2f}")
+
+            best = results[0]
+            print(f"\n✅ Лучший результат: {best['threshold_percent']:.1f}% — Equity: {best['equity']:.2f} USDT")
+
+        return best
+    finally:
+        profiler.stop()
+
+
+async def optimize_martingale(thresholds=(0.5, 1.0, 2.0, 3.0), max_steps=(3, 5, 7), initial_amounts=(5, 10, 20)):
+    """Перебор сетки MartingaleStrategy: порог × число шагов × начальный объём."""
+    start = datetime(2025, 7, 1)
+    end = datetime(2025, 7, 6)
 
-    # Сортируем по equity (или можно по realized PnL)
-    results.sort(key=lambda x: x["equity"], reverse=True)
+    candles = load_columns(f"historydata/{COIN_NAME}", start, end, columns=["open_time", "close"])
+    if not len(candles["close"]):
+        logging.error("Нет данных для эмуляции.")
+        return []
 
-    print("\n📊 Результаты оптимизации (по Equity):")
-    for res in results:
-        print(f"Threshold: {res['threshold']:.1f}% | Equity: {res['equity']:.2f} | Realized: {res['realized']:.2f} | Unrealized: {res['unrealized']:.2f}")
+    grid = {
+        "threshold_percent": list(thresholds),
+        "max_steps": list(max_steps),
+        "initial_amount": list(initial_amounts),
+    }
+    results = await asyncio.to_thread(run_sweep, "MartingaleStrategy", grid, candles["close"], COIN_NAME)
 
-    best = results[0]
-    print(f"\n✅ Лучший результат: {best['threshold']:.1f}% — Equity: {best['equity']:.2f} USDT")
+    print("\n📊 Результаты перебора Martingale (по Equity):")
+    for res in results[:10]:
+        print(f"{res['threshold_percent']}% × {res['max_steps']} шагов × {res['initial_amount']} | "
+              f"Equity: {res['equity']:.2f} | Realized: {res['realized']:.2f} | Сделок: {res['trades']}")
 
-    return best
+    return results
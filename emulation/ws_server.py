@@ -0,0 +1,104 @@
+"""
+Локальная замена WebSocket-потоков бирж для офлайн-проверки потокового режима.
+
+Понимает протоколы подписки Binance ({"method": "SUBSCRIBE", ...}) и
+Bybit v5 ({"op": "subscribe", ...}) и отвечает тикерами в формате той же биржи.
+Цены — случайное блуждание от стартовой цены.
+
+Запуск:
+    python -m emulation.ws_server --port 8765 --rate 10
+затем в .env:
+    STREAM_URL_OVERRIDE=ws://127.0.0.1:8765
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+
+import websockets
+
+
+class StandInTickerServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 8765, rate: float = 10.0,
+                 start_price: float = 100.0, volatility: float = 0.001):
+        """
+        :param rate: Сколько обновлений в секунду отправлять по каждой паре
+        :param volatility: Стандартное отклонение относительного шага цены
+        """
+        self.host = host
+        self.port = port
+        self.rate = rate
+        self.start_price = start_price
+        self.volatility = volatility
+        self.prices: dict[str, float] = {}  # {'TONUSDT': 3.1}
+        self.volumes: dict[str, float] = {}
+        self.connections: set = set()
+        self.subscribe_requests = 0  # Сколько сообщений подписки получено (после переподключения — заново)
+
+    def next_tick(self, market_id: str) -> tuple[float, float]:
+        price = self.prices.get(market_id, self.start_price)
+        price *= 1 + random.gauss(0, self.volatility)
+        volume = self.volumes.get(market_id, 0.0) + random.random()
+        self.prices[market_id] = price
+        self.volumes[market_id] = volume
+        return price, volume
+
+    async def handler(self, ws):
+        binance_subs: set[str] = set()
+        bybit_subs: set[str] = set()
+
+        async def publish():
+            while True:
+                await asyncio.sleep(1 / self.rate)
+                for market_id in list(binance_subs):
+                    price, volume = self.next_tick(market_id)
+                    await ws.send(json.dumps({"e": "24hrMiniTicker", "s": market_id,
+                                              "c": f"{price:.8f}", "v": f"{volume:.4f}"}))
+                for market_id in list(bybit_subs):
+                    price, volume = self.next_tick(market_id)
+                    await ws.send(json.dumps({"topic": f"tickers.{market_id}", "type": "snapshot",
+                                              "data": {"symbol": market_id, "lastPrice": f"{price:.8f}",
+                                                       "volume24h": f"{volume:.4f}"}}))
+
+        publisher = asyncio.create_task(publish())
+        self.connections.add(ws)
+        try:
+            async for raw in ws:
+                msg = json.loads(raw)
+                if msg.get("method") == "SUBSCRIBE":
+                    self.subscribe_requests += 1
+                    binance_subs.update(p.split("@")[0].upper() for p in msg["params"])
+                    await ws.send(json.dumps({"result": None, "id": msg.get("id")}))
+                elif msg.get("op") == "subscribe":
+                    self.subscribe_requests += 1
+                    bybit_subs.update(a.split(".", 1)[1] for a in msg["args"])
+                    await ws.send(json.dumps({"success": True, "op": "subscribe"}))
+                elif msg.get("op") == "ping":
+                    await ws.send(json.dumps({"success": True, "op": "pong"}))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            publisher.cancel()
+            self.connections.discard(ws)
+
+    async def drop_connections(self):
+        """Разрывает все соединения — клиент должен переподключиться и подписаться заново."""
+        for ws in list(self.connections):
+            await ws.close(code=1011, reason="stand-in server restart")
+
+    async def serve_forever(self):
+        async with websockets.serve(self.handler, self.host, self.port):
+            logging.info(f"Локальный WebSocket-сервер тикеров: ws://{self.host}:{self.port}")
+            await asyncio.Future()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Локальный WebSocket-сервер тикеров")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rate", type=float, default=10.0, help="обновлений в секунду на пару")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(StandInTickerServer(args.host, args.port, args.rate).serve_forever())
@@ -1,19 +1,166 @@
+import asyncio
+import logging
+import ssl
+import time
 
+import aiohttp
+import certifi
 import ccxt.async_support as ccxt
 
+from exchanges.simulator import SimulatedExchange
+from services.metrics import exchange_request_seconds, exchange_errors
+from tgbot.config import EXCHANGE_CONCURRENCY, REQUEST_TIMEOUT, HTTP_KEEPALIVE_TIMEOUT, SIM_EXCHANGES
+
+
 class ExchangeManager:
     def __init__(self):
         self.exchanges = {
-            "binance": ccxt.binance(),
-            "bybit": ccxt.bybit(),
+            "binance": ccxt.binance({"enableRateLimit": True}),
+            "bybit": ccxt.bybit({"enableRateLimit": True}),
         }
+        # Симулятор вместо настоящей биржи (или как отдельная биржа) — по имени из SIM_EXCHANGES
+        for name in SIM_EXCHANGES:
+            self.exchanges[name] = SimulatedExchange(name)
+        # Ограничение одновременных запросов к каждой бирже
+        self.semaphores = {name: asyncio.Semaphore(EXCHANGE_CONCURRENCY) for name in self.exchanges}
+        self._started = False
+        self._start_lock = asyncio.Lock()
+
+    async def start(self):
+        """
+        Однократно открывает долгоживущие пулы HTTP-соединений и загружает рынки.
+
+        Сессии принадлежат менеджеру, а не ccxt, поэтому живут до close_all()
+        и переиспользуют TLS-соединения между циклами опроса.
+        """
+        if self._started:
+            return
+        async with self._start_lock:
+            if self._started:
+                return
+            ssl_context = ssl.create_default_context(cafile=certifi.where())
+            for ex in self.exchanges.values():
+                if getattr(ex, "simulated", False):
+                    continue
+                connector = aiohttp.TCPConnector(
+                    ssl=ssl_context,
+                    limit_per_host=EXCHANGE_CONCURRENCY * 2,
+                    keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+                    ttl_dns_cache=300,
+                    enable_cleanup_closed=True,
+                )
+                ex.session = aiohttp.ClientSession(connector=connector, trust_env=ex.aiohttp_trust_env)
+                ex.own_session = False
+
+            results = await asyncio.gather(
+                *(ex.load_markets() for ex in self.exchanges.values()),
+                return_exceptions=True,
+            )
+            for name, result in zip(self.exchanges, results):
+                if isinstance(result, Exception):
+                    # Рынки догрузятся лениво при первом запросе
+                    logging.warning(f"[{name}] Не удалось загрузить рынки: {result!r}")
+            self._started = True
+
+    async def get_exchange(self, exchange_name: str):
+        """ccxt-инстанс биржи с открытым пулом соединений."""
+        await self.start()
+        return self.exchanges[exchange_name]
+
+    async def timed(self, exchange_name: str, method: str, request):
+        """Ожидает запрос к бирже, замеряя задержку (гистограмма по бирже и методу) и считая ошибки."""
+        start = time.perf_counter()
+        try:
+            return await request
+        except Exception:
+            exchange_errors.labels(exchange_name, method).inc()
+            raise
+        finally:
+            exchange_request_seconds.labels(exchange_name, method).observe(time.perf_counter() - start)
 
     async def fetch_price(self, exchange_name: str, symbol: str) -> float:
-        ex = self.exchanges[exchange_name]
-        ticker = await ex.fetch_ticker(symbol)
+        ex = await self.get_exchange(exchange_name)
+        ticker = await self.timed(exchange_name, "fetch_ticker", ex.fetch_ticker(symbol))
         return ticker['last']
 
+    async def fetch_tickers(self, exchange_name: str, symbols: list[str]) -> dict[str, dict]:
+        """
+        Снимок цен по всем парам биржи за один запрос.
+
+        Если биржа не поддерживает fetch_tickers, пары запрашиваются по одной
+        (параллельно, с ограничением EXCHANGE_CONCURRENCY).
+
+        :return: {symbol: {"last": float, "volume": float}} — только пары, по которым есть цена
+        """
+        ex = await self.get_exchange(exchange_name)
+
+        if ex.has.get("fetchTickers"):
+            async with self.semaphores[exchange_name]:
+                tickers = await self.timed(exchange_name, "fetch_tickers",
+                                           asyncio.wait_for(ex.fetch_tickers(symbols), REQUEST_TIMEOUT))
+        else:
+            async def fetch_one(symbol):
+                async with self.semaphores[exchange_name]:
+                    return await self.timed(exchange_name, "fetch_ticker",
+                                            asyncio.wait_for(ex.fetch_ticker(symbol), REQUEST_TIMEOUT))
+
+            results = await asyncio.gather(*(fetch_one(s) for s in symbols), return_exceptions=True)
+            tickers = {s: r for s, r in zip(symbols, results) if not isinstance(r, Exception)}
+
+        snapshot = {}
+        for symbol in symbols:
+            ticker = tickers.get(symbol)
+            if not ticker or ticker.get("last") is None:
+                continue
+            snapshot[symbol] = {"last": ticker["last"], "volume": ticker.get("baseVolume") or 0}
+        return snapshot
+
+    async def fetch_prices(self, pairs: list[tuple[str, str]]) -> dict[tuple[str, str], float]:
+        """Текущие цены для набора (биржа, пара): по одному bulk-запросу на биржу, биржи параллельно."""
+        by_exchange = {}
+        for exchange_name, symbol in pairs:
+            by_exchange.setdefault(exchange_name, [])
+            if symbol not in by_exchange[exchange_name]:
+                by_exchange[exchange_name].append(symbol)
+
+        names = list(by_exchange)
+        results = await asyncio.gather(
+            *(self.fetch_tickers(name, by_exchange[name]) for name in names),
+            return_exceptions=True,
+        )
+
+        prices = {}
+        for name, snapshot in zip(names, results):
+            if isinstance(snapshot, Exception):
+                continue
+            for symbol, ticker in snapshot.items():
+                prices[(name, symbol)] = ticker["last"]
+        return prices
+
     async def close_all(self):
-        # Закрыть соединения с биржами
+        # Закрыть соединения с биржами (только при остановке процесса)
         for ex in self.exchanges.values():
-            await ex.close()
\ No newline at end of file
+            session = ex.session
+            await ex.close()
+            if session is not None and not ex.own_session:
+                await session.close()
+        self._started = False
+
+
+_exchange_manager: ExchangeManager | None = None
+
+
+def get_exchange_manager() -> ExchangeManager:
+    """Единый на процесс ExchangeManager: общий для мониторинга, ордеров и бота."""
+    global _exchange_manager
+    if _exchange_manager is None:
+        _exchange_manager = ExchangeManager()
+    return _exchange_manager
+
+
+async def close_exchange_manager():
+    """Закрывает общий ExchangeManager. Вызывается один раз при остановке."""
+    global _exchange_manager
+    if _exchange_manager is not None:
+        await _exchange_manager.close_all()
+        _exchange_manager = None
@@ -0,0 +1,266 @@
+import asyncio
+import itertools
+import logging
+import os
+import random
+import time
+import zlib
+
+import ccxt.async_support as ccxt
+import numpy as np
+
+from services.history import load_columns
+from tgbot.config import SIM_DATA_DIR, SIM_SPEED, SIM_SPREAD, SIM_LATENCY_MS, SIM_LATENCY_JITTER, SIM_ERROR_RATE, \
+    SIM_RATE_LIMIT, SIM_SEED
+
+SYNTHETIC_BARS = 100_000  # Длина синтетического ряда, если архивов нет
+BAR_SECONDS = 60  # Ряды цен — минутные свечи
+
+
+class SimulatedExchange:
+    """
+    Биржа в памяти процесса с подмножеством API ccxt, которое использует проект:
+    load_markets, fetch_ticker, fetch_tickers, create_order (и create_market/limit_buy/sell_order),
+    fetch_order, cancel_order, close.
+
+    Цены — повтор минутных свечей из архивов historydata (или синтетическое случайное блуждание):
+    один общий ряд, у каждой пары свой сдвиг по времени и масштаб цены, поэтому тысячи пар
+    не занимают память. Время течёт в speed раз быстрее реального.
+
+    Ордера исполняются против простого стакана вокруг текущей цены (bid/ask через spread):
+    market — сразу по лучшей цене, limit — сразу, если пересекает спред, иначе ждёт своей цены.
+    Каждый запрос получает задержку latency_ms ± jitter, с вероятностью error_rate — сетевую ошибку,
+    а сверх rate_limit запросов в секунду — RateLimitExceeded, как у настоящей биржи.
+    """
+    simulated = True
+
+    def __init__(self, name: str = "sim", data_dir: str = SIM_DATA_DIR, speed: float = SIM_SPEED,
+                 spread: float = SIM_SPREAD, latency_ms: float = SIM_LATENCY_MS, jitter: float = SIM_LATENCY_JITTER,
+                 error_rate: float = SIM_ERROR_RATE, rate_limit: float = SIM_RATE_LIMIT, seed: int = SIM_SEED):
+        self.id = name
+        self.data_dir = data_dir
+        self.speed = speed
+        self.spread = spread
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.random = random.Random(seed)
+        self.seed = seed
+        self.has = {"fetchTickers": True, "fetchOrder": True, "cancelOrder": True}
+        self.markets: dict[str, dict] = {}
+        # Совместимость с ExchangeManager (сессиями HTTP симулятор не пользуется)
+        self.session = None
+        self.own_session = True
+        self.aiohttp_trust_env = False
+
+        self.close_prices: np.ndarray | None = None
+        self.volumes: np.ndarray | None = None
+        self.started = time.monotonic()
+        self.orders: dict[str, dict] = {}
+        self.client_ids: dict[str, str] = {}  # {clientOrderId: id}
+        self.open_orders: dict[str, list[dict]] = {}  # {symbol: ожидающие limit-ордера}
+        self._order_ids = itertools.count(1)
+        self._window = 0  # Секунда, в которой считаются запросы для rate limit
+        self._window_requests = 0
+        self.requests = 0
+        self.errors = 0
+
+    # ===============================
+    # Цены
+    # ===============================
+
+    def _load_series(self):
+        if self.close_prices is not None:
+            return
+        data = {}
+        if self.data_dir and os.path.isdir(self.data_dir):
+            data = load_columns(self.data_dir, columns=["open_time", "close", "volume"])
+        if len(data.get("close", ())):
+            self.close_prices = data["close"].astype(np.float64)
+            self.volumes = data["volume"].astype(np.float64)
+            logging.info(f"[{self.id}] Симулятор: {len(self.close_prices)} свечей из {self.data_dir}")
+        else:
+            rng = np.random.default_rng(self.seed)
+            self.close_prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, SYNTHETIC_BARS)))
+            self.volumes = rng.gamma(2.0, 50.0, SYNTHETIC_BARS)
+            logging.info(f"[{self.id}] Симулятор: архивов нет, синтетический ряд из {SYNTHETIC_BARS} свечей")
+
+    def _market(self, symbol: str) -> dict:
+        market = self.markets.get(symbol)
+        if market is None:
+            # Любая запрошенная пара торгуется: сдвиг и масштаб детерминированы по названию
+            h = zlib.crc32(symbol.encode())
+            base, _, quote = symbol.partition("/")
+            market = self.markets[symbol] = {
+                "id": symbol.replace("/", ""), "symbol": symbol, "base": base, "quote": quote or "USDT",
+                "active": True, "offset": h % len(self.close_prices), "scale": 0.5 + (h >> 8) % 1000 / 100,
+            }
+        return market
+
+    def _cursor(self) -> int:
+        return int((time.monotonic() - self.started) * self.speed / BAR_SECONDS)
+
+    def price(self, symbol: str) -> float:
+        """Текущая (последняя) цена пары."""
+        self._load_series()
+        market = self._market(symbol)
+        i = (self._cursor() + market["offset"]) % len(self.close_prices)
+        return float(self.close_prices[i] * market["scale"])
+
+    def _ticker(self, symbol: str) -> dict:
+        market = self._market(symbol)
+        i = (self._cursor() + market["offset"]) % len(self.close_prices)
+        last = float(self.close_prices[i] * market["scale"])
+        now = int(time.time() * 1000)
+        return {
+            "symbol": symbol, "timestamp": now, "last": last, "close": last,
+            "bid": last * (1 - self.spread / 2), "ask": last * (1 + self.spread / 2),
+            "baseVolume": float(self.volumes[i]), "info": {},
+        }
+
+    # ===============================
+    # Задержки, ошибки, rate limit
+    # ===============================
+
+    async def _request(self):
+        """Задержка, rate limit и случайная ошибка — как у запроса к настоящей бирже."""
+        self.requests += 1
+        if self.latency_ms:
+            delay = self.latency_ms * (1 + self.random.uniform(-self.jitter, self.jitter))
+            await asyncio.sleep(max(delay, 0) / 1000)
+        if self.rate_limit:
+            second = int(time.monotonic())
+            if second != self._window:
+                self._window, self._window_requests = second, 0
+            self._window_requests += 1
+            if self._window_requests > self.rate_limit:
+                self.errors += 1
+                raise ccxt.RateLimitExceeded(f"{self.id} симулятор: больше {self.rate_limit:g} запросов в секунду")
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.errors += 1
+            raise self.random.choice([ccxt.NetworkError, ccxt.RequestTimeout, ccxt.ExchangeNotAvailable])(
+                f"{self.id} симулятор: случайная ошибка")
+
+    # ===============================
+    # Рыночные данные
+    # ===============================
+
+    async def load_markets(self, reload: bool = False, params: dict = None) -> dict:
+        await asyncio.to_thread(self._load_series)
+        return self.markets
+
+    async def fetch_ticker(self, symbol: str, params: dict = None) -> dict:
+        self._load_series()
+        await self._request()
+        self._match(symbol)
+        return self._ticker(symbol)
+
+    async def fetch_tickers(self, symbols: list[str] = None, params: dict = None) -> dict[str, dict]:
+        self._load_series()
+        await self._request()
+        symbols = symbols if symbols is not None else list(self.markets)
+        tickers = {}
+        for symbol in symbols:
+            self._match(symbol)
+            tickers[symbol] = self._ticker(symbol)
+        return tickers
+
+    # ===============================
+    # Ордера
+    # ===============================
+
+    async def create_order(self, symbol: str, type: str, side: str, amount: float, price: float = None,
+                           params: dict = None) -> dict:
+        self._load_series()
+        client_id = (params or {}).get("clientOrderId")
+        if client_id is not None and client_id in self.client_ids:
+            await self._request()
+            raise ccxt.DuplicateOrderId(f"{self.id} симулятор: ордер {client_id} уже существует")
+        if type not in ("market", "limit") or side not in ("buy", "sell"):
+            raise ccxt.InvalidOrder(f"{self.id} симулятор: неподдерживаемый ордер {type} {side}")
+        if type == "limit" and price is None:
+            raise ccxt.InvalidOrder(f"{self.id} симулятор: limit-ордер без цены")
+        if amount <= 0:
+            raise ccxt.InvalidOrder(f"{self.id} симулятор: количество должно быть больше нуля")
+
+        # Задержка и возможная ошибка — до создания ордера (ордера нет) или после (ордер есть, ответ потерян)
+        before = self.random.random() < 0.5
+        if before:
+            await self._request()
+        order_id = str(next(self._order_ids))
+        order = {
+            "id": order_id, "clientOrderId": client_id, "timestamp": int(time.time() * 1000),
+            "symbol": symbol, "type": type, "side": side, "price": price, "average": None,
+            "amount": amount, "filled": 0.0, "remaining": amount, "cost": 0.0, "status": "open",
+            "fee": None, "info": {},
+        }
+        self.orders[order_id] = order
+        if client_id is not None:
+            self.client_ids[client_id] = order_id
+
+        ticker = self._ticker(symbol)
+        best = ticker["ask"] if side == "buy" else ticker["bid"]
+        if type == "market" or (side == "buy" and price >= best) or (side == "sell" and price <= best):
+            self._fill(order, best)
+        else:
+            self.open_orders.setdefault(symbol, []).append(order)
+        if not before:
+            await self._request()  # Повтор после такой ошибки получит DuplicateOrderId
+        return dict(order)
+
+    async def create_market_buy_order(self, symbol: str, amount: float, params: dict = None) -> dict:
+        return await self.create_order(symbol, "market", "buy", amount, None, params)
+
+    async def create_market_sell_order(self, symbol: str, amount: float, params: dict = None) -> dict:
+        return await self.create_order(symbol, "market", "sell", amount, None, params)
+
+    async def create_limit_buy_order(self, symbol: str, amount: float, price: float, params: dict = None) -> dict:
+        return await self.create_order(symbol, "limit", "buy", amount, price, params)
+
+    async def create_limit_sell_order(self, symbol: str, amount: float, price: float, params: dict = None) -> dict:
+        return await self.create_order(symbol, "limit", "sell", amount, price, params)
+
+    def _find(self, order_id: str = None, params: dict = None) -> dict:
+        client_id = (params or {}).get("clientOrderId")
+        if order_id is None and client_id is not None:
+            order_id = self.client_ids.get(client_id)
+        order = self.orders.get(order_id)
+        if order is None:
+            raise ccxt.OrderNotFound(f"{self.id} симулятор: ордер {order_id or client_id} не найден")
+        return order
+
+    async def fetch_order(self, id: str = None, symbol: str = None, params: dict = None) -> dict:
+        await self._request()
+        order = self._find(id, params)
+        self._match(order["symbol"])
+        return dict(order)
+
+    async def cancel_order(self, id: str, symbol: str = None, params: dict = None) -> dict:
+        await self._request()
+        order = self._find(id, params)
+        if order["status"] == "open":
+            order["status"] = "canceled"
+            self.open_orders[order["symbol"]].remove(order)
+        return dict(order)
+
+    def _fill(self, order: dict, price: float):
+        order.update(status="closed", average=price, filled=order["amount"], remaining=0.0,
+                     cost=price * order["amount"])
+        if order["price"] is None:
+            order["price"] = price
+
+    def _match(self, symbol: str):
+        """Исполняет ожидающие limit-ордера пары, до цены которых дошёл рынок."""
+        waiting = self.open_orders.get(symbol)
+        if not waiting:
+            return
+        ticker = self._ticker(symbol)
+        for order in list(waiting):
+            if order["side"] == "buy" and ticker["ask"] <= order["price"] \
+                    or order["side"] == "sell" and ticker["bid"] >= order["price"]:
+                self._fill(order, order["price"])
+                waiting.remove(order)
+
+    async def close(self):
+        pass
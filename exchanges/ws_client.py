@@ -0,0 +1,145 @@
+import asyncio
+import json
+import logging
+from abc import ABC, abstractmethod
+
+import websockets
+
+from tgbot.config import STREAM_URL_OVERRIDE, STREAM_RECONNECT_MAX_DELAY
+
+
+class TickerStream(ABC):
+    """
+    Одно мультиплексированное WebSocket-соединение с биржей на все отслеживаемые пары.
+
+    При обрыве соединение переоткрывается с экспоненциальной задержкой,
+    и подписки на все пары отправляются заново.
+    """
+    url = ""
+    ping_interval = None  # Интервал пинга на уровне протокола биржи, сек (None — не нужен)
+
+    def __init__(self, exchange: str, symbols: list[str], on_tick, url: str = None):
+        """
+        :param exchange: Название биржи (например, 'binance')
+        :param symbols: Пары в формате ccxt ('BTC/USDT')
+        :param on_tick: Корутина on_tick(exchange, symbol, price, volume), вызывается на каждое обновление
+        :param url: Адрес WebSocket (по умолчанию — публичный адрес биржи)
+        """
+        self.exchange = exchange
+        self.symbols = symbols
+        self.on_tick = on_tick
+        self.url = url or STREAM_URL_OVERRIDE or self.url
+        # 'TONUSDT' -> 'TON/USDT'
+        self.market_ids = {s.replace("/", "").upper(): s for s in symbols}
+        self.connected = asyncio.Event()
+
+    @abstractmethod
+    def subscribe_messages(self) -> list[dict]:
+        """Сообщения подписки на все пары, отправляются после каждого подключения."""
+
+    def ping_message(self) -> dict | None:
+        return None
+
+    @abstractmethod
+    def parse(self, message: dict) -> list[tuple[str, float, float]]:
+        """Разбор сообщения биржи в список (symbol, price, volume)."""
+
+    async def run(self):
+        delay = 1.0
+        while True:
+            try:
+                async with websockets.connect(self.url, max_queue=None) as ws:
+                    for msg in self.subscribe_messages():
+                        await ws.send(json.dumps(msg))
+                    logging.info(f"[{self.exchange}] WebSocket подключён: {self.url}, пар: {len(self.symbols)}")
+                    self.connected.set()
+                    delay = 1.0
+
+                    pinger = asyncio.create_task(self._ping(ws)) if self.ping_interval else None
+                    try:
+                        async for raw in ws:
+                            try:
+                                updates = self.parse(json.loads(raw))
+                            except (ValueError, KeyError, TypeError) as e:
+                                logging.warning(f"[{self.exchange}] Не удалось разобрать сообщение: {e!r}")
+                                continue
+                            for symbol, price, volume in updates:
+                                await self.on_tick(self.exchange, symbol, price, volume)
+                    finally:
+                        if pinger:
+                            pinger.cancel()
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"[{self.exchange}] WebSocket ошибка: {e!r}")
+
+            self.connected.clear()
+            logging.info(f"[{self.exchange}] Переподключение через {delay:.0f} сек...")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, STREAM_RECONNECT_MAX_DELAY)
+
+    async def _ping(self, ws):
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            await ws.send(json.dumps(self.ping_message()))
+
+
+class BinanceTickerStream(TickerStream):
+    url = "wss://stream.binance.com:9443/ws"
+
+    def subscribe_messages(self) -> list[dict]:
+        params = [f"{market_id.lower()}@miniTicker" for market_id in self.market_ids]
+        # Binance принимает до 1024 потоков на соединение, подписываемся пачками
+        return [
+            {"method": "SUBSCRIBE", "params": params[i:i + 200], "id": i + 1}
+            for i in range(0, len(params), 200)
+        ]
+
+    def parse(self, message: dict) -> list[tuple[str, float, float]]:
+        if message.get("e") != "24hrMiniTicker":
+            return []
+        symbol = self.market_ids.get(message["s"])
+        if symbol is None:
+            return []
+        return [(symbol, float(message["c"]), float(message["v"]))]
+
+
+class BybitTickerStream(TickerStream):
+    url = "wss://stream.bybit.com/v5/public/spot"
+    ping_interval = 20
+
+    def subscribe_messages(self) -> list[dict]:
+        args = [f"tickers.{market_id}" for market_id in self.market_ids]
+        # Bybit spot: не более 10 топиков в одном запросе подписки
+        return [{"op": "subscribe", "args": args[i:i + 10]} for i in range(0, len(args), 10)]
+
+    def ping_message(self) -> dict:
+        return {"op": "ping"}
+
+    def parse(self, message: dict) -> list[tuple[str, float, float]]:
+        if not message.get("topic", "").startswith("tickers."):
+            return []
+        data = message["data"]
+        symbol = self.market_ids.get(data["symbol"])
+        if symbol is None:
+            return []
+        return [(symbol, float(data["lastPrice"]), float(data["volume24h"]))]
+
+
+STREAMS = {
+    "binance": BinanceTickerStream,
+    "bybit": BybitTickerStream,
+}
+
+
+def create_streams(tracking: dict[str, list[str]], on_tick) -> list[TickerStream]:
+    """Создаёт по одному потоку на каждую биржу из TRACKING."""
+    streams = []
+    for exchange, symbols in tracking.items():
+        stream_cls = STREAMS.get(exchange)
+        if stream_cls is None:
+            logging.warning(f"Для биржи {exchange} нет WebSocket-адаптера, пропускаем")
+            continue
+        streams.append(stream_cls(exchange, symbols, on_tick))
+    return streams
@@ -4,17 +4,23 @@ from datetime import datetime
 
 import betterlogging as bl
 
-from db.sqlite_module import init_db
+from db.sqlite_module import init_db, db_writer
+from exchanges.ccxt_client import close_exchange_manager
 from emulation.testing import optimize_threshold
 from services.history import load_all_data_to_dataframe
-from tgbot.config import COIN_NAME
+from services.price_cache import price_cache
+from services.price_history import tick_recorder
+from services.checkpoint import strategy_checkpoint
+from services.order_pipeline import order_pipeline
+from services.metrics import metrics_server
+from tgbot.config import COIN_NAME, SQLITE_GROUP_COMMIT
 from tgbot.handlers import routers_list
-from services.checker import check_prices, emulate_prices, emulate_trade
+from services.checker import check_prices, emulate_prices, emulate_trade, emulate_portfolio, stream_prices
 
 from aiogram import Dispatcher
 
 
-from tgbot.telegram_bot import bot, dp
+from tgbot.telegram_bot import bot, dp, notifier
 
 
 def setup_logging():
@@ -50,14 +56,29 @@ async def main():
 
     await bot.delete_webhook(drop_pending_updates=True)
     await init_db()
+    await metrics_server.start()  # /metrics для Prometheus, если задан METRICS_PORT
+    if SQLITE_GROUP_COMMIT:
+        db_writer.start()  # Записи в БД пачками через одну задачу
     await emulate_trade()
+    # await emulate_portfolio()  # все пары TRACKING с общим кэшем
     # await optimize_threshold()
     # asyncio.create_task(check_prices())
+    # asyncio.create_task(stream_prices())  # потоковый режим вместо check_prices
     # asyncio.create_task(emulate_prices())
 
     dp.include_routers(*routers_list)
     # register_global_middlewares(dp)
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await price_cache.close()  # Сбрасываем несохранённые цены (PRICE_FLUSH_ON_EXIT)
+        await tick_recorder.close()
+        await strategy_checkpoint.close()  # Финальный чекпоинт состояния стратегий
+        await order_pipeline.close()  # Дописываем уже принятые ордера
+        await notifier.close()  # Досылаем очередь уведомлений
+        await db_writer.close()  # После всех, кто пишет в БД при остановке
+        await metrics_server.close()
+        await close_exchange_manager()  # Соединения с биржами закрываются только при остановке
 
 if __name__ == "__main__":
     asyncio.run(main())
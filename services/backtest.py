@@ -0,0 +1,240 @@
+import heapq
+import itertools
+import logging
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from services.portfolio import PortfolioState
+from tgbot.config import POSITION_SIZE
+
+CHUNK_BARS = 65_536  # Сколько свечей за раз переводится в список Python
+
+
+class BacktestResult:
+    """Итог прогона: финальное состояние, список сделок и кривые по каждой свече."""
+
+    def __init__(self, state: PortfolioState, final_price: float, symbol: str, trades: list[dict],
+                 equity: np.ndarray, realized: np.ndarray, unrealized: np.ndarray):
+        self.cash, self.equity, self.portfolio, self.unrealized_pnl, self.realized_pnl = \
+            state.valuation({symbol: final_price})
+        self.trades = trades
+        self.equity_curve = equity
+        self.realized_curve = realized
+        self.unrealized_curve = unrealized
+
+    def as_tuple(self) -> tuple[float, float, dict, float, float]:
+        return self.cash, self.equity, self.portfolio, self.unrealized_pnl, self.realized_pnl
+
+
+async def run_backtest(strategies: list, symbol: str, close: np.ndarray, timestamps: np.ndarray = None,
+                       exchange: str = "binance", initial_cash: float = 1_000.0, commission_rate: float = 0.001,
+                       long_only: bool = False, verbose: bool = False, profiler=None,
+                       curves: bool = True) -> BacktestResult:
+    """
+    Прогон стратегий по массиву цен закрытия без БД и без pandas в цикле.
+
+    :param close: float64-массив цен закрытия свечей
+    :param timestamps: Массив времени свечей (только для журнала сделок)
+    :param long_only: False — учёт как в emulate_trade (продажа без позиции открывает шорт),
+                      True — как в emulate_prices_for_strategy (продажа только сокращает лонг)
+    :param verbose: Печатать каждую сделку
+    :param profiler: Profiler из services.profiling — фазы «strategy», «fills» и «reporting» по свечам
+    :param curves: Считать кривые equity/PnL по каждой свече (массивы длины close); перебору они не нужны
+    """
+    close = np.ascontiguousarray(close, dtype=np.float64)  # memmap/float64 — без копии
+
+    state = PortfolioState(initial_cash, commission_rate)
+    trades = []
+    # Состояние портфеля меняется только в момент сделок: запоминаем его по индексам свечей,
+    # а кривые equity/PnL потом считаем векторно
+    event_idx = [-1]
+    event_cash = [state.cash]
+    event_amount = [0.0]
+    event_avg = [0.0]
+    event_realized = [0.0]
+
+    # Python float быстрее, чем индексирование numpy-скаляров в цикле, но список — копия:
+    # переводим цены кусками, чтобы в памяти (и в каждом воркере перебора) был только один кусок
+    for chunk_start in range(0, len(close), CHUNK_BARS):
+        closes = close[chunk_start:chunk_start + CHUNK_BARS].tolist()
+        times = timestamps[chunk_start:chunk_start + CHUNK_BARS].tolist() if timestamps is not None \
+            else [None] * len(closes)
+        for offset, price in enumerate(closes):
+            i = chunk_start + offset
+            traded = False
+            for strategy in strategies:
+                if profiler is not None:
+                    profiler.set_phase("strategy")
+                alerts = await strategy.check(exchange, symbol, price)
+
+                for alert in alerts:
+                    if profiler is not None:
+                        profiler.set_phase("fills")
+                    executed = _execute_alert(state, alert, symbol, price, long_only)
+                    if executed is None:
+                        continue
+                    action, amount = executed
+
+                    traded = True
+                    trades.append({
+                        "index": i,
+                        "datetime": times[offset],
+                        "strategy": alert.get("strategy", "unknown"),
+                        "side": action,
+                        "amount": amount,
+                        "price": price,
+                    })
+                    if verbose:
+                        if profiler is not None:
+                            profiler.set_phase("reporting")
+                        print(f"{times[offset]} {action.upper()} {amount} {symbol} at {price}")
+                        if profiler is not None:
+                            profiler.set_phase("fills")
+
+            if traded:
+                pos = state.portfolio.get(symbol)
+                event_idx.append(i)
+                event_cash.append(state.cash)
+                event_amount.append(pos["amount"] if pos else 0.0)
+                event_avg.append(pos["avg_price"] if pos else 0.0)
+                event_realized.append(state.realized_pnl)
+
+    if profiler is not None:
+        profiler.set_phase("fills")  # Кривые equity/PnL — часть учёта сделок
+    if curves:
+        k = np.searchsorted(np.array(event_idx), np.arange(len(close)), side="right") - 1
+        amount = np.array(event_amount)[k]
+        equity = np.array(event_cash)[k] + amount * close
+        unrealized = (close - np.array(event_avg)[k]) * amount
+        realized = np.array(event_realized)[k]
+    else:
+        equity = realized = unrealized = np.empty(0)
+
+    final_price = float(close[-1]) if len(close) else 0.0
+    result = BacktestResult(state, final_price, symbol, trades, equity, realized, unrealized)
+    logging.info(f"Бэктест {symbol}: {len(close)} свечей, {len(trades)} сделок, equity {result.equity:.2f}")
+    return result
+
+
+def _execute_alert(state: PortfolioState, alert: dict, symbol: str, price: float,
+                   long_only: bool) -> tuple[str, float] | None:
+    """Исполняет сигнал стратегии по цене свечи. :return: (side, amount) или None, если сделки нет."""
+    action = alert.get("action", "none")
+    if action not in ("buy", "sell"):
+        return None
+    amount = alert.get("amount")
+    if amount is None:
+        amount = POSITION_SIZE / price if POSITION_SIZE else 10 / price
+
+    if action == "buy":
+        if state.cash < price * (1 + state.commission_rate) * amount:
+            return None
+        state.apply_fill("buy", symbol, price, amount)
+    elif long_only:
+        _long_only_sell(state, symbol, price, amount)
+    else:
+        state.apply_fill("sell", symbol, price, amount)
+    return action, amount
+
+
+def _long_only_sell(state: PortfolioState, symbol: str, price: float, amount: float):
+    """Продажа в режиме long_only: выручка зачисляется, PnL фиксируется только по имеющемуся лонгу."""
+    state.cash += price * (1 - state.commission_rate) * amount
+    pos = state.portfolio.get(symbol)
+    if pos and pos["amount"] > 0:
+        closed_amount = min(pos["amount"], amount)
+        state.realized_pnl += (price - pos["avg_price"]) * closed_amount
+        pos["amount"] -= closed_amount
+        if pos["amount"] <= 0:
+            del state.portfolio[symbol]
+
+
+class PortfolioBacktestResult:
+    """Итог прогона по нескольким парам с общим кэшем: финальное состояние, сделки и кривые с шагом по времени."""
+
+    def __init__(self, state: PortfolioState, last_prices: dict[str, float], trades: list[dict], bars: int,
+                 curve: list[tuple[int, float, float, float]]):
+        self.cash, self.equity, self.portfolio, self.unrealized_pnl, self.realized_pnl = state.valuation(last_prices)
+        self.trades = trades
+        self.bars = bars
+        curve = np.array(curve, dtype=np.float64).reshape(-1, 4)
+        self.curve_timestamps = curve[:, 0].astype(np.int64)
+        self.equity_curve = curve[:, 1]
+        self.realized_curve = curve[:, 2]
+        self.unrealized_curve = curve[:, 3]
+
+    def as_tuple(self) -> tuple[float, float, dict, float, float]:
+        return self.cash, self.equity, self.portfolio, self.unrealized_pnl, self.realized_pnl
+
+
+def _bars(pair_no: int, chunks: Iterable[dict[str, np.ndarray]]) -> Iterator[tuple[int, int, float]]:
+    """Свечи пары из чанков {open_time, close} как (время, номер пары, цена закрытия)."""
+    for chunk in chunks:
+        yield from zip(chunk["open_time"].tolist(), itertools.repeat(pair_no), chunk["close"].tolist())
+
+
+async def run_portfolio_backtest(strategies: list, sources: dict[tuple[str, str], Iterable[dict[str, np.ndarray]]],
+                                 initial_cash: float = 1_000.0, commission_rate: float = 0.001,
+                                 long_only: bool = False, curve_step_ms: int = 3_600_000,
+                                 verbose: bool = False) -> PortfolioBacktestResult:
+    """
+    Прогон стратегий сразу по нескольким парам с одним кэшем на всех.
+
+    Свечи всех пар сливаются по времени (k-way слияние на куче), так что сделки по разным парам
+    конкурируют за общий кэш в том же порядке, что и вживую. Данные читаются потоково по чанкам,
+    кривые equity/PnL сохраняются с шагом curve_step_ms: память не зависит от длины периода.
+    Позиции учитываются по символу, как в учёте портфеля.
+
+    :param sources: {(exchange, symbol): итерируемые чанки {"open_time": мс, "close": цена}},
+                    например iter_chunks(..., columns=["open_time", "close"])
+    """
+    pairs = list(sources)
+    merged = heapq.merge(*(_bars(pair_no, sources[pair]) for pair_no, pair in enumerate(pairs)))
+
+    state = PortfolioState(initial_cash, commission_rate)
+    last_prices: dict[str, float] = {}
+    trades = []
+    curve = []
+    next_sample = None
+    bars = 0
+
+    for ts, pair_no, price in merged:
+        exchange, symbol = pairs[pair_no]
+        last_prices[symbol] = price
+        bars += 1
+
+        # Точка кривой — по ценам на начало нового шага (до сделок этой свечи)
+        if next_sample is None or ts >= next_sample:
+            _, equity, _, unrealized, realized = state.valuation(last_prices)
+            curve.append((ts, equity, realized, unrealized))
+            next_sample = ts - ts % curve_step_ms + curve_step_ms
+
+        for strategy in strategies:
+            alerts = await strategy.check(exchange, symbol, price)
+
+            for alert in alerts:
+                executed = _execute_alert(state, alert, symbol, price, long_only)
+                if executed is None:
+                    continue
+                action, amount = executed
+                trades.append({
+                    "timestamp": ts,
+                    "exchange": exchange,
+                    "symbol": symbol,
+                    "strategy": alert.get("strategy", "unknown"),
+                    "side": action,
+                    "amount": amount,
+                    "price": price,
+                })
+                if verbose:
+                    print(f"{np.datetime64(ts, 'ms')} {exchange} {action.upper()} {amount} {symbol} at {price}")
+
+    if bars:
+        _, equity, _, unrealized, realized = state.valuation(last_prices)
+        curve.append((ts, equity, realized, unrealized))
+
+    result = PortfolioBacktestResult(state, last_prices, trades, bars, curve)
+    logging.info(f"Бэктест портфеля: {len(pairs)} пар, {bars} свечей, {len(trades)} сделок, "
+                 f"equity {result.equity:.2f}")
+    return result
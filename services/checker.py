@@ -1,109 +1,293 @@
 import asyncio
 import csv
 import logging
+import os
+import time
 import matplotlib.pyplot as plt
+import numpy as np
 from datetime import datetime
 
 from db.sqlite_module import DBManager, AsyncSessionLocal
-from services.history import load_all_data_to_dataframe
-from services.order_manager import OrderManager
-from services.portfolio import calculate_balance_from_orders
+from services.history import load_columns, iter_chunks
+from services.order_pipeline import order_pipeline, order_intent
+from services.price_cache import PriceCache, price_cache
+from services.price_history import tick_recorder, load_recent_prices
+from services.checkpoint import strategy_checkpoint
+from services.metrics import poll_cycle_seconds, poll_lag_seconds, poll_skipped_ticks, strategy_check_seconds, alerts
+from services.poll_scheduler import PollScheduler
+from services.profiling import Profiler
+from services.backtest import run_backtest, run_portfolio_backtest
+from services.portfolio import portfolio_ledger
+from strategies.base import BatchStrategy, symbol_index, state_memory_report
 from strategies.trailing_initial_threshold import TrailingInitialThresholdStrategy
-from tgbot.config import TRACKING, ADMIN_ID, POLL_INTERVAL, POSITION_SIZE, TELEGRAM_CHAT_ID, HISTORICAL_DATA_PATH, \
-    COIN_NAME
-from tgbot.keyboards.inline import very_simple_keyboard
-from exchanges.ccxt_client import ExchangeManager
-from strategies.initial_threshold import InitialThresholdStrategy
-from strategies.volume_spikes import VolumeSpikeStrategy
-from tgbot.telegram_bot import send_price_alert, bot
+from tgbot.config import TRACKING, POLL_INTERVAL, POSITION_SIZE, HISTORICAL_DATA_PATH, \
+    COIN_NAME, STATE_MAX_PAIRS, STATE_IDLE_TTL
+from exchanges.ccxt_client import get_exchange_manager
+from exchanges.ws_client import create_streams
+from tgbot.telegram_bot import send_price_alert
 
 
 
 
-ex = ExchangeManager()  # Обёртка над CCXT
+ex = get_exchange_manager()  # Общая на процесс обёртка над CCXT
 strategies = [TrailingInitialThresholdStrategy(threshold_percent=0.5)]
+# Профиль цикла опроса (PROFILE_MODE): фазы fetch, persistence, strategy, alerts и idle — ожидание
+# следующего тика, куда попадает работа остальных задач (бот, запись в БД, отправка ордеров).
+# Опросы бирж идут параллельно и переключают общую фазу, так что разбивка по фазам приблизительная
+live_profiler = Profiler("check_prices")
 
 
-order_manager = OrderManager()
+async def fetch_exchange_snapshot(exchange: str, symbols: list[str]):
+    """Снимок цен всех пар биржи одним запросом; ошибка возвращается, а не пробрасывается."""
+    try:
+        return exchange, await ex.fetch_tickers(exchange, symbols), None
+    except Exception as e:
+        return exchange, {}, e
+
+
+async def handle_alert(alert: dict, exchange: str, symbol: str, current_price: float, old_price):
+    """Отправка алерта стратегии и постановка её сигнала на покупку/продажу в конвейер ордеров."""
+    # Приведение ключей к нужным для send_price_alert
+    alert.setdefault("exchange", exchange)
+    alert.setdefault("pair", alert.get("symbol", symbol))
+    alert.setdefault("old", alert.get("old_price", old_price))
+    alert.setdefault("new", alert.get("new_price", current_price))
+    alerts.labels(alert.get("strategy", "unknown")).inc()
+
+    if alert.get("action") !="none":
+        send_price_alert(
+            exchange=alert["exchange"],
+            pair=alert["pair"],
+            old=alert["old"],
+            new=alert["new"],
+            diff=alert.get("diff", 0),
+            direction=alert.get("direction", ""),
+            timestamp=alert.get("timestamp", ""),
+            strategy=alert.get("strategy"),
+        )
+
+    amount = alert.get("amount", 10)
+    amount = POSITION_SIZE if POSITION_SIZE else amount
+    amount = amount/current_price
+
+    # Ордер уходит в конвейер исполнения: запись в БД, учёт портфеля и уведомление — после исполнения
+    side = alert.get("action")
+    if side in ("buy", "sell"):
+        order_pipeline.submit(order_intent(
+            alert.get("strategy", "unknown"), exchange, symbol, side, amount, current_price,
+            signal=alert.get("timestamp") or time.time(),
+        ))
+
+
+async def process_snapshot(exchange: str, symbols: list[str], prices: list[float], volumes: list[float]):
+    """
+    Обработка снимка цен биржи: сохранение и один вызов check_batch на стратегию для всех пар сразу.
+    Алерты обрабатываются по очереди; ошибка по одной паре не прерывает остальные.
+
+    :return: id пар и массив цен снимка
+    """
+    live_profiler.set_phase("persistence")
+    old_prices = {}
+    for symbol, price, volume in zip(symbols, prices, volumes):
+        old_prices[symbol] = price_cache.get_last_price(exchange, symbol)
+        price_cache.save_price(exchange, symbol, price, volume)
+        tick_recorder.record(exchange, symbol, price, volume)
+
+    ids = symbol_index.intern_many(exchange, symbols)
+    price_array = np.asarray(prices, dtype=np.float64)
+    volume_array = np.nan_to_num(np.asarray(volumes, dtype=np.float64))
+    current = dict(zip(symbols, prices))
+
+    for strategy in strategies:
+        live_profiler.set_phase("strategy")
+        start = time.perf_counter()
+        signals = strategy.check_batch(ids, price_array, volume_array)
+        strategy_check_seconds.labels(type(strategy).__name__).observe(time.perf_counter() - start)
+        for alert in signals:
+            live_profiler.set_phase("alerts")
+            symbol = alert.get("pair") or alert.get("symbol")
+            try:
+                await handle_alert(alert, exchange, symbol, current[symbol], old_prices[symbol])
+            except Exception as e:
+                logging.error(f"[{exchange} {symbol}] Ошибка: {e!r}")
+    return ids, price_array
+
+
+def threshold_distance(ids: np.ndarray, prices: np.ndarray) -> np.ndarray:
+    """Ближайшее по всем стратегиям расстояние до сигнала, % цены (inf — стратегии не знают)."""
+    distance = np.full(len(ids), np.inf)
+    for strategy in strategies:
+        if isinstance(strategy, BatchStrategy):
+            distance = np.minimum(distance, strategy.threshold_distance(ids, prices))
+    return distance
+
+
+async def process_tick(exchange: str, symbol: str, current_price: float, volume: float):
+    """Обработка одной новой цены (потоковый режим): снимок из одной пары."""
+    await process_snapshot(exchange, [symbol], [current_price], [volume or 0.0])
+
+
+def log_state_memory():
+    report = state_memory_report(strategies)
+    per_strategy = ", ".join(f"{name}: {r['bytes_per_pair']} Б" for name, r in report["strategies"].items())
+    logging.info(f"Состояние стратегий: {report['pairs']} пар, ~{report['bytes_per_pair']:.0f} байт на пару ({per_strategy})")
+
+
+def evict_idle_pairs():
+    """Вытеснение простаивающих и лишних (LRU) пар из состояния стратегий, если задан лимит."""
+    if not (STATE_MAX_PAIRS or STATE_IDLE_TTL):
+        return
+    evicted = symbol_index.evict(STATE_MAX_PAIRS, STATE_IDLE_TTL)
+    if evicted:
+        logging.info(f"Из состояния стратегий вытеснено пар: {len(evicted)}")
+        log_state_memory()
+
+
+async def warm_up_strategies():
+    """
+    Восстановление состояния стратегий из чекпоинта и загрузка учёта портфеля.
+    Стратегии без подходящего чекпоинта прогреваются по сохранённой истории цен.
+    """
+    restored = strategy_checkpoint.restore(strategies)
+    async with AsyncSessionLocal() as session:
+        db = DBManager(session)
+        await portfolio_ledger.load(db)
+        for strategy in strategies:
+            if strategy in restored or not hasattr(strategy, "seed"):
+                continue
+            for exchange, symbols in TRACKING.items():
+                for symbol in symbols:
+                    prices = await load_recent_prices(db, exchange, symbol, strategy.warmup_size)
+                    strategy.seed(exchange, symbol, prices)
+                    logging.info(f"[{exchange} {symbol}] {type(strategy).__name__} прогрет по {len(prices)} ценам")
+    strategy_checkpoint.start()
+    log_state_memory()
 
 
 async def check_prices():
-    while True:
-        try:
-            async with AsyncSessionLocal() as session:
-                db = DBManager(session)
-
-                for exchange, symbols in TRACKING.items():
-                    for symbol in symbols:
-                        try:
-                            ticker = await ex.exchanges[exchange].fetch_ticker(symbol)
-                            current_price = ticker['last']
-                            volume = ticker.get('baseVolume', 0)
-                            old_price = await db.get_last_price(exchange, symbol)
-                            await db.save_price(exchange, symbol, current_price, volume)
-
-                            for strategy in strategies:
-                                if isinstance(strategy, VolumeSpikeStrategy):
-                                    pass
-                                    # alerts = await strategy.check(exchange, symbol, old_price, current_price, volume)
-                                else:
-                                    alerts = await strategy.check(exchange, symbol, current_price)
-
-                                for alert in alerts:
-                                    # Приведение ключей к нужным для send_price_alert
-                                    alert.setdefault("pair", alert.get("symbol", symbol))
-                                    alert.setdefault("old", alert.get("old_price", old_price))
-                                    alert.setdefault("new", alert.get("new_price", current_price))
-
-                                    if alert.get("action") !="none":
-                                        await send_price_alert(
-                                            exchange=alert["exchange"],
-                                            pair=alert["pair"],
-                                            old=alert["old"],
-                                            new=alert["new"],
-                                            diff=alert.get("diff", 0),
-                                            direction=alert.get("direction", ""),
-                                            timestamp=alert.get("timestamp", ""),
-                                            strategy=alert.get("strategy"),
-                                        )
-
-                                    amount = alert.get("amount", 10)
-                                    amount = POSITION_SIZE if POSITION_SIZE else amount
-                                    amount = amount/current_price
-
-                                    if alert.get("action") == "buy":
-                                        order = await order_manager.emulate_buy(exchange, symbol, amount, current_price)
-                                        if order:
-                                            await db.create_order(strategy=alert.get("strategy", "unknown"),exchange=exchange,symbol=symbol,order_type="market",side="buy",amount=amount,price=current_price,status="closed",order_id=None,)
-                                            logging.info(f"Ордер покупку выполнен: {order}")
-                                            text=f"🟢 Открываю лонг на {POSITION_SIZE}$ \n{symbol} на {exchange} по цене {current_price}\n"
-                                            await bot.send_message(TELEGRAM_CHAT_ID, text=text, reply_markup=very_simple_keyboard())
-                                        else:
-                                            logging.error(
-                                                f"Не удалось создать ордер покупку для {symbol} на {exchange}")
-
-                                    if alert.get("action") == "sell":
-                                        order = await order_manager.emulate_sell(exchange, symbol, amount,current_price)
-                                        if order:
-                                            await db.create_order(strategy=alert.get("strategy", "unknown"),exchange=exchange,symbol=symbol,order_type="market",side="sell",amount=amount,price=current_price,status="closed",order_id=None,)
-                                            logging.info(f"Ордер продажу выполнен: {order}")
-                                            text = f"🔴 Открываю шорт на {POSITION_SIZE}$ \n{symbol} на {exchange} по цене {current_price}\n"
-                                            await bot.send_message(TELEGRAM_CHAT_ID, text=text, reply_markup=very_simple_keyboard())
-                                        else:
-                                            logging.error(
-                                                f"Не удалось создать ордер продажу для {symbol} на {exchange}")
-
-                        except Exception as e:
-                            logging.error(f"[{exchange} {symbol}] Ошибка: {e}")
-
-            logging.info(f"Цикл завершён, спим {POLL_INTERVAL} сек...\n")
-            await asyncio.sleep(POLL_INTERVAL)
+    await price_cache.start()
+    tick_recorder.start()
+    await warm_up_strategies()
+    live_profiler.start()
+    try:
+        await _poll_prices()
+    finally:
+        live_profiler.stop()  # Отчёт профиля при остановке (отмена задачи при выходе)
+
+
+async def poll_exchange(scheduler: PollScheduler, exchange: str, symbols: list[str]):
+    """
+    Опрос пар биржи, которым пора по расписанию: один bulk-запрос (с откатом на параллельные запросы
+    по парам), обработка снимка и новые интервалы опроса пар.
+    """
+    start = time.perf_counter()
+    live_profiler.set_phase("fetch")
+    _, snapshot, error = await fetch_exchange_snapshot(exchange, symbols)
+    if error is not None:
+        logging.error(f"[{exchange}] Ошибка получения тикеров: {error!r}")
+        return
+
+    polled = []
+    for symbol in symbols:
+        ticker = snapshot.get(symbol)
+        if ticker is None or ticker["last"] is None:
+            logging.warning(f"[{exchange} {symbol}] Нет цены в снимке")
+            continue
+        polled.append(symbol)
+    try:
+        ids, prices = await process_snapshot(
+            exchange, polled,
+            [snapshot[s]["last"] for s in polled],
+            [snapshot[s]["volume"] or 0.0 for s in polled],
+        )
+        scheduler.observe(exchange, polled, prices, threshold_distance(ids, prices), time.monotonic())
+    except Exception as e:
+        logging.error(f"[{exchange}] Ошибка обработки снимка: {e!r}")
+    poll_cycle_seconds.observe(time.perf_counter() - start)
+
+
+async def _poll_prices():
+    """
+    Часы опроса: тик k начинается в start + k * tick, а не через паузу после предыдущего опроса.
+    Биржи опрашиваются независимо: медленная биржа не задерживает остальные, а если её прошлый опрос
+    ещё идёт, тик для неё пропускается и учитывается (poll_overruns). Опоздавшие тики не догоняются пачкой.
+    """
+    scheduler = PollScheduler(TRACKING, bulk={name: bool(ex.exchanges[name].has.get("fetchTickers"))
+                                              for name in TRACKING})
+    polls: dict[str, asyncio.Task] = {}
+    start = time.monotonic()
+    last_report = start
+    tick = 0
+    logging.info(f"Опрос: шаг {scheduler.tick:g} сек, "
+                 f"{'свой интервал у каждой пары' if scheduler.adaptive else 'все пары на каждом тике'}")
+    try:
+        while True:
+            deadline = start + tick * scheduler.tick
+            live_profiler.set_phase("idle")
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            poll_lag_seconds.observe(time.monotonic() - deadline)
+
+            try:
+                for exchange in TRACKING:
+                    running = polls.get(exchange)
+                    if running is not None and not running.done():
+                        scheduler.overrun(exchange)
+                        continue
+                    symbols = scheduler.take_due(exchange, tick)
+                    if symbols:
+                        polls[exchange] = asyncio.create_task(poll_exchange(scheduler, exchange, symbols))
+
+                if time.monotonic() - last_report >= POLL_INTERVAL:
+                    evict_idle_pairs()
+                    logging.info(scheduler.report())
+                    last_report = time.monotonic()
+            except Exception as e:
+                logging.critical(f"Глобальная ошибка в check_prices: {e}")
+
+            tick += 1
+            behind = int((time.monotonic() - start) / scheduler.tick) - tick
+            if behind > 0:
+                poll_skipped_ticks.inc(behind)
+                logging.warning(f"Планировщик опроса отстал на {behind} тик(ов), пропускаем их")
+                tick += behind
+    finally:
+        for task in polls.values():
+            task.cancel()
+
+
+async def stream_prices():
+    """
+    Потоковый режим: цены приходят по WebSocket (одно соединение на биржу)
+    и сразу попадают в конвейер стратегий, без ожидания POLL_INTERVAL.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def on_tick(exchange, symbol, price, volume):
+        queue.put_nowait((exchange, symbol, price, volume))
+
+    await price_cache.start()
+    tick_recorder.start()
+    await warm_up_strategies()
+    stream_tasks = [asyncio.create_task(stream.run()) for stream in create_streams(TRACKING, on_tick)]
 
-        except Exception as e:
-            logging.critical(f"Глобальная ошибка в check_prices: {e}")
-            await asyncio.sleep(POLL_INTERVAL)
-        finally:
-            await ex.close_all()  # <-- Закрываем соединения CCXT
+    try:
+        last_eviction = time.monotonic()
+        while True:
+            exchange, symbol, price, volume = await queue.get()
+            try:
+                await process_tick(exchange, symbol, price, volume)
+            except Exception as e:
+                logging.error(f"[{exchange} {symbol}] Ошибка: {e!r}")
+
+            # Вытеснение — не чаще, чем раз в POLL_INTERVAL, как в режиме опроса
+            if time.monotonic() - last_eviction >= POLL_INTERVAL:
+                evict_idle_pairs()
+                last_eviction = time.monotonic()
+    finally:
+        for task in stream_tasks:
+            task.cancel()
 
 
 def plot_pnl_history(timestamps, realized, unrealized, equity):
@@ -121,141 +305,100 @@ def plot_pnl_history(timestamps, realized, unrealized, equity):
 
 
 async def emulate_trade():
-    cash = 1_000.0
-    commission_rate = 0.001
-    portfolio = {}
-    realized_pnl = 0.0
+    start = datetime(2025, 7, 1)
+    end = datetime(2025, 7, 6)
+    profiler = Profiler("emulate_trade")  # PROFILE_MODE: фазы load, strategy, fills, persistence, reporting
+    profiler.start()
 
-    # Истории
-    timestamps = []
-    equity_history = []
-    realized_pnl_history = []
-    unrealized_pnl_history = []
+    try:
+        with profiler.phase("load"):
+            candles = load_columns(f"historydata/{COIN_NAME}", start, end, columns=["open_time", "close"])
+        if not len(candles["close"]):
+            logging.error("Нет данных для эмуляции.")
+            return 0.0, 0.0, {}, 0.0, 0.0
+        symbol = COIN_NAME
+        exchange = "binance"
+
+        with profiler.phase("backtest"):
+            result = await run_backtest(
+                strategies, symbol,
+                close=candles["close"],
+                timestamps=candles["open_time"].astype("datetime64[ms]"),
+                exchange=exchange,
+                verbose=True,
+                profiler=profiler if profiler.enabled else None,
+            )
+
+        logging.info(f"Эмуляция завершена. Итоговый баланс: {result.cash:.2f} USDT")
+
+        # Сделки сохраняем одной транзакцией в конце, чтобы их было видно в боте
+        with profiler.phase("persistence"):
+            async with AsyncSessionLocal() as session:
+                db = DBManager(session)
+                await db.delete_all_orders()
+                await db.create_orders_bulk([
+                    {"strategy": t["strategy"], "exchange": exchange, "symbol": symbol, "order_type": "market",
+                     "side": t["side"], "amount": t["amount"], "price": t["price"], "status": "closed",
+                     "order_id": None, "created_at": t["datetime"]}
+                    for t in result.trades
+                ])
+                await portfolio_ledger.load(db)  # Учёт портфеля сброшен вместе с ордерами — пересчитываем
+
+        with profiler.phase("reporting"):
+            print(f"💰 Кэш: {result.cash:.2f} USDT")
+            print(f"📈 Активы (Equity): {result.equity:.2f} USDT")
+            print(f"📦 Портфель: {result.portfolio}")
+            print(f"📉 Нереализованный PnL: {result.unrealized_pnl:.2f} USDT")
+            print(f"💵 Реализованный PnL: {result.realized_pnl:.2f} USDT")
+        return result.as_tuple()
 
+    except Exception as e:
+        logging.critical(f"Ошибка в emulate_trade: {e}")
+    finally:
+        profiler.stop()
+
+
+async def emulate_portfolio():
+    """Бэктест всех пар TRACKING с общим кэшем по архивам historydata/<монета>."""
     start = datetime(2025, 7, 1)
     end = datetime(2025, 7, 6)
 
-    df = load_all_data_to_dataframe(f"historydata/{COIN_NAME}", start, end)
-    if df.empty:
-        logging.error("Нет данных для эмуляции.")
+    sources = {}
+    for exchange, symbols in TRACKING.items():
+        for symbol in symbols:
+            data_dir = f"historydata/{symbol.split('/')[0]}"
+            if not os.path.isdir(data_dir):
+                logging.warning(f"[{exchange} {symbol}] Нет архивов в {data_dir}, пара пропущена")
+                continue
+            sources[(exchange, symbol)] = iter_chunks(data_dir, start, end, columns=["open_time", "close"], workers=2)
+    if not sources:
+        logging.error("Нет данных для эмуляции портфеля.")
         return 0.0, 0.0, {}, 0.0, 0.0
-    symbol = COIN_NAME
+
     try:
+        result = await run_portfolio_backtest(strategies, sources, verbose=True)
+
         async with AsyncSessionLocal() as session:
             db = DBManager(session)
             await db.delete_all_orders()
-
-            for _, row in df.iterrows():
-                try:
-                    date = row["datetime"]
-                    close = row["close"]
-                    volume = row["volume"]
-                    current_prices = {symbol: close}
-                    exchange = "binance"
-
-                    old_price = await db.get_last_price(exchange, symbol)
-                    await db.save_price(exchange, symbol, close, volume)
-
-                    for strategy in strategies:
-                        alerts = await strategy.check(exchange, symbol, close)
-
-                        for alert in alerts:
-                            alert.setdefault("pair", symbol)
-                            alert.setdefault("old", old_price)
-                            alert.setdefault("new", close)
-                            alert.setdefault("action", "none")
-                            alert.setdefault("strategy", "unknown")
-
-                            action = alert["action"]
-                            strategy_name = alert["strategy"]
-                            amount = alert.get("amount")
-
-                            if amount is None:
-                                amount = POSITION_SIZE / close if POSITION_SIZE else 10 / close
-
-                            step = alert.get("step")
-
-                            if action == "buy":
-                                print(f"{date} BUY {amount} {symbol} at {close}")
-                                trade_price = close * (1 + commission_rate)
-                                cost = trade_price * amount
-                                if cash >= cost:
-                                    cash -= cost
-
-                                    if symbol not in portfolio or portfolio[symbol]["amount"] <= 0:
-                                        portfolio[symbol] = {"amount": amount, "avg_price": close}
-                                    else:
-                                        pos = portfolio[symbol]
-                                        total = pos["amount"] + amount
-                                        avg_price = (pos["avg_price"] * pos["amount"] + close * amount) / total
-                                        portfolio[symbol] = {"amount": total, "avg_price": avg_price}
-                                    created_at = date
-                                    await db.create_order(strategy_name, exchange, symbol, "market", "buy", amount,
-                                                          close, "closed", None, created_at=created_at)
-                                    cash, equity, portfolio, unrealized, realized = await calculate_balance_from_orders(
-                                        db, current_prices)
-                                    print(f"💰 Кэш: {cash:.2f} USDT")
-                                    print(f"📈 Активы (Equity): {equity:.2f} USDT")
-                                    print(f"📦 Портфель: {portfolio}")
-                                    print(f"📉 Нереализованный PnL: {unrealized:.2f} USDT")
-                                    print(f"💵 Реализованный PnL: {realized:.2f} USDT")
-
-                            elif action == "sell":
-                                print(f"{date} SELL {amount} {symbol} at {close}")
-                                trade_price = close * (1 - commission_rate)
-                                revenue = trade_price * amount
-                                cash += revenue
-
-                                if symbol in portfolio and portfolio[symbol]["amount"] > 0:
-                                    pos = portfolio[symbol]
-                                    closed_amount = min(pos["amount"], amount)
-                                    pnl = (close - pos["avg_price"]) * closed_amount
-                                    realized_pnl += pnl
-                                    pos["amount"] -= closed_amount
-
-                                    if pos["amount"] <= 0:
-                                        del portfolio[symbol]
-                                created_at = date
-                                await db.create_order(strategy_name, exchange, symbol, "market", "sell", amount, close,
-                                                      "closed", None, created_at=created_at)
-                                cash, equity, portfolio, unrealized, realized = await calculate_balance_from_orders(
-                                    db, current_prices)
-                                print(f"💰 Кэш: {cash:.2f} USDT")
-                                print(f"📈 Активы (Equity): {equity:.2f} USDT")
-                                print(f"📦 Портфель: {portfolio}")
-                                print(f"📉 Нереализованный PnL: {unrealized:.2f} USDT")
-                                print(f"💵 Реализованный PnL: {realized:.2f} USDT")
-
-                    # 💾 Сохраняем значения для графика
-                    portfolio_value = sum(
-                        pos["amount"] * close for pos in portfolio.values()
-                    )
-                    unrealized_pnl = sum(
-                        (close - pos["avg_price"]) * pos["amount"]
-                        for pos in portfolio.values()
-                    )
-                    equity = cash + portfolio_value
-
-                    timestamps.append(date)
-                    realized_pnl_history.append(realized_pnl)
-                    unrealized_pnl_history.append(unrealized_pnl)
-                    equity_history.append(equity)
-
-                except Exception as e:
-                    logging.error(f"Ошибка в свече: {e}")
-
-        logging.info(f"Эмуляция завершена. Итоговый баланс: {cash:.2f} USDT")
-
-        cash, equity, portfolio, unrealized, realized = await calculate_balance_from_orders(db, current_prices)
-        print(f"💰 Кэш: {cash:.2f} USDT")
-        print(f"📈 Активы (Equity): {equity:.2f} USDT")
-        print(f"📦 Портфель: {portfolio}")
-        print(f"📉 Нереализованный PnL: {unrealized:.2f} USDT")
-        print(f"💵 Реализованный PnL: {realized:.2f} USDT")
-
+            await db.create_orders_bulk([
+                {"strategy": t["strategy"], "exchange": t["exchange"], "symbol": t["symbol"], "order_type": "market",
+                 "side": t["side"], "amount": t["amount"], "price": t["price"], "status": "closed",
+                 "order_id": None, "created_at": np.datetime64(t["timestamp"], "ms").tolist()}
+                for t in result.trades
+            ])
+            await portfolio_ledger.load(db)
+
+        print(f"🧺 Пар: {len(sources)}, свечей: {result.bars}, сделок: {len(result.trades)}")
+        print(f"💰 Кэш: {result.cash:.2f} USDT")
+        print(f"📈 Активы (Equity): {result.equity:.2f} USDT")
+        print(f"📦 Портфель: {result.portfolio}")
+        print(f"📉 Нереализованный PnL: {result.unrealized_pnl:.2f} USDT")
+        print(f"💵 Реализованный PnL: {result.realized_pnl:.2f} USDT")
+        return result.as_tuple()
 
     except Exception as e:
-        logging.critical(f"Ошибка в emulate_prices: {e}")
+        logging.critical(f"Ошибка в emulate_portfolio: {e}")
 
 
 async def emulate_prices():
@@ -263,12 +406,16 @@ async def emulate_prices():
     commission_rate = 0.001
     portfolio = {}
     realized_pnl = 0.0
+    prices = PriceCache(persist=False)  # Последние цены эмуляции — только в памяти
 
     # Истории
     timestamps = []
     equity_history = []
     realized_pnl_history = []
     unrealized_pnl_history = []
+    # PROFILE_MODE: фазы load (чтение свечей), strategy, fills, persistence, reporting
+    profiler = Profiler("emulate_prices")
+    profiler.start()
 
     try:
         async with AsyncSessionLocal() as session:
@@ -277,6 +424,7 @@ async def emulate_prices():
             with open(HISTORICAL_DATA_PATH, "r") as f:
                 reader = csv.reader(f)
                 for row in reader:
+                    profiler.set_phase("load")
                     try:
                         ts = int(row[0])
                         date = datetime.fromtimestamp(ts / 1_000_000)
@@ -287,13 +435,15 @@ async def emulate_prices():
                         exchange = "binance"
                         current_prices = {symbol: close}
 
-                        old_price = await db.get_last_price(exchange, symbol)
-                        await db.save_price(exchange, symbol, close, volume)
+                        old_price = prices.get_last_price(exchange, symbol)
+                        prices.save_price(exchange, symbol, close, volume)
 
                         for strategy in strategies:
+                            profiler.set_phase("strategy")
                             alerts = await strategy.check(exchange, symbol, close)
 
                             for alert in alerts:
+                                profiler.set_phase("fills")
                                 alert.setdefault("pair", symbol)
                                 alert.setdefault("old", old_price)
                                 alert.setdefault("new", close)
@@ -325,6 +475,7 @@ async def emulate_prices():
                                             avg_price = (pos["avg_price"] * pos["amount"] + close * amount) / total
                                             portfolio[symbol] = {"amount": total, "avg_price": avg_price}
 
+                                        profiler.set_phase("persistence")
                                         await db.create_order(strategy_name, exchange, symbol, "market", "buy",
                                                               amount, close, "closed", None, created_at=created_at)
 
@@ -350,10 +501,12 @@ async def emulate_prices():
                                         if pos["amount"] <= 0:
                                             del portfolio[symbol]
 
+                                        profiler.set_phase("persistence")
                                         await db.create_order(strategy_name, exchange, symbol, "market", "sell",
                                                               amount, close, "closed", None, created_at=created_at)
 
                         # 💾 Сохраняем значения для графика
+                        profiler.set_phase("fills")
                         portfolio_value = sum(pos["amount"] * close for pos in portfolio.values())
                         unrealized_pnl = sum(
                             (close - pos["avg_price"]) * pos["amount"]
@@ -367,6 +520,7 @@ async def emulate_prices():
                         equity_history.append(equity)
 
                         # 🖨️ Статистика
+                        profiler.set_phase("reporting")
                         print(f"💰 Кэш: {cash:.2f} USDT")
                         print(f"📈 Активы (Equity): {equity:.2f} USDT")
                         print(f"📦 Портфель: {portfolio}")
@@ -378,7 +532,9 @@ async def emulate_prices():
 
             logging.info(f"Эмуляция завершена. Итоговый баланс: {cash:.2f} USDT")
 
-            cash, equity, portfolio, unrealized, realized = await calculate_balance_from_orders(db, current_prices)
+            profiler.set_phase("reporting")
+            await portfolio_ledger.load(db)  # Догоняет ордера эмуляции
+            cash, equity, portfolio, unrealized, realized = portfolio_ledger.balance(current_prices)
             print(f"✅ Финальный отчёт:")
             print(f"💰 Кэш: {cash:.2f} USDT")
             print(f"📈 Активы (Equity): {equity:.2f} USDT")
@@ -388,6 +544,8 @@ async def emulate_prices():
 
     except Exception as e:
         logging.critical(f"Ошибка в emulate_prices: {e}")
+    finally:
+        profiler.stop()
 
 
     # 📊 Отображаем график
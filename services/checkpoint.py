@@ -0,0 +1,130 @@
+import asyncio
+import io
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from strategies.base import BatchStrategy, SymbolIndex, symbol_index
+from tgbot.config import STRATEGY_CHECKPOINT_PATH, STRATEGY_CHECKPOINT_INTERVAL
+
+CHECKPOINT_VERSION = 1
+
+
+class StrategyCheckpoint:
+    """
+    Чекпоинт состояния стратегий (якоря, окна скользящих средних, лесенки Мартингейла) в файл .npz.
+
+    Пишется раз в interval секунд и при остановке; при старте restore() возвращает стратегиям
+    ровно то состояние, что было на момент записи, с переносом id пар в текущий SymbolIndex.
+    Стратегия восстанавливается, только если совпадают её класс, позиция в списке и параметры.
+    """
+
+    def __init__(self, path: str = STRATEGY_CHECKPOINT_PATH, interval: float = STRATEGY_CHECKPOINT_INTERVAL,
+                 index: SymbolIndex = None):
+        self.path = path
+        self.interval = interval
+        self.index = index or symbol_index
+        self.strategies: list[BatchStrategy] = []
+        self._saver: asyncio.Task | None = None
+
+    def snapshot(self) -> dict[str, np.ndarray]:
+        """Копия индекса пар и колонок всех стратегий (быстро, в потоке цикла событий)."""
+        live = sorted(self.index.ids.items(), key=lambda item: item[1])
+        sids = np.array([sid for _, sid in live], dtype=np.int64)
+        used = int(sids.max()) + 1 if len(sids) else 0
+        arrays = {
+            "sids": sids,
+            "exchanges": np.array([exchange for (exchange, _), _ in live], dtype=str),
+            "symbols": np.array([symbol for (_, symbol), _ in live], dtype=str),
+        }
+        meta = {"version": CHECKPOINT_VERSION, "saved_at": time.time(), "strategies": []}
+        for i, strategy in enumerate(self.strategies):
+            strategy.ensure_capacity(sids)
+            meta["strategies"].append({"name": type(strategy).__name__, "params": strategy.params()})
+            for name, values in strategy.state().items():
+                arrays[f"s{i}.{name}"] = values[:used].copy()
+        arrays["meta"] = np.array(json.dumps(meta))
+        return arrays
+
+    def _write(self, arrays: dict[str, np.ndarray]):
+        # Сначала во временный файл, затем атомарная замена: оборванная запись не портит прошлый чекпоинт
+        buffer = io.BytesIO()
+        np.savez(buffer, **arrays)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(buffer.getbuffer())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    async def save(self):
+        if not self.strategies:
+            return
+        arrays = self.snapshot()
+        await asyncio.to_thread(self._write, arrays)
+
+    def restore(self, strategies: list) -> list:
+        """
+        Загружает состояние из чекпоинта в подходящие стратегии.
+
+        :return: Стратегии, состояние которых восстановлено (остальные нужно прогреть по истории)
+        """
+        self.strategies = [s for s in strategies if isinstance(s, BatchStrategy)]
+        if not os.path.exists(self.path):
+            return []
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                meta = json.loads(str(data["meta"]))
+                if meta.get("version") != CHECKPOINT_VERSION:
+                    logging.warning(f"Чекпоинт стратегий {self.path}: неизвестная версия {meta.get('version')}")
+                    return []
+                saved_ids = data["sids"]
+                ids = np.fromiter(
+                    (self.index.intern(exchange, symbol) for exchange, symbol in zip(data["exchanges"].tolist(),
+                                                                                   data["symbols"].tolist())),
+                    dtype=np.int64, count=len(saved_ids))
+
+                restored = []
+                for i, strategy in enumerate(self.strategies):
+                    saved = meta["strategies"][i] if i < len(meta["strategies"]) else None
+                    if saved != {"name": type(strategy).__name__, "params": strategy.params()}:
+                        continue
+                    prefix = f"s{i}."
+                    columns = {key[len(prefix):]: data[key] for key in data.files if key.startswith(prefix)}
+                    if strategy.load_state(ids, columns, saved_ids):
+                        restored.append(strategy)
+        except (OSError, ValueError, KeyError) as e:
+            logging.error(f"Не удалось прочитать чекпоинт стратегий {self.path}: {e!r}")
+            return []
+
+        age = time.time() - meta["saved_at"]
+        logging.info(f"Состояние стратегий восстановлено из {self.path}: {len(restored)}/{len(self.strategies)} "
+                     f"стратегий, {len(saved_ids)} пар, возраст {age:.0f} сек")
+        return restored
+
+    def start(self):
+        """Запускает периодическую запись. Повторный вызов ничего не делает."""
+        if self._saver is None and self.interval > 0:
+            self._saver = asyncio.create_task(self._run_saver())
+
+    async def _run_saver(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.save()
+            except Exception as e:
+                logging.error(f"Ошибка записи чекпоинта стратегий: {e!r}")
+
+    async def close(self):
+        """Останавливает периодическую запись и пишет финальный чекпоинт."""
+        if self._saver is not None:
+            self._saver.cancel()
+            self._saver = None
+        await self.save()
+
+
+# Общий на процесс чекпоинт состояния стратегий
+strategy_checkpoint = StrategyCheckpoint()
@@ -1,17 +1,43 @@
+import itertools
+import json
 import os
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
 
+import numpy as np
 import pandas as pd
 import zipfile
 from pathlib import Path
 from datetime import datetime
 
 HISTORICAL_DIR = "/historydata"
-EXTRACTED_DIR = "/tmp"  # временный каталог
+CACHE_DIR_NAME = ".cache"  # подкаталог с колоночным кэшем внутри каталога с архивами
+HISTORY_LOAD_WORKERS = min(4, os.cpu_count() or 1)  # потоков разбора архивов
+# Дата в конце имени архива Binance: ...-2025-07-01 (день) или ...-2025-07 (месяц)
+ARCHIVE_DATE_RE = re.compile(r"(?P<year>\d{4})-(?P<month>\d{2})(?:-(?P<day>\d{2}))?$")
 # Имена столбцов из CSV
 BINANCE_COLUMNS = [
     "open_time", "open", "high", "low", "close", "volume", "close_time",
     "quote_volume", "count", "taker_buy_volume", "taker_buy_quote_volume", "ignore"
 ]
+# Типы столбцов в кэше (ignore не сохраняем)
+COLUMN_DTYPES = {
+    "open_time": np.int64,
+    "open": np.float64,
+    "high": np.float64,
+    "low": np.float64,
+    "close": np.float64,
+    "volume": np.float64,
+    "close_time": np.int64,
+    "quote_volume": np.float64,
+    "count": np.int64,
+    "taker_buy_volume": np.float64,
+    "taker_buy_quote_volume": np.float64,
+}
+
+
 def get_all_zip_files() -> list[str]:
     return sorted([
         f for f in os.listdir(HISTORICAL_DIR)
@@ -19,39 +45,181 @@ def get_all_zip_files() -> list[str]:
     ])
 
 def unzip_to_dataframe(zip_path: str) -> pd.DataFrame:
-    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        zip_ref.extractall(EXTRACTED_DIR)
-    # Предполагаем, что внутри один .csv
-    csv_files = [f for f in os.listdir(EXTRACTED_DIR) if f.endswith(".csv")]
-    if not csv_files:
-        raise FileNotFoundError("Нет .csv в архиве")
-    csv_path = os.path.join(EXTRACTED_DIR, csv_files[0])
-    df = pd.read_csv(csv_path, header=None)
-    df.columns = ["timestamp", "open", "high", "low", "close", "volume"]  # если без заголовков
-    return df
+    """Свечи одного архива (читается прямо из zip, без распаковки на диск)."""
+    data = _read_archive(Path(zip_path))
+    df = pd.DataFrame({name: data[name] for name in ("open_time", "open", "high", "low", "close", "volume")})
+    return df.rename(columns={"open_time": "timestamp"})
 
 
-def load_all_data_to_dataframe(data_dir: str = "data", start_date: datetime = None,
-                               end_date: datetime = None) -> pd.DataFrame:
-    all_data = []
+def _read_archive(zip_path: Path) -> dict[str, np.ndarray]:
+    """Разбирает все CSV архива Binance в колонки с нужными типами, время — в мс."""
+    frames = []
+    with zipfile.ZipFile(zip_path) as z:
+        for csv_filename in z.namelist():
+            with z.open(csv_filename) as f:
+                first_line = f.readline()
+                # В части архивов Binance есть строка заголовка, в части — нет
+                has_header = not first_line[:1].isdigit()
+            with z.open(csv_filename) as f:
+                frames.append(pd.read_csv(f, header=None, names=BINANCE_COLUMNS, skiprows=1 if has_header else 0,
+                                          usecols=list(COLUMN_DTYPES), dtype=COLUMN_DTYPES))
+
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=list(COLUMN_DTYPES))
+    columns = {name: df[name].to_numpy(dtype=dtype) for name, dtype in COLUMN_DTYPES.items()}
+
+    # С 2025 года спотовые архивы Binance хранят время в микросекундах
+    for name in ("open_time", "close_time"):
+        ts = columns[name]
+        if len(ts) and ts[0] > 10 ** 14:
+            columns[name] = ts // 1000
+
+    order = np.argsort(columns["open_time"], kind="stable")
+    if not np.all(order[:-1] < order[1:]):
+        columns = {name: values[order] for name, values in columns.items()}
+    return columns
+
+
+def _archive_signature(zip_path: Path) -> dict:
+    stat = zip_path.stat()
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def _load_archive_columns(zip_path: Path, columns: list[str]) -> dict[str, np.ndarray]:
+    """
+    Колонки архива из кэша .npy (memmap). Кэш пересобирается, если архив изменился
+    (по mtime и размеру файла).
+    """
+    cache_dir = zip_path.parent / CACHE_DIR_NAME / zip_path.stem
+    meta_path = cache_dir / "meta.json"
+    signature = _archive_signature(zip_path)
+
+    meta = None
+    if meta_path.exists():
+        try:
+            meta = json.loads(meta_path.read_text())
+        except ValueError:
+            meta = None
+
+    if meta is None or meta.get("signature") != signature:
+        data = _read_archive(zip_path)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        for name, values in data.items():
+            np.save(cache_dir / f"{name}.npy", values)
+        # meta пишется последним: без него кэш считается недостроенным
+        meta_path.write_text(json.dumps({"signature": signature, "rows": len(data["open_time"])}))
+        return {name: data[name] for name in columns}
+
+    return {name: np.load(cache_dir / f"{name}.npy", mmap_mode="r") for name in columns}
+
+
+def _to_ms(value: datetime | None) -> int | None:
+    if value is None:
+        return None
+    return int(pd.Timestamp(value).value // 1_000_000)
+
 
+def archive_date_range(zip_path: Path) -> tuple[int, int] | None:
+    """
+    Интервал [start, end) в мс по имени архива Binance: TONUSDT-1m-2025-07-01.zip — день,
+    TONUSDT-1m-2025-07.zip — месяц. None, если дату из имени не разобрать.
+    """
+    match = ARCHIVE_DATE_RE.search(zip_path.stem)
+    if match is None:
+        return None
+    year, month, day = int(match["year"]), int(match["month"]), match["day"]
+    if day is not None:
+        start = pd.Timestamp(year=year, month=month, day=int(day))
+        end = start + pd.Timedelta(days=1)
+    else:
+        start = pd.Timestamp(year=year, month=month, day=1)
+        end = start + pd.offsets.MonthBegin(1)
+    return start.value // 1_000_000, end.value // 1_000_000
+
+
+def select_archives(data_dir: str, start_ms: int = None, end_ms: int = None) -> list[Path]:
+    """Архивы каталога, чей интервал по имени пересекается с [start_ms, end_ms], по возрастанию дат."""
+    selected = []
     for zip_path in Path(data_dir).glob("*.zip"):
-        with zipfile.ZipFile(zip_path) as z:
-            for csv_filename in z.namelist():
-                with z.open(csv_filename) as f:
-                    df = pd.read_csv(f, header=None, names=BINANCE_COLUMNS, skiprows=1)
-                    df["datetime"] = pd.to_datetime(df["open_time"], unit="ms")
-                    all_data.append(df)
-
-    if not all_data:
-        return pd.DataFrame()
+        date_range = archive_date_range(zip_path)
+        if date_range is not None:
+            lo, hi = date_range
+            if (start_ms is not None and hi <= start_ms) or (end_ms is not None and lo > end_ms):
+                continue
+        selected.append((date_range[0] if date_range else -1, zip_path.name, zip_path))
+    return [zip_path for *_, zip_path in sorted(selected)]
+
+
+def _load_archive_window(zip_path: Path, columns: list[str], start_ms: int | None,
+                         end_ms: int | None) -> dict[str, np.ndarray] | None:
+    data = _load_archive_columns(zip_path, columns)
+    open_time = data["open_time"]
+    lo = 0 if start_ms is None else np.searchsorted(open_time, start_ms, side="left")
+    hi = len(open_time) if end_ms is None else np.searchsorted(open_time, end_ms, side="right")
+    if lo >= hi:
+        return None
+    return {name: values[lo:hi] for name, values in data.items()}
+
+
+def iter_chunks(data_dir: str = "data", start_date: datetime = None, end_date: datetime = None,
+                columns: list[str] = ("open_time", "close", "volume"),
+                workers: int = HISTORY_LOAD_WORKERS) -> Iterator[dict[str, np.ndarray]]:
+    """
+    Потоковая загрузка истории: по одному чанку {column: np.ndarray} на архив, по возрастанию времени.
+
+    Берутся только архивы, чей день/месяц в имени пересекается с [start_date, end_date].
+    Архивы разбираются в workers потоках (CSV читается прямо из zip, прочитанное кэшируется в .npy),
+    вперёд загружается не больше workers архивов, так что память ограничена при любой длине периода.
+    Колонки из кэша — memmap, без копирования в память. Предполагается, что архивы каталога
+    не пересекаются по времени (только дневные или только месячные).
+    """
+    columns = list(columns)
+    load = columns if "open_time" in columns else ["open_time"] + columns
+    start_ms, end_ms = _to_ms(start_date), _to_ms(end_date)
+    archives = select_archives(data_dir, start_ms, end_ms)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        pending = deque()
+        archives_left = iter(archives)
+        for zip_path in itertools.islice(archives_left, workers):
+            pending.append(pool.submit(_load_archive_window, zip_path, load, start_ms, end_ms))
+        while pending:
+            chunk = pending.popleft().result()
+            next_path = next(archives_left, None)
+            if next_path is not None:
+                pending.append(pool.submit(_load_archive_window, next_path, load, start_ms, end_ms))
+            if chunk is not None:
+                yield {name: chunk[name] for name in columns}
 
-    result = pd.concat(all_data, ignore_index=True)
 
-    # Фильтрация по дате
-    if start_date:
-        result = result[result["datetime"] >= start_date]
-    if end_date:
-        result = result[result["datetime"] <= end_date]
+def load_columns(data_dir: str = "data", start_date: datetime = None, end_date: datetime = None,
+                 columns: list[str] = ("open_time", "close", "volume")) -> dict[str, np.ndarray]:
+    """
+    Загружает только нужные колонки и диапазон дат из архивов каталога (см. iter_chunks).
+
+    Время (open_time, close_time) — int64 в мс.
+
+    :return: {column: np.ndarray}, строки отсортированы по open_time
+    """
+    columns = list(columns)
+    load = columns if "open_time" in columns else ["open_time"] + columns
+    parts = list(iter_chunks(data_dir, start_date, end_date, load))
+    if not parts:
+        return {name: np.empty(0, dtype=COLUMN_DTYPES[name]) for name in columns}
+
+    result = {name: np.concatenate([p[name] for p in parts]) for name in load}
+    open_time = result["open_time"]
+    if len(open_time) > 1 and not np.all(open_time[:-1] <= open_time[1:]):
+        order = np.argsort(open_time, kind="stable")
+        result = {name: values[order] for name, values in result.items()}
+    return {name: result[name] for name in columns}
+
+
+def load_all_data_to_dataframe(data_dir: str = "data", start_date: datetime = None,
+                               end_date: datetime = None) -> pd.DataFrame:
+    data = load_columns(data_dir, start_date, end_date, columns=list(COLUMN_DTYPES))
+    if not len(data["open_time"]):
+        return pd.DataFrame()
 
-    return result.sort_values("datetime").reset_index(drop=True)
\ No newline at end of file
+    result = pd.DataFrame(data)
+    result["datetime"] = pd.to_datetime(result["open_time"], unit="ms")
+    return result
@@ -0,0 +1,339 @@
+import bisect
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+
+from aiohttp import web
+
+from tgbot.config import METRICS_HOST, METRICS_PORT
+
+# Границы корзин гистограмм, сек: от долей миллисекунды (стратегии, commit) до минут (цикл опроса)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class _Metric(ABC):
+    """Основа метрик: значения по наборам меток (по ключу-кортежу), метки фиксированы при создании."""
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple, object] = {}
+
+    def labels(self, *values):
+        """Значение для набора меток; в горячем пути его стоит получить один раз и сохранить."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name}: ожидаются метки {self.labelnames}, получено {values}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    @abstractmethod
+    def _new_child(self):
+        """Значение метрики для нового набора меток."""
+
+    def _label_text(self, values: tuple, extra: str = "") -> str:
+        pairs = [f'{name}="{value}"' for name, value in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class _CounterValue:
+    __slots__ = ("value", "_events")
+
+    def __init__(self):
+        self.value = 0.0
+        self._events: deque[tuple[float, float]] = deque()  # (time.monotonic(), n) за последнюю минуту
+
+    def inc(self, n: float = 1):
+        self.value += n
+        now = time.monotonic()
+        self._events.append((now, n))
+        while self._events[0][0] < now - 60:
+            self._events.popleft()
+
+    def per_minute(self) -> float:
+        """Сколько набежало за последние 60 секунд."""
+        cutoff = time.monotonic() - 60
+        return sum(n for t, n in self._events if t >= cutoff)
+
+
+class Counter(_Metric):
+    """Монотонный счётчик (алерты, ордера); помнит события последней минуты для /stats."""
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterValue()
+
+    def inc(self, n: float = 1):
+        self.labels().inc(n)
+
+    def render(self) -> list[str]:
+        name = f"{self.name}_total"
+        lines = [f"# HELP {name} {self.documentation}", f"# TYPE {name} counter"]
+        for values, child in self._children.items():
+            lines.append(f"{name}{self._label_text(values)} {child.value}")
+        return lines
+
+
+class _GaugeValue:
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, function):
+        """Значение считается при чтении (глубина очереди), а не обновляется в горячем пути."""
+        self.function = function
+
+    def get(self) -> float:
+        return float(self.function()) if self.function is not None else self.value
+
+
+class Gauge(_Metric):
+    """Текущее значение (глубина очередей, число пар)."""
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeValue()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def set_function(self, function):
+        self.labels().set_function(function)
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        for values, child in self._children.items():
+            try:
+                value = child.get()
+            except Exception:
+                continue
+            lines.append(f"{self.name}{self._label_text(values)} {value}")
+        return lines
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "count", "last")
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # Последняя корзина — +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.last = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.last = value
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля по корзинам (линейно внутри корзины, как histogram_quantile в Prometheus)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                if i == len(self.bounds):
+                    return self.bounds[-1]
+                lower = self.bounds[i - 1] if i else 0.0
+                return lower + (self.bounds[i] - lower) * (rank - seen) / n
+            seen += n
+        return self.bounds[-1]
+
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+
+class Histogram(_Metric):
+    """Распределение длительностей по фиксированным корзинам: observe() — bisect и два сложения."""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), child.counts):
+                cumulative += n
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{self._label_text(values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_text(values)} {child.sum}")
+            lines.append(f"{self.name}_count{self._label_text(values)} {child.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Все метрики процесса: текст для Prometheus и сводка для команды /stats."""
+
+    def __init__(self):
+        self.metrics: list[_Metric] = []
+        self.started = time.monotonic()
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._add(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+        return self._add(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (),
+                  buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Текстовый формат Prometheus (exposition format 0.0.4)."""
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+poll_cycle_seconds = registry.histogram(
+    "cryptomonitor_poll_cycle_seconds", "Длительность опроса биржи: запрос и обработка снимка")
+poll_lag_seconds = registry.histogram(
+    "cryptomonitor_poll_lag_seconds", "Опоздание тика планировщика опроса относительно расписания")
+poll_overruns = registry.counter(
+    "cryptomonitor_poll_overruns", "Тики, пропущенные биржей: предыдущий опрос ещё не завершён", ("exchange",))
+poll_skipped_ticks = registry.counter(
+    "cryptomonitor_poll_skipped_ticks", "Тики, пропущенные планировщиком из-за занятого цикла событий")
+poll_request_rate = registry.gauge(
+    "cryptomonitor_poll_request_rate", "Прогноз запросов опроса к биржам в минуту")
+exchange_request_seconds = registry.histogram(
+    "cryptomonitor_exchange_request_seconds", "Задержка запросов к бирже", ("exchange", "method"))
+exchange_errors = registry.counter(
+    "cryptomonitor_exchange_errors", "Ошибки запросов к бирже", ("exchange", "method"))
+strategy_check_seconds = registry.histogram(
+    "cryptomonitor_strategy_check_seconds", "Время проверки снимка цен стратегией", ("strategy",))
+db_commit_seconds = registry.histogram(
+    "cryptomonitor_db_commit_seconds", "Задержка commit в SQLite", ("mode",))
+telegram_send_seconds = registry.histogram(
+    "cryptomonitor_telegram_send_seconds", "Задержка отправки сообщения в Telegram")
+queue_depth = registry.gauge(
+    "cryptomonitor_queue_depth", "Глубина очередей", ("queue",))
+alerts = registry.counter(
+    "cryptomonitor_alerts", "Сигналы стратегий", ("strategy",))
+orders = registry.counter(
+    "cryptomonitor_orders", "Ордера по итогу исполнения", ("exchange", "side", "status"))
+ticks_dropped = registry.counter(
+    "cryptomonitor_ticks_dropped", "Тики истории, отброшенные из-за переполнения буфера записи")
+
+
+def _timing(child) -> str:
+    return f"{child.mean() * 1000:.1f} мс ср., p95 {child.quantile(0.95) * 1000:.1f} мс, n={child.count}"
+
+
+def stats_report(metrics: MetricsRegistry = None) -> str:
+    """Сводка метрик для команды /stats (HTML)."""
+    metrics = metrics or registry
+    uptime = int(time.monotonic() - metrics.started)
+    lines = [
+        "<b>📊 Статистика</b>",
+        f"⏱ Аптайм: {uptime // 3600} ч {uptime % 3600 // 60} мин",
+    ]
+
+    cycle = poll_cycle_seconds.labels()
+    if cycle.count:
+        lines.append(f"🔁 Опрос биржи: последний {cycle.last:.2f} сек, {_timing(cycle)}")
+    lag = poll_lag_seconds.labels()
+    if lag.count:
+        overruns = sum(c.value for c in poll_overruns._children.values())
+        skipped = sum(c.value for c in poll_skipped_ticks._children.values())
+        lines.append(f"🕒 Опоздание тика: p95 {lag.quantile(0.95) * 1000:.1f} мс, "
+                     f"пропусков {overruns:.0f} (биржа занята) + {skipped:.0f} (цикл занят)")
+
+    if exchange_request_seconds._children:
+        lines.append("\n<b>Запросы к биржам:</b>")
+        for (exchange, method), child in sorted(exchange_request_seconds._children.items()):
+            errors = exchange_errors._children.get((exchange, method))
+            lines.append(f"• {exchange} {method}: {_timing(child)}, ошибок {int(errors.value) if errors else 0}")
+
+    if strategy_check_seconds._children:
+        lines.append("\n<b>Стратегии (снимок):</b>")
+        for (strategy,), child in sorted(strategy_check_seconds._children.items()):
+            lines.append(f"• {strategy}: {_timing(child)}")
+
+    for (mode,), child in sorted(db_commit_seconds._children.items()):
+        lines.append(f"💾 Commit ({mode}): {_timing(child)}")
+    send = telegram_send_seconds.labels()
+    if send.count:
+        lines.append(f"✉️ Отправка в Telegram: {_timing(send)}")
+
+    depths = []
+    for (queue,), child in sorted(queue_depth._children.items()):
+        try:
+            depths.append(f"{queue} {int(child.get())}")
+        except Exception:
+            continue
+    if depths:
+        lines.append(f"📥 Очереди: {', '.join(depths)}")
+
+    alert_children = alerts._children.values()
+    order_children = orders._children.values()
+    lines.append(f"🚨 Алертов: {sum(c.per_minute() for c in alert_children):.0f}/мин "
+                 f"(всего {sum(c.value for c in alert_children):.0f})")
+    lines.append(f"🧾 Ордеров: {sum(c.per_minute() for c in order_children):.0f}/мин "
+                 f"(всего {sum(c.value for c in order_children):.0f})")
+    return "\n".join(lines)
+
+
+class MetricsServer:
+    """Локальный HTTP-эндпоинт /metrics для Prometheus."""
+
+    def __init__(self, host: str = METRICS_HOST, port: int = METRICS_PORT, metrics: MetricsRegistry = None):
+        self.host = host
+        self.port = port
+        self.metrics = metrics or registry
+        self._runner: web.AppRunner | None = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.metrics.render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    async def start(self):
+        if self._runner is not None or not self.port:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logging.info(f"Метрики: http://{self.host}:{self.port}/metrics")
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+# Общий на процесс эндпоинт метрик (запускается в main, если задан METRICS_PORT)
+metrics_server = MetricsServer()
@@ -1,32 +1,77 @@
 import logging
-from exchanges.ccxt_client import ExchangeManager
+from exchanges.ccxt_client import get_exchange_manager
 
-ex_manager = ExchangeManager()
 
 class OrderManager:
     def __init__(self):
-        self.exchanges = ex_manager.exchanges  # словарь ccxt-инстансов по биржам
+        self.ex_manager = get_exchange_manager()  # общий на процесс менеджер бирж
 
-    async def buy_market(self, exchange_name: str, symbol: str, amount: float):
+    async def create_order(self, exchange_name: str, symbol: str, order_type: str, side: str, amount: float,
+                           price: float = None, client_order_id: str = None) -> dict:
+        """
+        Выставить ордер на бирже; ошибки ccxt пробрасываются (повторы решает вызывающий).
+
+        :param client_order_id: Свой id ордера: биржа отклонит повтор с тем же id (DuplicateOrderId),
+                                поэтому повторная отправка после сетевой ошибки не создаст второй ордер
+        """
+        exchange = await self.ex_manager.get_exchange(exchange_name)
+        params = {"clientOrderId": client_order_id} if client_order_id else {}
+        async with self.ex_manager.semaphores[exchange_name]:
+            return await self.ex_manager.timed(exchange_name, "create_order",
+                                               exchange.create_order(symbol, order_type, side, amount, price, params))
+
+    async def fetch_order(self, exchange_name: str, symbol: str, order_id: str = None,
+                          client_order_id: str = None) -> dict:
+        """Ордер по id биржи или по своему client_order_id."""
+        exchange = await self.ex_manager.get_exchange(exchange_name)
+        params = {"clientOrderId": client_order_id} if client_order_id and not order_id else {}
+        async with self.ex_manager.semaphores[exchange_name]:
+            return await self.ex_manager.timed(exchange_name, "fetch_order", exchange.fetch_order(order_id, symbol, params))
+
+    async def buy_market(self, exchange_name: str, symbol: str, amount: float, client_order_id: str = None):
         """Купить на бирже market ордером."""
         try:
-            order = await self.exchanges[exchange_name].create_market_buy_order(symbol, amount)
+            order = await self.create_order(exchange_name, symbol, "market", "buy", amount,
+                                            client_order_id=client_order_id)
             logging.info(f"Market BUY ордер создан: {exchange_name} {symbol} {amount}")
             return order
         except Exception as e:
             logging.error(f"Ошибка создания market BUY ордера: {e}")
             return None
 
-    async def buy_limit(self, exchange_name: str, symbol: str, amount: float, price: float):
+    async def buy_limit(self, exchange_name: str, symbol: str, amount: float, price: float,
+                        client_order_id: str = None):
         """Купить на бирже limit ордером."""
         try:
-            order = await self.exchanges[exchange_name].create_limit_buy_order(symbol, amount, price)
+            order = await self.create_order(exchange_name, symbol, "limit", "buy", amount, price, client_order_id)
             logging.info(f"Limit BUY ордер создан: {exchange_name} {symbol} {amount}@{price}")
             return order
         except Exception as e:
             logging.error(f"Ошибка создания limit BUY ордера: {e}")
             return None
 
+    async def sell_market(self, exchange_name: str, symbol: str, amount: float, client_order_id: str = None):
+        """Продать на бирже market ордером."""
+        try:
+            order = await self.create_order(exchange_name, symbol, "market", "sell", amount,
+                                            client_order_id=client_order_id)
+            logging.info(f"Market SELL ордер создан: {exchange_name} {symbol} {amount}")
+            return order
+        except Exception as e:
+            logging.error(f"Ошибка создания market SELL ордера: {e}")
+            return None
+
+    async def sell_limit(self, exchange_name: str, symbol: str, amount: float, price: float,
+                         client_order_id: str = None):
+        """Продать на бирже limit ордером."""
+        try:
+            order = await self.create_order(exchange_name, symbol, "limit", "sell", amount, price, client_order_id)
+            logging.info(f"Limit SELL ордер создан: {exchange_name} {symbol} {amount}@{price}")
+            return order
+        except Exception as e:
+            logging.error(f"Ошибка создания limit SELL ордера: {e}")
+            return None
+
     async def emulate_buy(self, exchange_name: str, symbol: str, amount: float, price: float = None):
         """Эмулировать покупку (без реального ордера)."""
         # logging.info(f"[Эмуляция] Покупка: {exchange_name} {symbol} {amount} по цене {price}")
@@ -49,4 +94,4 @@ class OrderManager:
             "amount": amount,
             "price": price,
             "status": "emulated"
-        }
\ No newline at end of file
+        }
@@ -0,0 +1,350 @@
+import asyncio
+import hashlib
+import logging
+import time
+import zlib
+from collections import OrderedDict
+
+import ccxt.async_support as ccxt
+
+from db.sqlite_module import AsyncSessionLocal, DBManager
+from services.metrics import orders, queue_depth
+from services.order_manager import OrderManager
+from services.portfolio import portfolio_ledger
+from services.positions_report import positions_report
+from tgbot.config import ORDER_MODE, ORDER_WORKERS_PER_EXCHANGE, ORDER_QUEUE_SIZE, ORDER_MAX_RETRIES, \
+    ORDER_RECORD_BATCH, ORDER_RECONCILE_INTERVAL, POSITION_SIZE, TELEGRAM_CHAT_ID
+from tgbot.keyboards.inline import very_simple_keyboard
+from tgbot.telegram_bot import notifier
+
+SEEN_LIMIT = 10_000  # Сколько последних client id помнить для отсева повторных сигналов
+FILL_POLL_ATTEMPTS = 3  # Сколько раз перепроверить market-ордер, который биржа вернула неисполненным
+RECORD_MAX_BACKOFF = 30  # Предел паузы между повторами записи пачки в БД, сек
+TERMINAL_STATUSES = {"closed": "closed", "canceled": "canceled", "expired": "canceled", "rejected": "canceled"}
+
+
+def client_order_id(strategy: str, exchange: str, symbol: str, side: str, signal) -> str:
+    """
+    Детерминированный id ордера: тот же сигнал (стратегия, пара, сторона, время сигнала) даёт тот же id.
+    32 символа — в пределах ограничений Binance и Bybit (36).
+    """
+    digest = hashlib.sha1(f"{strategy}|{exchange}|{symbol}|{side}|{signal}".encode()).hexdigest()
+    return f"cmb{digest[:29]}"
+
+
+def order_intent(strategy: str, exchange: str, symbol: str, side: str, amount: float, price: float, signal,
+                 order_type: str = "market") -> dict:
+    """Намерение выставить ордер; price — цена сигнала (для market — ориентир и цена эмуляции)."""
+    return {
+        "client_order_id": client_order_id(strategy, exchange, symbol, side, signal),
+        "strategy": strategy,
+        "exchange": exchange,
+        "symbol": symbol,
+        "order_type": order_type,
+        "side": side,
+        "amount": amount,
+        "price": price,
+        "created": time.monotonic(),
+    }
+
+
+class OrderPipeline:
+    """
+    Конвейер исполнения ордеров.
+
+    submit() только ставит намерение в очередь: цикл мониторинга не ждёт биржу, и задержка
+    сигнал → ордер не растёт, когда сигналят сразу много пар. На каждую биржу работают workers
+    задач; пара всегда попадает к одному воркеру, так что ордера одной пары уходят по порядку,
+    а разные пары — одновременно (в пределах EXCHANGE_CONCURRENCY и rate limit ccxt).
+
+    Каждый ордер несёт client_order_id: повтор того же сигнала отсеивается, а повторная отправка
+    после сетевой ошибки не создаёт второй ордер на бирже. Исполнения записываются в БД пачками
+    (одна транзакция на пачку) отдельной задачей, открытые ордера периодически сверяются с биржей.
+    """
+
+    def __init__(self, order_manager: OrderManager = None, mode: str = ORDER_MODE,
+                 workers: int = ORDER_WORKERS_PER_EXCHANGE, maxsize: int = ORDER_QUEUE_SIZE,
+                 max_retries: int = ORDER_MAX_RETRIES, record_batch: int = ORDER_RECORD_BATCH,
+                 reconcile_interval: float = ORDER_RECONCILE_INTERVAL):
+        self.order_manager = order_manager or OrderManager()
+        self.mode = mode
+        self.workers = workers
+        self.maxsize = maxsize
+        self.max_retries = max_retries
+        self.record_batch = record_batch
+        self.reconcile_interval = reconcile_interval
+        self._queues: dict[str, list[asyncio.Queue]] = {}
+        self._tasks: list[asyncio.Task] = []
+        self._fills: asyncio.Queue | None = None
+        self._recorder: asyncio.Task | None = None
+        self._seen: OrderedDict[str, None] = OrderedDict()
+        self._open: dict[int, dict] = {}  # {id строки orders: намерение} — выставлены, но ещё не исполнены
+        self.submitted = 0
+        self.duplicates = 0
+        self.dropped = 0
+        self.filled = 0
+        self.failed = 0
+        self.latency_total = 0.0  # Сигнал → начало отправки, сумма по ордерам, сек
+        self.latency_max = 0.0
+
+    def submit(self, intent: dict) -> bool:
+        """
+        Ставит намерение (см. order_intent) в очередь. Не ждёт биржу.
+
+        :return: False, если это повтор уже принятого сигнала или очередь воркера переполнена
+        """
+        cid = intent["client_order_id"]
+        if cid in self._seen:
+            self.duplicates += 1
+            logging.warning(f"[{intent['exchange']} {intent['symbol']}] Повтор ордера {cid} пропущен")
+            return False
+
+        queue = self._queue(intent["exchange"], intent["symbol"])
+        if queue.full():
+            self.dropped += 1
+            logging.warning(f"[{intent['exchange']} {intent['symbol']}] Очередь ордеров переполнена, ордер отброшен")
+            return False
+
+        self._seen[cid] = None
+        if len(self._seen) > SEEN_LIMIT:
+            self._seen.popitem(last=False)
+        queue.put_nowait(intent)
+        self.submitted += 1
+        return True
+
+    def _queue(self, exchange: str, symbol: str) -> asyncio.Queue:
+        queues = self._queues.get(exchange)
+        if queues is None:
+            if self._recorder is None:
+                self._fills = asyncio.Queue()
+                self._recorder = asyncio.create_task(self._run_recorder())
+            queues = self._queues[exchange] = [asyncio.Queue(self.maxsize) for _ in range(self.workers)]
+            self._tasks += [asyncio.create_task(self._run_worker(exchange, queue)) for queue in queues]
+        return queues[zlib.crc32(symbol.encode()) % len(queues)]
+
+    async def _run_worker(self, exchange: str, queue: asyncio.Queue):
+        while True:
+            intent = await queue.get()
+            latency = time.monotonic() - intent["created"]
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+            try:
+                order = await self._execute(intent)
+            except Exception as e:
+                self.failed += 1
+                orders.labels(exchange, intent["side"], "failed").inc()
+                logging.error(f"[{exchange} {intent['symbol']}] Ордер {intent['client_order_id']} не выставлен: {e!r}")
+            else:
+                self._fills.put_nowait((intent, order))
+            finally:
+                queue.task_done()
+
+    async def _execute(self, intent: dict) -> dict:
+        """Выставляет ордер (или эмулирует его) и возвращает ответ в формате ccxt."""
+        exchange, symbol, side, amount = intent["exchange"], intent["symbol"], intent["side"], intent["amount"]
+        if self.mode != "live":
+            emulate = self.order_manager.emulate_buy if side == "buy" else self.order_manager.emulate_sell
+            await emulate(exchange, symbol, amount, intent["price"])
+            return {"id": None, "status": "closed", "price": intent["price"], "filled": amount}
+
+        cid = intent["client_order_id"]
+        price = intent["price"] if intent["order_type"] == "limit" else None
+        attempt = 0
+        exists = False  # Ордер с этим client id уже на бирже: прошлая попытка дошла, потерян только ответ
+        while True:
+            try:
+                if exists:
+                    order = await self.order_manager.fetch_order(exchange, symbol, client_order_id=cid)
+                else:
+                    order = await self.order_manager.create_order(exchange, symbol, intent["order_type"], side,
+                                                                  amount, price, cid)
+                break
+            except ccxt.DuplicateOrderId:
+                # Берём существующий ордер, а не создаём новый
+                exists = True
+            except ccxt.NetworkError as e:
+                attempt += 1
+                if attempt >= self.max_retries:
+                    raise
+                logging.warning(f"[{exchange} {symbol}] Сетевая ошибка при отправке {cid}, повтор: {e!r}")
+                await asyncio.sleep(min(2 ** (attempt - 1), 10))
+
+        # Market-ордер обычно исполняется сразу, но некоторые биржи отвечают до исполнения;
+        # если и проверка не удалась, ордер запишется открытым и дойдёт до конца при сверке
+        for attempt in range(FILL_POLL_ATTEMPTS):
+            if intent["order_type"] != "market" or order.get("status") in TERMINAL_STATUSES:
+                break
+            await asyncio.sleep(0.2 * (attempt + 1))
+            try:
+                order = await self.order_manager.fetch_order(exchange, symbol, order.get("id"), cid)
+            except ccxt.NetworkError:
+                break
+        return order
+
+    async def _run_recorder(self):
+        if self.mode == "live":
+            try:
+                await self._load_open_orders()
+            except Exception as e:
+                logging.error(f"Не удалось загрузить открытые ордера: {e!r}")
+        last_reconcile = time.monotonic()
+        while True:
+            timeout = self.reconcile_interval if self._open else None
+            try:
+                batch = [await asyncio.wait_for(self._fills.get(), timeout)]
+            except asyncio.TimeoutError:
+                batch = []
+            while batch and len(batch) < self.record_batch and not self._fills.empty():
+                batch.append(self._fills.get_nowait())
+            try:
+                if batch:
+                    await self._record_until_saved(batch)
+                if self._open and time.monotonic() - last_reconcile >= self.reconcile_interval:
+                    last_reconcile = time.monotonic()
+                    await self._reconcile()
+            except Exception as e:
+                logging.error(f"Ошибка сверки ордеров: {e!r}")
+            finally:
+                for _ in batch:
+                    self._fills.task_done()
+
+    async def _record_until_saved(self, batch: list[tuple[dict, dict]]):
+        """
+        Пишет пачку, пока запись не пройдёт: ордера уже на бирже, и потерять их нельзя.
+        Между попытками пауза растёт вдвое до RECORD_MAX_BACKOFF; новые исполнения ждут в очереди.
+        """
+        attempt = 0
+        while True:
+            try:
+                await self._record(batch)
+                return
+            except asyncio.CancelledError:
+                lost = ", ".join(f"{intent['exchange']} {intent['symbol']} {intent['side']} {order.get('id')}"
+                                 for intent, order in batch)
+                logging.critical(f"Остановка: не записаны в БД исполненные ордера: {lost}")
+                raise
+            except Exception as e:
+                attempt += 1
+                delay = min(2 ** (attempt - 1), RECORD_MAX_BACKOFF)
+                logging.error(f"Ошибка записи {len(batch)} ордеров (попытка {attempt}), повтор через {delay} сек: "
+                              f"{e!r}")
+                await asyncio.sleep(delay)
+
+    async def _record(self, batch: list[tuple[dict, dict]]):
+        """Записывает пачку ответов биржи одной транзакцией и применяет исполненные к учёту портфеля."""
+        rows = []
+        for intent, order in batch:
+            status = TERMINAL_STATUSES.get(order.get("status"), "open")
+            rows.append({
+                "strategy": intent["strategy"], "exchange": intent["exchange"], "symbol": intent["symbol"],
+                "order_type": intent["order_type"], "side": intent["side"],
+                "amount": order.get("filled") or intent["amount"],
+                "price": order.get("average") or order.get("price") or intent["price"],
+                "status": status, "order_id": order.get("id"),
+            })
+
+        async with AsyncSessionLocal() as session:
+            db = DBManager(session)
+            created = await db.create_orders(rows)
+            try:
+                await portfolio_ledger.apply_orders(db, created)
+            except Exception as e:
+                # Ордера записаны: учёт перечитается из БД и догонит их при следующем обращении
+                logging.error(f"Учёт портфеля не обновлён: {e!r}")
+        positions_report.invalidate()
+
+        for (intent, order), row in zip(batch, created):
+            orders.labels(row.exchange, row.side, row.status).inc()
+            if row.status == "open":
+                self._open[row.id] = {**intent, "order_id": row.order_id}
+            elif row.status == "closed":
+                self.filled += 1
+                self._notify_fill(row)
+            else:
+                self.failed += 1
+                logging.warning(f"[{row.exchange} {row.symbol}] Ордер {intent['client_order_id']} не исполнен: "
+                                f"{order.get('status')}")
+
+    def _notify_fill(self, row):
+        logging.info(f"Ордер {'покупку' if row.side == 'buy' else 'продажу'} выполнен: "
+                     f"{row.exchange} {row.symbol} {row.amount} @ {row.price}")
+        if row.side == "buy":
+            text = f"🟢 Открываю лонг на {POSITION_SIZE}$ \n{row.symbol} на {row.exchange} по цене {row.price}\n"
+        else:
+            text = f"🔴 Открываю шорт на {POSITION_SIZE}$ \n{row.symbol} на {row.exchange} по цене {row.price}\n"
+        notifier.notify(TELEGRAM_CHAT_ID, text, key=f"{row.exchange}:{row.symbol}", reply_markup=very_simple_keyboard())
+
+    async def _load_open_orders(self):
+        """Открытые ордера из прошлых запусков — чтобы сверка довела их статус до конца."""
+        async with AsyncSessionLocal() as session:
+            for row in await DBManager(session).get_orders(status="open", limit=1000):
+                if row.order_id:
+                    self._open[row.id] = {"exchange": row.exchange, "symbol": row.symbol, "side": row.side,
+                                          "order_id": row.order_id}
+
+    async def _reconcile(self):
+        """Сверяет открытые ордера с биржей: исполненные и отменённые обновляются в БД."""
+        row_ids = list(self._open)
+        results = await asyncio.gather(
+            *(self.order_manager.fetch_order(self._open[i]["exchange"], self._open[i]["symbol"], self._open[i]["order_id"])
+              for i in row_ids),
+            return_exceptions=True,
+        )
+        changed = {}
+        for row_id, order in zip(row_ids, results):
+            if isinstance(order, Exception):
+                logging.warning(f"Не удалось проверить ордер {self._open[row_id]['order_id']}: {order!r}")
+            elif order.get("status") in TERMINAL_STATUSES:
+                changed[row_id] = TERMINAL_STATUSES[order["status"]]
+        if not changed:
+            return
+
+        # Статусы и учёт меняются одной транзакцией; при ошибке ордера остаются в _open до следующей сверки
+        async with AsyncSessionLocal() as session:
+            closed = await portfolio_ledger.apply_late_orders(DBManager(session), changed)
+        positions_report.invalidate()
+
+        for row_id, status in changed.items():
+            intent = self._open.pop(row_id)
+            orders.labels(intent["exchange"], intent["side"], status).inc()
+            if status == "closed":
+                self.filled += 1
+            else:
+                self.failed += 1
+        for row in closed:
+            self._notify_fill(row)
+
+    def stats(self) -> dict:
+        queued = sum(queue.qsize() for queues in self._queues.values() for queue in queues)
+        executed = self.submitted - queued
+        return {
+            "submitted": self.submitted, "duplicates": self.duplicates, "dropped": self.dropped,
+            "queued": queued, "open": len(self._open), "filled": self.filled, "failed": self.failed,
+            "latency_avg": self.latency_total / executed if executed > 0 else 0.0, "latency_max": self.latency_max,
+        }
+
+    async def close(self, timeout: float = 10):
+        """Дожидается отправки и записи уже принятых ордеров (не дольше timeout) и останавливает задачи."""
+        if self._recorder is None:
+            return
+
+        async def drain():
+            for queues in self._queues.values():
+                for queue in queues:
+                    await queue.join()
+            await self._fills.join()
+
+        try:
+            await asyncio.wait_for(drain(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Ордера не дописаны при остановке: {self.stats()}")
+        for task in self._tasks + [self._recorder]:
+            task.cancel()
+        self._tasks = []
+        self._queues = {}
+        self._recorder = None
+
+
+# Общий на процесс конвейер ордеров
+order_pipeline = OrderPipeline()
+queue_depth.labels("orders").set_function(lambda: order_pipeline.stats()["queued"])
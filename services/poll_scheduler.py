@@ -0,0 +1,165 @@
+import logging
+import math
+
+import numpy as np
+
+from services.metrics import poll_overruns, poll_request_rate
+from tgbot.config import POLL_INTERVAL, POLL_ADAPTIVE, POLL_MIN_INTERVAL, POLL_MAX_INTERVAL, POLL_REQUEST_BUDGET
+
+VOLATILITY_ALPHA = 0.1  # Вес нового наблюдения в скользящей (EWMA) оценке волатильности пары
+HIT_FRACTION = 0.25  # Интервал пары — такая доля ожидаемого времени, за которое цена дойдёт до порога стратегии
+
+
+class _ExchangeSchedule:
+    """Состояние расписания пар одной биржи: колонки NumPy по строке на пару."""
+
+    def __init__(self, symbols: list[str], bulk: bool, level: int):
+        self.symbols = list(symbols)
+        self.rows = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.bulk = bulk  # Один запрос fetch_tickers на все пары, иначе запрос на каждую пару
+        n = len(self.symbols)
+        self.level = np.full(n, level, dtype=np.int64)  # Интервал пары — tick * 2 ** level
+        self.taken_tick = np.zeros(n, dtype=np.int64)  # Тик последнего опроса
+        self.next_tick = np.zeros(n, dtype=np.int64)  # Тик следующего опроса
+        self.last_price = np.full(n, np.nan)
+        self.last_time = np.full(n, np.nan)
+        self.variance = np.full(n, np.nan)  # EWMA квадрата лог-доходности в секунду
+        self.requests = 0
+        self.overruns = 0
+
+    def reschedule(self, rows: np.ndarray):
+        """Следующий опрос — ближайший после последнего тик, кратный интервалу (сетка общая для всех пар)."""
+        period = np.left_shift(1, self.level[rows])
+        self.next_tick[rows] = (self.taken_tick[rows] // period + 1) * period
+
+    def request_rate(self, tick: float) -> float:
+        """Запросов в секунду при текущих интервалах."""
+        if not len(self.symbols):
+            return 0.0
+        if self.bulk:
+            # Сроки выровнены по сетке: запрос самой частой пары забирает и все остальные
+            return 1 / (tick * 2.0 ** int(self.level.min()))
+        return float((1 / (tick * np.exp2(self.level))).sum())
+
+
+class PollScheduler:
+    """
+    Расписание опроса бирж на часах с постоянным шагом tick: тик k начинается в start + k * tick
+    независимо от того, сколько длились предыдущие, поэтому период не растёт на время опроса.
+
+    Без adaptive каждая пара опрашивается на каждом тике с шагом POLL_INTERVAL. С adaptive у каждой
+    пары свой интервал tick * 2^level от min_interval до max_interval. Чем выше волатильность пары
+    и чем ближе цена к порогу стратегии, тем интервал короче. Интервалы — степени двойки от шага, а
+    сроки выровнены по общей сетке, поэтому пары биржи с fetch_tickers уходят одним запросом, и редкие
+    пары запросов не добавляют. Если прогноз запросов превышает budget в минуту, самые частые интервалы
+    удваиваются, пока прогноз не уложится в бюджет.
+    """
+
+    def __init__(self, tracking: dict[str, list[str]], bulk: dict[str, bool] = None, adaptive: bool = POLL_ADAPTIVE,
+                 interval: float = POLL_INTERVAL, min_interval: float = POLL_MIN_INTERVAL,
+                 max_interval: float = POLL_MAX_INTERVAL, budget: float = POLL_REQUEST_BUDGET):
+        bulk = bulk or {}
+        self.adaptive = adaptive
+        if adaptive:
+            # Шаг подбирается так, чтобы POLL_INTERVAL (интервал пары без оценки) лежал на сетке
+            self.base_level = max(0, round(math.log2(interval / min_interval)))
+            self.tick = interval / 2 ** self.base_level
+            self.max_level = self.base_level + max(0, math.floor(math.log2(max_interval / interval)))
+        else:
+            self.base_level = self.max_level = 0
+            self.tick = interval
+        self.budget = budget / 60  # Запросов в секунду, 0 — без ограничения
+        self.exchanges = {name: _ExchangeSchedule(symbols, bulk.get(name, True), self.base_level)
+                          for name, symbols in tracking.items()}
+        self._over_budget = False
+        poll_request_rate.set_function(lambda: self.request_rate() * 60)
+
+    def take_due(self, exchange: str, tick: int) -> list[str]:
+        """Пары биржи, которым пора на тике tick; их следующий опрос сразу переносится по интервалу."""
+        schedule = self.exchanges[exchange]
+        rows = np.flatnonzero(schedule.next_tick <= tick)
+        if not len(rows):
+            return []
+        schedule.taken_tick[rows] = tick
+        schedule.reschedule(rows)
+        schedule.requests += 1 if schedule.bulk else len(rows)
+        return [schedule.symbols[i] for i in rows]
+
+    def overrun(self, exchange: str):
+        """Тик пропущен: предыдущий опрос биржи ещё не завершён; её пары ждут следующего тика."""
+        self.exchanges[exchange].overruns += 1
+        poll_overruns.labels(exchange).inc()
+
+    def observe(self, exchange: str, symbols: list[str], prices: np.ndarray, distances: np.ndarray, now: float):
+        """
+        Новые цены пар: обновляет оценку волатильности и интервалы опроса.
+
+        :param distances: Сколько процентов цены каждой паре до ближайшего порога стратегии (inf — неизвестно)
+        :param now: time.monotonic() получения цен
+        """
+        schedule = self.exchanges[exchange]
+        rows = np.fromiter((schedule.rows[s] for s in symbols), dtype=np.int64, count=len(symbols))
+        prices = np.asarray(prices, dtype=np.float64)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            elapsed = now - schedule.last_time[rows]
+            squared = np.log(prices / schedule.last_price[rows]) ** 2 / elapsed
+        variance = schedule.variance[rows]
+        fresh = np.isfinite(squared) & (elapsed > 0)
+        variance = np.where(fresh & np.isnan(variance), squared,
+                            np.where(fresh, variance + VOLATILITY_ALPHA * (squared - variance), variance))
+        schedule.variance[rows] = variance
+        schedule.last_price[rows] = prices
+        schedule.last_time[rows] = now
+        if not self.adaptive:
+            return
+
+        # Цена проходит d (доля) в среднем за (d / σ)² секунд, σ² — дисперсия лог-доходности в секунду
+        with np.errstate(divide="ignore", invalid="ignore"):
+            expected = (np.asarray(distances, dtype=np.float64) / 100) ** 2 / variance
+            level = np.floor(np.log2(HIT_FRACTION * expected / self.tick))
+        # Неподвижная пара (σ = 0) — реже всего, цена на пороге (d = 0) — чаще всего
+        level = np.clip(np.nan_to_num(level, nan=0, posinf=self.max_level, neginf=0), 0, self.max_level)
+        known = np.isfinite(distances) & ~np.isnan(variance)
+        schedule.level[rows] = np.where(known, level, self.base_level)
+        schedule.reschedule(rows)
+        self._fit_budget()
+
+    def _fit_budget(self):
+        """Удваивает самые частые интервалы на самой дорогой бирже, пока прогноз не уложится в бюджет."""
+        if not self.budget:
+            return
+        while True:
+            rates = {name: s.request_rate(self.tick) for name, s in self.exchanges.items()}
+            if sum(rates.values()) <= self.budget:
+                self._over_budget = False
+                return
+            slower = [name for name, s in self.exchanges.items()
+                      if len(s.symbols) and s.level.min() < self.max_level]
+            if not slower:
+                if not self._over_budget:
+                    logging.warning(f"Опрос не укладывается в бюджет {self.budget * 60:g} запросов/мин "
+                                    f"даже с максимальными интервалами")
+                    self._over_budget = True
+                return
+            schedule = self.exchanges[max(slower, key=rates.get)]
+            rows = np.flatnonzero(schedule.level == schedule.level.min())
+            schedule.level[rows] += 1
+            schedule.reschedule(rows)
+
+    def request_rate(self) -> float:
+        """Прогноз запросов в секунду по всем биржам."""
+        return sum(s.request_rate(self.tick) for s in self.exchanges.values())
+
+    def report(self) -> str:
+        """Строка для журнала: интервалы, запросы и пропуски по биржам с прошлого отчёта."""
+        parts = []
+        for name, schedule in self.exchanges.items():
+            if not len(schedule.symbols):
+                continue
+            intervals = self.tick * np.exp2(schedule.level)
+            parts.append(f"{name}: интервалы {intervals.min():g}–{intervals.max():g} сек "
+                         f"(медиана {np.median(intervals):g}), запросов {schedule.requests}, "
+                         f"пропусков {schedule.overruns}")
+            schedule.requests = schedule.overruns = 0
+        return f"Опрос: ~{self.request_rate() * 60:.1f} запросов/мин; " + "; ".join(parts)
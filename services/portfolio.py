@@ -1,37 +1,30 @@
+import logging
+
 from sqlalchemy import select
 
 from db.sqlite_module import DBManager, Order
 
 
-async def calculate_balance_from_orders(
-    db: DBManager,
-    current_prices: dict[str, float],
-    initial_cash: float = 1000.0
-) -> tuple[float, float, dict, float, float]:
+class PortfolioState:
     """
-    Подсчёт кэша, полной стоимости, портфеля, нереализованного и реализованного PnL.
+    Кэш, позиции и реализованный PnL, к которым сделки применяются по одной.
 
-    :return: (cash, total_equity, portfolio, unrealized_pnl, realized_pnl)
+    Логика совпадает с пересчётом calculate_balance_from_orders: покупка усредняет лонг
+    или закрывает шорт, продажа закрывает лонг или открывает/расширяет шорт.
     """
-    cash = initial_cash
-    commission_rate = 0.001
-    portfolio = {}
-    realized_pnl = 0.0
 
-    orders = await db.session.execute(
-        select(Order).where(Order.status == "closed").order_by(Order.created_at)
-    )
-    orders = orders.scalars().all()
+    def __init__(self, initial_cash: float = 1000.0, commission_rate: float = 0.001):
+        self.cash = initial_cash
+        self.commission_rate = commission_rate
+        self.portfolio: dict[str, dict] = {}  # {symbol: {"amount": float, "avg_price": float}}
+        self.realized_pnl = 0.0
 
-    for order in orders:
-        symbol = order.symbol
-        price = order.price or 0.0
-        amount = order.amount
-        side = order.side
+    def apply_fill(self, side: str, symbol: str, price: float, amount: float):
+        portfolio = self.portfolio
 
         if side == "buy":
-            cost = price * (1 + commission_rate) * amount
-            cash -= cost
+            cost = price * (1 + self.commission_rate) * amount
+            self.cash -= cost
 
             if symbol not in portfolio:
                 portfolio[symbol] = {"amount": amount, "avg_price": price}
@@ -47,7 +40,7 @@ async def calculate_balance_from_orders(
                     # Покупка закрывает шорт
                     closing_amount = min(amount, abs(pos["amount"]))
                     pnl = (pos["avg_price"] - price) * closing_amount
-                    realized_pnl += pnl
+                    self.realized_pnl += pnl
                     pos["amount"] += amount  # меньше отрицательное значение
 
                     if pos["amount"] > 0:
@@ -57,8 +50,8 @@ async def calculate_balance_from_orders(
                         del portfolio[symbol]
 
         elif side == "sell":
-            revenue = price * (1 - commission_rate) * amount
-            cash += revenue
+            revenue = price * (1 - self.commission_rate) * amount
+            self.cash += revenue
 
             if symbol not in portfolio:
                 # Новый шорт
@@ -69,7 +62,7 @@ async def calculate_balance_from_orders(
                     # Продажа закрывает лонг
                     closing_amount = min(amount, pos["amount"])
                     pnl = (price - pos["avg_price"]) * closing_amount
-                    realized_pnl += pnl
+                    self.realized_pnl += pnl
                     pos["amount"] -= amount
 
                     if pos["amount"] < 0:
@@ -86,24 +79,176 @@ async def calculate_balance_from_orders(
                     pos["amount"] -= amount
                     pos["avg_price"] = avg_price
 
-    # Подсчёт нереализованного PnL и стоимости портфеля
-    unrealized_pnl = 0.0
-    portfolio_value = 0.0
+    def valuation(self, current_prices: dict[str, float]) -> tuple[float, float, dict, float, float]:
+        """
+        Оценка портфеля по текущим ценам.
 
-    for symbol, pos in portfolio.items():
-        current_price = current_prices.get(symbol)
-        if current_price is None:
-            continue
+        :return: (cash, total_equity, portfolio, unrealized_pnl, realized_pnl)
+        """
+        unrealized_pnl = 0.0
+        portfolio_value = 0.0
 
-        amt = pos["amount"]
-        avg_price = pos["avg_price"]
-        portfolio_value += amt * current_price
+        for symbol, pos in self.portfolio.items():
+            current_price = current_prices.get(symbol)
+            if current_price is None:
+                continue
 
-        if amt > 0:
-            unrealized_pnl += (current_price - avg_price) * amt
-        else:
-            unrealized_pnl += (avg_price - current_price) * abs(amt)
+            amt = pos["amount"]
+            avg_price = pos["avg_price"]
+            portfolio_value += amt * current_price
+
+            if amt > 0:
+                unrealized_pnl += (current_price - avg_price) * amt
+            else:
+                unrealized_pnl += (avg_price - current_price) * abs(amt)
+
+        total_equity = self.cash + portfolio_value
 
-    total_equity = cash + portfolio_value
+        return self.cash, total_equity, self.portfolio, unrealized_pnl, self.realized_pnl
 
-    return cash, total_equity, portfolio, unrealized_pnl, realized_pnl
+
+async def calculate_balance_from_orders(
+    db: DBManager,
+    current_prices: dict[str, float],
+    initial_cash: float = 1000.0
+) -> tuple[float, float, dict, float, float]:
+    """
+    Подсчёт кэша, полной стоимости, портфеля, нереализованного и реализованного PnL.
+
+    :return: (cash, total_equity, portfolio, unrealized_pnl, realized_pnl)
+    """
+    state = PortfolioState(initial_cash)
+
+    orders = await db.session.execute(
+        select(Order).where(Order.status == "closed").order_by(Order.created_at)
+    )
+    orders = orders.scalars().all()
+
+    for order in orders:
+        state.apply_fill(order.side, order.symbol, order.price or 0.0, order.amount)
+
+    return state.valuation(current_prices)
+
+
+class PortfolioLedger:
+    """
+    Персистентный учёт портфеля: каждая закрытая сделка применяется к кэшу, позициям
+    и реализованному PnL по одной и сохраняется в ledger_state/ledger_positions.
+
+    Полный пересчёт по таблице orders нужен только при холодном старте (учёта ещё нет
+    или он сброшен); иначе догоняются лишь ордера с id больше последнего учтённого.
+    """
+
+    def __init__(self, initial_cash: float = 1000.0):
+        self.initial_cash = initial_cash
+        self.state = PortfolioState(initial_cash)
+        self.last_order_id = 0
+        self.loaded = False
+
+    async def load(self, db: DBManager):
+        stored, positions = await db.get_ledger()
+        if stored is None:
+            self.state = PortfolioState(self.initial_cash)
+            self.last_order_id = 0
+            logging.info("Учёт портфеля не найден — пересчитываем по таблице orders")
+        else:
+            self.initial_cash = stored.initial_cash
+            self.state = PortfolioState(stored.initial_cash)
+            self.state.cash = stored.cash
+            self.state.realized_pnl = stored.realized_pnl
+            self.state.portfolio = {s: {"amount": a, "avg_price": p} for s, (a, p) in positions.items()}
+            self.last_order_id = stored.last_order_id or 0
+
+        missed = await self._catch_up(db)
+        if missed or stored is None:
+            touched = {order.symbol for order in missed}
+            if stored is None:
+                touched |= set(positions)  # Осиротевшие строки позиций без итоговой записи
+            await self._save(db, {symbol: self._position(symbol) for symbol in touched})
+            logging.info(f"Учёт портфеля: применено {len(missed)} ордеров")
+        self.loaded = True
+
+    async def apply_order(self, db: DBManager, order: Order):
+        """Применяет только что записанный закрытый ордер и сохраняет изменения."""
+        if not self.loaded:
+            await self.load(db)
+        if order.status != "closed" or order.id <= self.last_order_id:
+            return
+        self.state.apply_fill(order.side, order.symbol, order.price or 0.0, order.amount)
+        self.last_order_id = order.id
+        await self._save(db, {order.symbol: self._position(order.symbol)})
+
+    async def apply_orders(self, db: DBManager, orders: list[Order]):
+        """Как apply_order для пачки ордеров (по возрастанию id), с одним сохранением учёта."""
+        if not self.loaded:
+            await self.load(db)
+        touched = set()
+        for order in orders:
+            if order.status != "closed" or order.id <= self.last_order_id:
+                continue
+            self.state.apply_fill(order.side, order.symbol, order.price or 0.0, order.amount)
+            self.last_order_id = order.id
+            touched.add(order.symbol)
+        if touched:
+            await self._save(db, {symbol: self._position(symbol) for symbol in touched})
+
+    async def apply_late_orders(self, db: DBManager, statuses: dict[int, str]) -> list[Order]:
+        """
+        Ордера, записанные открытыми и завершённые позже (сверка с биржей).
+
+        Смена статуса и учёт исполнения сохраняются одной транзакцией, а переводятся только ордера,
+        ещё открытые в БД, поэтому повтор после сбоя не учтёт исполнение дважды. Исполненные с id
+        не больше last_order_id применяются здесь (догонка их уже не увидит), остальные — догонкой
+        по таблице orders, как при load().
+
+        :param statuses: {id строки orders: "closed" | "canceled"}
+        :return: Строки, которые перешли из open в closed
+        """
+        if not self.loaded:
+            await self.load(db)
+        rows = [row for row in await db.get_orders_by_ids(list(statuses)) if row.status == "open"]
+        if not rows:
+            return []
+        closed = [row for row in rows if statuses[row.id] == "closed"]
+        touched = set()
+        for row in closed:
+            if row.id <= self.last_order_id:
+                self.state.apply_fill(row.side, row.symbol, row.price or 0.0, row.amount)
+                touched.add(row.symbol)
+        await self._save(db, {symbol: self._position(symbol) for symbol in touched},
+                         statuses={row.id: statuses[row.id] for row in rows})
+
+        missed = await self._catch_up(db)
+        if missed:
+            await self._save(db, {order.symbol: self._position(order.symbol) for order in missed})
+        return closed
+
+    def balance(self, current_prices: dict[str, float]) -> tuple[float, float, dict, float, float]:
+        """(cash, total_equity, portfolio, unrealized_pnl, realized_pnl) за O(число позиций)."""
+        return self.state.valuation(current_prices)
+
+    def _position(self, symbol: str) -> tuple[float, float] | None:
+        pos = self.state.portfolio.get(symbol)
+        return (pos["amount"], pos["avg_price"]) if pos else None
+
+    async def _catch_up(self, db: DBManager) -> list[Order]:
+        """Применяет закрытые ордера с id больше last_order_id (пропущенные или исполненные позже)."""
+        missed = await db.get_closed_orders_after(self.last_order_id)
+        for order in missed:
+            self.state.apply_fill(order.side, order.symbol, order.price or 0.0, order.amount)
+            self.last_order_id = max(self.last_order_id, order.id)
+        return missed
+
+    async def _save(self, db: DBManager, positions: dict[str, tuple[float, float] | None],
+                    statuses: dict[int, str] = None):
+        try:
+            await db.save_ledger(self.initial_cash, self.state.cash, self.state.realized_pnl,
+                                 self.last_order_id, positions, statuses)
+        except Exception:
+            # Память опередила сохранённый учёт: при следующем обращении он перечитывается из БД и догоняется
+            self.loaded = False
+            raise
+
+
+# Общий на процесс учёт портфеля для живого мониторинга
+portfolio_ledger = PortfolioLedger()
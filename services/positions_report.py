@@ -0,0 +1,178 @@
+import asyncio
+import time
+
+from db.sqlite_module import AsyncSessionLocal, DBManager
+from exchanges.ccxt_client import get_exchange_manager
+from services.portfolio import portfolio_ledger
+from services.price_cache import price_cache
+from tgbot.config import REPORT_CACHE_TTL, REPORT_PRICE_MAX_AGE, TRACKING
+
+CHUNK_LIMIT = 2000  # Длина одного сообщения отчёта
+
+
+class PositionsReport:
+    """
+    Отчёт «Ваши последние позиции» для бота: один построитель для кнопки и текстовых сообщений.
+
+    Цены берутся из кэша мониторинга, если они свежее price_max_age, остальные запрашиваются
+    одновременно (bulk по биржам, затем параллельно по оставшимся парам). Одновременные запросы
+    ждут одно и то же построение, а готовый отчёт отдаётся повторно в течение cache_ttl секунд.
+    Итог портфеля (кэш, активы, PnL) берётся из учёта portfolio_ledger, без пересчёта ордеров.
+    """
+
+    def __init__(self, cache_ttl: float = REPORT_CACHE_TTL, price_max_age: float = REPORT_PRICE_MAX_AGE,
+                 commission_rate: float = 0.001):
+        self.cache_ttl = cache_ttl
+        self.price_max_age = price_max_age
+        self.commission_rate = commission_rate
+        self._parts: list[str] | None = None
+        self._built_at = 0.0
+        self._generation = 0  # Увеличивается при invalidate(): результат устаревшего построения не кэшируется
+        self._building: asyncio.Task | None = None
+
+    def invalidate(self):
+        """Сбрасывает готовый отчёт (например, после нового ордера)."""
+        self._parts = None
+        self._generation += 1
+
+    async def get(self) -> list[str]:
+        """Части отчёта (HTML) для отправки по порядку."""
+        if self._parts is not None and time.monotonic() - self._built_at <= self.cache_ttl:
+            return self._parts
+        if self._building is None or self._building.done():
+            self._building = asyncio.create_task(self._build_and_store(self._generation))
+        # shield: отмена одного ожидающего (пользователь ушёл) не отменяет построение для остальных
+        return await asyncio.shield(self._building)
+
+    async def _build_and_store(self, generation: int) -> list[str]:
+        async with AsyncSessionLocal() as session:
+            db = DBManager(session)
+            orders = await db.get_orders()
+            if not portfolio_ledger.loaded:
+                await portfolio_ledger.load(db)
+        parts = await self.build(orders)
+        if generation == self._generation:
+            self._parts = parts
+            self._built_at = time.monotonic()
+        return parts
+
+    async def price_pairs(self, pairs: list[tuple[str, str]]) -> dict[tuple[str, str], float]:
+        """Цены всех различных пар: свежие — из кэша, остальные — одновременными запросами к биржам."""
+        prices = {}
+        missing = []
+        for exchange, symbol in dict.fromkeys(pairs):
+            price = price_cache.get_fresh_price(exchange, symbol, self.price_max_age)
+            if price is None:
+                missing.append((exchange, symbol))
+            else:
+                prices[(exchange, symbol)] = price
+        if not missing:
+            return prices
+
+        ex_manager = get_exchange_manager()
+        prices.update(await ex_manager.fetch_prices(missing))
+        rest = [key for key in missing if prices.get(key) is None]
+        if rest:
+            results = await asyncio.gather(*(ex_manager.fetch_price(exchange, symbol) for exchange, symbol in rest),
+                                           return_exceptions=True)
+            for key, price in zip(rest, results):
+                if price is not None and not isinstance(price, Exception):
+                    prices[key] = price
+        return prices
+
+    async def build(self, orders) -> list[str]:
+        if not orders:
+            return ["У вас нет открытых позиций."]
+
+        ledger_pairs = self.ledger_pairs(orders)
+        prices = await self.price_pairs([(o.exchange, o.symbol) for o in orders] + ledger_pairs)
+        commission_rate = self.commission_rate
+        total_profit = 0.0
+        total_value = 0.0
+        text_parts = []
+        current_chunk = "<b>📊 Ваши последние позиции:</b>\n\n"
+
+        for o in orders:
+            current_price = prices.get((o.exchange, o.symbol))
+            if current_price is None:
+                block = (
+                    f"<b>⚪️</b> <code>{o.symbol}</code> на <b>{o.exchange.capitalize()}</b>\n"
+                    f"<b>Кол-во:</b> <code>{o.amount}</code> @ <b>{o.price}</b>\n"
+                    f"<b>Текущая цена:</b> <i>недоступна</i>\n\n"
+                )
+            else:
+                value = current_price * o.amount
+                total_value += value
+
+                if o.side == "buy" and o.price is not None:
+                    profit = (current_price - o.price) * o.amount
+                    commission = (o.price * o.amount + current_price * o.amount) * commission_rate
+                    side_icon = "🟢 Лонг"
+                elif o.side == "sell" and o.price is not None:
+                    profit = (o.price - current_price) * o.amount
+                    commission = (o.price * o.amount + current_price * o.amount) * commission_rate
+                    side_icon = "🔴 Шорт"
+                else:
+                    profit = 0
+                    commission = 0
+                    side_icon = "⚪️"
+
+                net_profit = profit - commission
+                total_profit += net_profit
+                status_icon = "🟢" if o.status == "emulated" else "⚪️"
+                date_str = o.created_at.strftime("%Y-%m-%d %H:%M") if getattr(o, "created_at", None) else "—"
+                strategy = o.strategy or "—"
+                order_type = o.order_type or "—"
+
+                block = (
+                    f"<b>{side_icon}</b> <code>{o.symbol}</code> на <b>{o.exchange.capitalize()}</b>\n"
+                    f"<b>Стратегия:</b> <i>{strategy}</i>\n"
+                    f"<b>Тип:</b> <i>{order_type}</i> | <b>Статус:</b> <i>{o.status}</i> {status_icon}\n"
+                    f"<b>Кол-во:</b> <code>{o.amount}</code> @ <b>{o.price}</b>\n"
+                    f"<b>Дата:</b> <i>{date_str}</i>\n"
+                    f"<b>Текущая цена:</b> <code>{current_price}</code>\n"
+                    f"<b>Стоимость позиции:</b> <b>{value:.4f} USDT</b>\n"
+                    f"<b>Прибыль (без комиссии):</b> <b>{profit:.4f} USDT</b>\n"
+                    f"<b>Комиссия:</b> <b>{commission:.4f} USDT</b>\n"
+                    f"<b>Чистая прибыль:</b> <b>{net_profit:.4f} USDT</b>\n\n"
+                )
+
+            if len(current_chunk) + len(block) > CHUNK_LIMIT:
+                text_parts.append(current_chunk)
+                current_chunk = block
+            else:
+                current_chunk += block
+
+        # Завершающий блок
+        current_chunk += (
+            f"<b>💰 Общая чистая прибыль: <u>{total_profit:.4f} USDT</u></b>\n"
+            f"<b>📦 Общая стоимость позиций: <u>{total_value:.4f} USDT</u></b>"
+        )
+        if portfolio_ledger.loaded:
+            cash, equity, _, unrealized, realized = portfolio_ledger.balance(
+                {symbol: prices[(exchange, symbol)] for exchange, symbol in ledger_pairs
+                 if prices.get((exchange, symbol)) is not None}
+            )
+            current_chunk += (
+                f"\n\n<b>🏦 Портфель:</b> кэш <b>{cash:.2f} USDT</b>, активы <b>{equity:.2f} USDT</b>\n"
+                f"<b>Нереализованный PnL:</b> <b>{unrealized:.2f} USDT</b> | "
+                f"<b>Реализованный PnL:</b> <b>{realized:.2f} USDT</b>"
+            )
+        text_parts.append(current_chunk)
+        return text_parts
+
+    @staticmethod
+    def ledger_pairs(orders) -> list[tuple[str, str]]:
+        """Биржа для оценки каждой позиции учёта: из последних ордеров по паре, иначе первая из TRACKING."""
+        exchanges = {o.symbol: o.exchange for o in reversed(orders)}
+        pairs = []
+        for symbol in portfolio_ledger.state.portfolio:
+            exchange = exchanges.get(symbol) or next((name for name, symbols in TRACKING.items()
+                                                      if symbol in symbols), None)
+            if exchange is not None:
+                pairs.append((exchange, symbol))
+        return pairs
+
+
+# Общий на процесс построитель отчёта по позициям
+positions_report = PositionsReport()
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import time
+
+from db.sqlite_module import AsyncSessionLocal, DBManager
+from tgbot.config import PRICE_FLUSH_INTERVAL, PRICE_FLUSH_ON_EXIT
+
+
+class PriceCache:
+    """
+    Последние цены и объёмы в памяти с отложенной записью в price_entries.
+
+    Чтение и запись на каждом тике идут только в память. Изменённые пары
+    сбрасываются в БД одной транзакцией раз в flush_interval секунд и при остановке.
+    Несброшенные изменения (не больше flush_interval) теряются при аварийном завершении.
+    """
+
+    def __init__(self, flush_interval: float = PRICE_FLUSH_INTERVAL, flush_on_exit: bool = PRICE_FLUSH_ON_EXIT,
+                 persist: bool = True):
+        """
+        :param flush_interval: Период сброса изменённых цен в БД, сек
+        :param flush_on_exit: Сбрасывать ли несохранённые цены в close()
+        :param persist: False — только память (для бэктестов), БД не используется вовсе
+        """
+        self.flush_interval = flush_interval
+        self.flush_on_exit = flush_on_exit
+        self.persist = persist
+        self.prices: dict[tuple[str, str], tuple[float, float]] = {}  # {(exchange, symbol): (price, volume)}
+        self.updated: dict[tuple[str, str], float] = {}  # time.monotonic() последнего save_price (загруженные из БД — нет)
+        self._dirty: set[tuple[str, str]] = set()
+        self._flusher: asyncio.Task | None = None
+        self._flush_lock = asyncio.Lock()
+
+    async def start(self):
+        """Загружает сохранённые цены и запускает фоновый сброс. Повторный вызов ничего не делает."""
+        if not self.persist or self._flusher is not None:
+            return
+        async with AsyncSessionLocal() as session:
+            stored = await DBManager(session).get_all_prices()
+        for key, value in stored.items():
+            self.prices.setdefault(key, value)
+        self._flusher = asyncio.create_task(self._run_flusher())
+        logging.info(f"Кэш цен загружен: {len(stored)} пар, сброс каждые {self.flush_interval} сек")
+
+    def get_last_price(self, exchange: str, symbol: str) -> float | None:
+        entry = self.prices.get((exchange, symbol))
+        return entry[0] if entry else None
+
+    def get_volume(self, exchange: str, symbol: str) -> float | None:
+        entry = self.prices.get((exchange, symbol))
+        return entry[1] if entry else None
+
+    def get_fresh_price(self, exchange: str, symbol: str, max_age: float) -> float | None:
+        """Последняя цена, если она получена не раньше max_age секунд назад, иначе None."""
+        key = (exchange, symbol)
+        updated = self.updated.get(key)
+        if updated is None or time.monotonic() - updated > max_age:
+            return None
+        return self.prices[key][0]
+
+    def save_price(self, exchange: str, symbol: str, price: float, volume: float):
+        key = (exchange, symbol)
+        self.prices[key] = (price, volume)
+        self.updated[key] = time.monotonic()
+        if self.persist:
+            self._dirty.add(key)
+
+    async def flush(self) -> int:
+        """Сбрасывает изменённые с прошлого сброса цены одной транзакцией."""
+        if not self.persist:
+            return 0
+        async with self._flush_lock:
+            if not self._dirty:
+                return 0
+            dirty, self._dirty = self._dirty, set()
+            batch = {key: self.prices[key] for key in dirty}
+            try:
+                async with AsyncSessionLocal() as session:
+                    return await DBManager(session).save_prices_bulk(batch)
+            except Exception:
+                # Вернём пары в очередь, чтобы записать их в следующий раз
+                self._dirty |= dirty
+                raise
+
+    async def _run_flusher(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Ошибка сброса кэша цен: {e!r}")
+
+    async def close(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        if self.flush_on_exit:
+            await self.flush()
+
+
+# Общий на процесс кэш цен для мониторинга и бота
+price_cache = PriceCache()
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+import numpy as np
+
+from db.sqlite_module import AsyncSessionLocal, DBManager
+from services.metrics import queue_depth, ticks_dropped
+from tgbot.config import PRICE_FLUSH_INTERVAL, TICK_RETENTION_HOURS, BAR_1M_RETENTION_DAYS, HISTORY_ROLLUP_INTERVAL, \
+    TICK_BUFFER_MAX
+
+
+class TickRecorder:
+    """
+    Буферизованная запись тиков в price_ticks и периодическая свёртка старой истории.
+
+    Тики копятся в памяти и пишутся пачкой (executemany) раз в flush_interval секунд.
+    Раз в rollup_interval тики старше TICK_RETENTION_HOURS сворачиваются в 1m-бары,
+    а 1m-бары старше BAR_1M_RETENTION_DAYS — в 1h-бары, так что таблицы не растут бесконечно.
+
+    Не записанная из-за ошибки пачка возвращается в буфер, но буфер не больше max_buffer тиков:
+    пока БД недоступна, отбрасываются самые старые (счётчик dropped и метрика ticks_dropped).
+    """
+
+    def __init__(self, flush_interval: float = PRICE_FLUSH_INTERVAL, rollup_interval: float = HISTORY_ROLLUP_INTERVAL,
+                 max_buffer: int = TICK_BUFFER_MAX):
+        self.flush_interval = flush_interval
+        self.rollup_interval = rollup_interval
+        self.max_buffer = max_buffer
+        self._buffer: deque[tuple[str, str, int, float, float]] = deque(maxlen=max_buffer)
+        self._tasks: list[asyncio.Task] = []
+        self.dropped = 0
+
+    def record(self, exchange: str, symbol: str, price: float, volume: float, ts: int = None):
+        """Добавляет тик в буфер. ts — мс (по умолчанию текущее время)."""
+        if len(self._buffer) == self.max_buffer:
+            self._dropped(1)  # deque сам вытеснит самый старый
+        self._buffer.append((exchange, symbol, ts if ts is not None else int(time.time() * 1000), price, volume))
+
+    async def flush(self) -> int:
+        if not self._buffer:
+            return 0
+        batch = list(self._buffer)
+        self._buffer.clear()
+        try:
+            async with AsyncSessionLocal() as session:
+                return await DBManager(session).save_ticks(batch)
+        except Exception:
+            # Пачка — перед тиками, пришедшими во время записи; сверх max_buffer остаются самые новые
+            merged = deque(batch, maxlen=self.max_buffer)
+            merged.extend(self._buffer)
+            self._dropped(len(batch) + len(self._buffer) - len(merged))
+            self._buffer = merged
+            raise
+
+    def _dropped(self, n: int):
+        if not n:
+            return
+        if not self.dropped:
+            logging.warning(f"Буфер тиков переполнен ({self.max_buffer}), старые тики отбрасываются")
+        self.dropped += n
+        ticks_dropped.inc(n)
+
+    async def rollup(self):
+        now_ms = int(time.time() * 1000)
+        async with AsyncSessionLocal() as session:
+            db = DBManager(session)
+            minute_bars = await db.rollup_history("1m", now_ms - int(TICK_RETENTION_HOURS * 3_600_000))
+            hour_bars = await db.rollup_history("1h", now_ms - int(BAR_1M_RETENTION_DAYS * 86_400_000), source="1m")
+        logging.info(f"Свёртка истории: {minute_bars} баров 1m, {hour_bars} баров 1h")
+
+    def start(self):
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._periodic(self.flush, self.flush_interval, "записи тиков")),
+            asyncio.create_task(self._periodic(self.rollup, self.rollup_interval, "свёртки истории")),
+        ]
+
+    async def _periodic(self, job, interval: float, name: str):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await job()
+            except Exception as e:
+                logging.error(f"Ошибка {name}: {e!r}")
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        await self.flush()
+
+
+async def load_recent_prices(db: DBManager, exchange: str, symbol: str, limit: int) -> np.ndarray:
+    """
+    Последние limit цен пары по сохранённой истории: закрытия 1m-баров, затем сырые тики.
+    Читается не больше limit строк: последние тики и, если их не хватает, недостающие бары.
+    """
+    if limit <= 0:
+        return np.empty(0)
+    _, tick_prices, _ = await db.get_ticks_range(exchange, symbol, limit=limit)
+    if len(tick_prices) >= limit:
+        return tick_prices
+    bars = await db.get_bars_range(exchange, symbol, "1m", limit=limit - len(tick_prices))
+    return np.concatenate((bars["close"], tick_prices))
+
+
+# Общий на процесс регистратор тиков
+tick_recorder = TickRecorder()
+queue_depth.labels("ticks").set_function(lambda: len(tick_recorder._buffer))
@@ -0,0 +1,178 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import signal
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+from tgbot.config import PROFILE_MODE, PROFILE_INTERVAL_MS, PROFILE_DIR, PROFILE_TOP
+
+
+class Profiler:
+    """
+    Профиль прогона по фазам (загрузка, стратегии, исполнение, запись в БД, отчёт). Включается PROFILE_MODE.
+
+    sample — выборочный: раз в interval_ms процессорного времени (SIGPROF) снимается стек главного
+    потока с префиксом «прогон;фаза». Дёшево, можно оставлять на всём прогоне; потоки и ожидание
+    ввода-вывода не попадают. Сигнал обрабатывается на границе вызова, поэтому короткие частые
+    функции (в том числе сам set_phase) получают чуть больше выборок, чем тратят.
+    cprofile — детерминированный cProfile отдельно на каждую фазу: точные числа вызовов и время,
+    но прогон медленнее в разы.
+
+    stop() пишет в output_dir файл collapsed stacks (flamegraph.pl, speedscope, inferno) и сводку:
+    время и доля по фазам и top-N функций. Фаза переключается через phase() (блок кода, со временем
+    по часам) или set_phase() (дёшево, для переключений внутри цикла по свечам).
+
+    Фаза одна на профиль, а не на задачу asyncio. В бэктесте и эмуляции код фаз выполняется по очереди,
+    и разбивка точная. В живом цикле опроса фазы переключают параллельные задачи poll_exchange и цикл
+    расписания: после любого await выполняется код другой задачи, а фаза остаётся последней
+    установленной. Поэтому там разбивка по фазам приблизительная, а точный ответ дают кадры стеков
+    внутри фазы.
+    """
+
+    def __init__(self, name: str, mode: str = PROFILE_MODE, interval_ms: float = PROFILE_INTERVAL_MS,
+                 output_dir: str = PROFILE_DIR, top: int = PROFILE_TOP):
+        if mode == "sample" and not hasattr(signal, "setitimer"):
+            logging.warning("Выборочный профиль недоступен на этой платформе, используется cprofile")
+            mode = "cprofile"
+        self.name = name
+        self.mode = mode
+        self.enabled = mode in ("sample", "cprofile")
+        self.interval = interval_ms / 1000
+        self.output_dir = output_dir
+        self.top = top
+        self.phase_name = "main"
+        self.stacks: Counter[str] = Counter()  # {"прогон;фаза;кадр;...;кадр": число выборок}
+        self.phase_seconds: Counter[str] = Counter()  # Время по часам в блоках phase()
+        self.merged: Counter[str] = Counter()  # Выборки других процессов (пишется из потока, отдельно от stacks)
+        self._profiles: dict[str, cProfile.Profile] = {}
+        self._active: cProfile.Profile | None = None
+        self._previous_handler = None
+        self._running = False
+
+    def start(self):
+        if not self.enabled or self._running:
+            return
+        self._running = True
+        if self.mode == "sample":
+            self._previous_handler = signal.signal(signal.SIGPROF, self._sample)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        else:
+            self._switch(self.phase_name)
+
+    def set_phase(self, name: str) -> str:
+        """Текущая фаза; возвращает предыдущую."""
+        previous = self.phase_name
+        if name != previous:
+            self.phase_name = name
+            if self._running and self.mode == "cprofile":
+                self._switch(name)
+        return previous
+
+    @contextmanager
+    def phase(self, name: str):
+        previous = self.set_phase(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phase_seconds[name] += time.perf_counter() - start
+            self.set_phase(previous)
+
+    def _switch(self, name: str):
+        if self._active is not None:
+            self._active.disable()
+        self._active = self._profiles.get(name)
+        if self._active is None:
+            self._active = self._profiles[name] = cProfile.Profile()
+        self._active.enable()
+
+    def _sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        stack.append(self.phase_name)
+        stack.append(self.name)
+        self.stacks[";".join(reversed(stack))] += 1
+
+    def merge(self, stacks: dict[str, int], phase: str):
+        """Добавляет выборки другого процесса (воркеры перебора): его фазы становятся кадрами под phase."""
+        for stack, count in stacks.items():
+            # Стек воркера начинается с его имени прогона — заменяем на своё
+            self.merged[f"{self.name};{phase};{stack.split(';', 1)[-1]}"] += count
+
+    def stop(self, write: bool = True) -> str | None:
+        """Останавливает профиль; при write — пишет отчёт и возвращает путь к файлу collapsed stacks."""
+        if not self._running:
+            return None
+        self._running = False
+        if self.mode == "sample":
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, self._previous_handler or signal.SIG_DFL)
+        elif self._active is not None:
+            self._active.disable()
+            self._active = None
+            self._collapse_profiles()
+        self.stacks.update(self.merged)
+        self.merged.clear()
+        if not write:
+            return None
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, f"{self.name}-{datetime.now():%Y%m%d-%H%M%S}")
+        with open(f"{base}.collapsed", "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        summary = self.summary()
+        with open(f"{base}.txt", "w") as f:
+            f.write(summary)
+        for phase, profile in self._profiles.items():
+            profile.dump_stats(f"{base}.{phase}.prof")
+        logging.info(f"Профиль {self.name}: {base}.collapsed\n{summary}")
+        return f"{base}.collapsed"
+
+    def _collapse_profiles(self):
+        """Для cprofile: стеки «прогон;фаза;функция» с весом — собственное время функции в мкс."""
+        self.stacks.clear()
+        for phase, profile in self._profiles.items():
+            for (filename, line, func), (_, _, tottime, _, _) in pstats.Stats(profile).stats.items():
+                weight = int(tottime * 1e6)
+                if weight:
+                    self.stacks[f"{self.name};{phase};{func} ({os.path.basename(filename)}:{line})"] += weight
+
+    def summary(self) -> str:
+        """Фазы (время по часам и доля выборок) и top-N функций по собственному и полному времени."""
+        total = sum(self.stacks.values()) or 1
+        unit = "выборок" if self.mode == "sample" else "мкс"
+        by_phase: Counter[str] = Counter()
+        own: Counter[str] = Counter()
+        inclusive: Counter[str] = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            by_phase[frames[1]] += count
+            if len(frames) > 2:
+                own[frames[-1]] += count
+                for frame in set(frames[2:]):
+                    inclusive[frame] += count
+
+        lines = [f"Профиль {self.name} ({self.mode}), всего {total} {unit}", "", "Фазы:"]
+        for phase in dict.fromkeys(list(self.phase_seconds) + [p for p, _ in by_phase.most_common()]):
+            seconds = f"{self.phase_seconds[phase]:.2f} сек, " if phase in self.phase_seconds else ""
+            lines.append(f"  {phase:<14} {seconds}{by_phase[phase] / total:6.1%}")
+        lines += ["", f"Top-{self.top} по собственному времени:"]
+        lines += [f"  {count / total:6.1%}  {frame}" for frame, count in own.most_common(self.top)]
+        lines += ["", f"Top-{self.top} по времени с вложенными вызовами:"]
+        lines += [f"  {count / total:6.1%}  {frame}" for frame, count in inclusive.most_common(self.top)]
+
+        if self._profiles:
+            for phase, profile in self._profiles.items():
+                out = io.StringIO()
+                pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(self.top)
+                lines += ["", f"cProfile, фаза {phase}:", out.getvalue().strip()]
+        return "\n".join(lines) + "\n"
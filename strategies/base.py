@@ -1,6 +1,236 @@
 
-from typing import Protocol, Any, Dict, List
+import sys
+import time
+import weakref
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List
 
-class Strategy(Protocol):
-    async def check(self, exchange: str, symbol: str, old: float, current: float) -> List[Dict[str, Any]]:
-        ...
\ No newline at end of file
+import numpy as np
+
+
+class SymbolIndex:
+    """
+    Интернирование пар (exchange, symbol) в плотные целочисленные id для индексации массивов состояния.
+
+    Для каждого id запоминается время последнего обращения: evict() забывает простаивающие
+    (делистинг, пара пропала из снимков) и самые давние пары сверх лимита. Освобождённые id
+    переиспользуются, а строки стратегий для них сбрасываются в начальные значения.
+    """
+
+    def __init__(self):
+        self.ids: dict[tuple[str, str], int] = {}
+        self.keys: list[tuple[str, str] | None] = []
+        self.free: list[int] = []  # Освобождённые id, выдаются новым парам
+        self.last_seen = np.zeros(0, dtype=np.float64)  # time.monotonic() последнего обращения по id
+        self.strategies = weakref.WeakSet()  # Стратегии, чьи строки сбрасываются при вытеснении
+
+    def intern(self, exchange: str, symbol: str, now: float = None) -> int:
+        key = (exchange, symbol)
+        sid = self.ids.get(key)
+        if sid is None:
+            sid = self._allocate(key)
+        self.last_seen[sid] = time.monotonic() if now is None else now
+        return sid
+
+    def intern_many(self, exchange: str, symbols: list[str]) -> np.ndarray:
+        now = time.monotonic()
+        return np.fromiter((self.intern(exchange, s, now) for s in symbols), dtype=np.int64, count=len(symbols))
+
+    def _allocate(self, key: tuple[str, str]) -> int:
+        if self.free:
+            sid = self.free.pop()
+            self.keys[sid] = key
+        else:
+            sid = len(self.keys)
+            self.keys.append(key)
+            if sid >= len(self.last_seen):
+                grown = np.zeros(max(16, len(self.last_seen) * 2), dtype=np.float64)
+                grown[:len(self.last_seen)] = self.last_seen
+                self.last_seen = grown
+        self.ids[key] = sid
+        return sid
+
+    def key(self, sid: int) -> tuple[str, str]:
+        return self.keys[sid]
+
+    def evict(self, max_pairs: int = 0, idle_ttl: float = 0) -> list[tuple[str, str]]:
+        """
+        Забывает пары без обращений дольше idle_ttl секунд и самые давние сверх max_pairs (0 — без ограничения).
+
+        :return: Вытесненные пары
+        """
+        live = np.array(sorted(self.ids.values()), dtype=np.int64)
+        if not len(live):
+            return []
+        seen = self.last_seen[live]
+        evict = np.zeros(len(live), dtype=bool)
+        if idle_ttl:
+            evict |= seen < time.monotonic() - idle_ttl
+        if max_pairs and len(live) - evict.sum() > max_pairs:
+            # LRU: из оставшихся сохраняем max_pairs самых свежих
+            kept = np.flatnonzero(~evict)
+            evict[kept[np.argsort(seen[kept], kind="stable")[:len(kept) - max_pairs]]] = True
+
+        evicted = live[evict]
+        if not len(evicted):
+            return []
+        for strategy in self.strategies:
+            strategy.reset_rows(evicted)
+
+        pairs = []
+        for sid in evicted.tolist():
+            key = self.keys[sid]
+            del self.ids[key]
+            self.keys[sid] = None
+            self.free.append(sid)
+            pairs.append(key)
+        return pairs
+
+    def nbytes(self) -> int:
+        """Память индекса: словарь, список ключей, кортежи пар и времена обращений (строки — общие с вызывающим)."""
+        return (sys.getsizeof(self.ids) + sys.getsizeof(self.keys) + self.last_seen.nbytes
+                + sum(sys.getsizeof(key) for key in self.keys if key is not None))
+
+    def __len__(self):
+        return len(self.ids)
+
+
+# Общий на процесс индекс пар: один и тот же id у пары во всех стратегиях
+symbol_index = SymbolIndex()
+
+
+class BatchStrategy(ABC):
+    """
+    Основа стратегий с пакетной проверкой.
+
+    Состояние хранится в массивах NumPy, индексируемых id пары из SymbolIndex.
+    check_batch() получает снимок всех пар на один момент времени (массивы id, цен и объёмов,
+    id в снимке уникальны) и возвращает сигналы по всем сразу.
+
+    check() — проверка одной пары (бэктест, поток): вызывает check_one() на скалярах, чтобы не платить
+    за операции NumPy над массивами из одного элемента. Стратегии переопределяют check_one() той же
+    логикой, что и check_batch(); по умолчанию он идёт через check_batch().
+    """
+    # Колонки состояния: {имя атрибута: (dtype, начальное значение[, форма строки])}
+    columns: dict[str, tuple] = {}
+
+    def __init__(self, index: SymbolIndex = None):
+        self.index = index or symbol_index
+        self.capacity = 0
+        for name, (dtype, fill, *row_shape) in self.columns.items():
+            setattr(self, name, np.full((0,) + tuple(*row_shape), fill, dtype=dtype))
+        # Переиспользуемые буферы для check() одной пары
+        self._one_id = np.zeros(1, dtype=np.int64)
+        self._one_price = np.zeros(1, dtype=np.float64)
+        self._one_volume = np.zeros(1, dtype=np.float64)
+        self.index.strategies.add(self)
+
+    def ensure_capacity(self, ids: np.ndarray):
+        """Расширяет массивы состояния (удвоением), если в снимке есть новые id."""
+        if len(ids):
+            self._grow(int(ids.max()) + 1)
+
+    def _grow(self, needed: int):
+        if needed <= self.capacity:
+            return
+        new_capacity = max(needed, self.capacity * 2, 16)
+        for name, (dtype, fill, *_) in self.columns.items():
+            old = getattr(self, name)
+            grown = np.full((new_capacity,) + old.shape[1:], fill, dtype=dtype)
+            grown[:self.capacity] = old
+            setattr(self, name, grown)
+        self.capacity = new_capacity
+
+    def reset_rows(self, ids: np.ndarray):
+        """Возвращает строки пар в начальное состояние (пара вытеснена, id будет выдан другой паре)."""
+        ids = ids[ids < self.capacity]
+        for name, (dtype, fill, *_) in self.columns.items():
+            getattr(self, name)[ids] = fill
+
+    def bytes_per_pair(self) -> int:
+        """Сколько байт состояния занимает одна пара."""
+        return sum(np.dtype(dtype).itemsize * int(np.prod(row_shape[0] if row_shape else ()))
+                   for dtype, fill, *row_shape in self.columns.values())
+
+    def params(self) -> dict:
+        """Параметры конструктора (скалярные атрибуты): по ним проверяется, подходит ли чекпоинт стратегии."""
+        return {name: value for name, value in vars(self).items()
+                if name != "capacity" and isinstance(value, (bool, int, float, str))}
+
+    def state(self) -> dict[str, np.ndarray]:
+        """Колонки состояния (ссылки на массивы, по строке на id)."""
+        return {name: getattr(self, name) for name in self.columns}
+
+    def load_state(self, ids: np.ndarray, saved: dict[str, np.ndarray], saved_ids: np.ndarray) -> bool:
+        """
+        Переносит строки saved_ids из сохранённых колонок в строки ids.
+
+        :return: False, если набор или форма колонок не совпадает (состояние не тронуто)
+        """
+        if set(saved) != set(self.columns):
+            return False
+        self.ensure_capacity(ids)
+        if any(saved[name].shape[1:] != getattr(self, name).shape[1:] for name in self.columns):
+            return False
+        for name in self.columns:
+            getattr(self, name)[ids] = saved[name][saved_ids]
+        return True
+
+    # Сколько последних цен пары прогонять через стратегию, если сохранённого состояния нет
+    warmup_size = 1000
+
+    def seed(self, exchange: str, symbol: str, prices):
+        """Прогрев по историческим ценам (от старых к новым): сигналы отбрасываются, ордеров нет."""
+        sid = self.index.intern(exchange, symbol)
+        self._grow(sid + 1)
+        for price in prices:
+            self.check_one(sid, float(price), 0.0)
+
+    @abstractmethod
+    def check_batch(self, ids: np.ndarray, prices: np.ndarray, volumes: np.ndarray) -> List[Dict[str, Any]]:
+        """Новые цены пар ids (массивы одной длины); возвращает алерты по сработавшим парам."""
+
+    def threshold_distance(self, ids: np.ndarray, prices: np.ndarray) -> np.ndarray:
+        """
+        Сколько процентов цены осталось каждой паре до ближайшего сигнала (0 — на пороге, inf — неизвестно).
+        По нему планировщик опроса чаще опрашивает пары у порога; по умолчанию стратегия этого не знает.
+        """
+        return np.full(len(ids), np.inf)
+
+    def check_one(self, sid: int, price: float, volume: float) -> List[Dict[str, Any]]:
+        self._one_id[0] = sid
+        self._one_price[0] = price
+        self._one_volume[0] = volume
+        return self.check_batch(self._one_id, self._one_price, self._one_volume)
+
+    async def check(self, exchange: str, symbol: str, current: float, volume: float = 0.0) -> List[Dict[str, Any]]:
+        sid = self.index.intern(exchange, symbol)
+        if sid >= self.capacity:
+            self._grow(sid + 1)
+        return self.check_one(sid, float(current), float(volume or 0.0))
+
+    def pair(self, sid) -> tuple[str, str]:
+        """(exchange, symbol) по id пары."""
+        return self.index.key(int(sid))
+
+
+def state_memory_report(strategies: list, index: SymbolIndex = None) -> dict:
+    """
+    Память состояния по парам: байт на пару у каждой стратегии и у индекса,
+    выделено (capacity) и занято (отслеживаемые пары).
+    """
+    index = index or symbol_index
+    pairs = len(index)
+    report = {"pairs": pairs, "index_bytes": index.nbytes(), "strategies": {}}
+    for strategy in strategies:
+        if not isinstance(strategy, BatchStrategy):
+            continue
+        per_pair = strategy.bytes_per_pair()
+        report["strategies"][type(strategy).__name__] = {
+            "bytes_per_pair": per_pair,
+            "capacity": strategy.capacity,
+            "allocated_bytes": per_pair * strategy.capacity,
+        }
+    state = sum(s["bytes_per_pair"] for s in report["strategies"].values())
+    report["bytes_per_pair"] = state + (report["index_bytes"] / pairs if pairs else 0)
+    return report
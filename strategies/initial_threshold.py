@@ -1,123 +1,90 @@
-import logging
 import time
 
+import numpy as np
+
+from strategies.base import BatchStrategy
+
+
+class InitialThresholdStrategy(BatchStrategy):
+    columns = {
+        "initial_price": (np.float64, np.nan),  # Начальная цена пары (NaN — ещё не установлена)
+    }
 
-class InitialThresholdStrategy:
     def __init__(self, threshold_percent: float):
         """
         :param threshold_percent: Порог изменения цены в процентах, при достижении которого срабатывает стратегия.
         """
+        super().__init__()
         self.threshold_percent = threshold_percent
-        self.initial_prices = {}  # Словарь для хранения начальных цен { (exchange, symbol): price }
 
-    async def check(self, exchange, symbol, current):
-        """
-        Проверка, изменилась ли цена достаточно сильно с начального значения.
-
-        :param exchange: Название биржи (например, 'binance')
-        :param symbol: Торговая пара (например, 'BTC/USDT')
-        :param current: Текущая цена актива
-        :return: Список алертов (если есть), иначе пустой список
-        """
-        key = (exchange, symbol)
+    def _alert(self, sid, current: float, start: float, diff: float) -> dict:
+        exchange, symbol = self.pair(sid)
+        if current > start:
+            direction = "📈 выросла"
+            action = "sell"
+        else:
+            direction = "📉 упала"
+            action = "buy"
+
+        return {
+            "exchange": exchange,
+            "pair": symbol,
+            "old": start,
+            "new": current,
+            "diff": diff,
+            "direction": direction,
+            "strategy": f"InitialThresholdStrategy ({self.threshold_percent}%)",
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "action": action,
+        }
+
+    def check_one(self, sid, price, volume):
+        start = self.initial_price.item(sid)
 
         # Если начальная цена ещё не установлена — сохраняем и ничего не возвращаем
-        if key not in self.initial_prices:
-            self.initial_prices[key] = {"price":current,"up_checked": False, "down_checked":False}
+        if start != start:
+            self.initial_price[sid] = price
+            return []
+        if start == 0:
             return []
-        action= "none"
-        initial = self.initial_prices[key]["price"]
-        up_checked = self.initial_prices[key]["up_checked"]
-        down_checked = self.initial_prices[key]["down_checked"]
 
-        # Защита от деления на ноль и двойного срабатывания стратегии
-        if initial == 0 or (up_checked and down_checked):
+        diff = abs(price - start) / start * 100
+        if diff < self.threshold_percent:
             return []
+        self.initial_price[sid] = price
+        return [self._alert(sid, price, start, diff)]
 
-        # Вычисляем процентное изменение от начальной цены
-        diff = abs(current - initial) / initial * 100
-        # logging.info(f"InitialThresholdStrategy: изменение {diff:.2f}% для {exchange} {symbol}")
-
-        # Если изменение превышает заданный порог
-        if diff >= self.threshold_percent:
-            self.initial_prices[key] = {"price": current, "up_checked": False, "down_checked": False}
-            if current > initial:
-                direction = "📈 выросла"
-                action = "sell"
-
-            else:
-                direction = "📉 упала"
-                action = "buy"
-
-            # Возвращаем словарь с данными об алерте
-            return [{
-                "exchange": exchange,
-                "pair": symbol,
-                "old": initial,
-                "new": current,
-                "diff": diff,
-                "direction": direction,
-                "strategy": f"InitialThresholdStrategy ({self.threshold_percent}%)",
-                "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-                "action": action,
-            }]
-
-        # Иначе изменений недостаточно — возвращаем пустой список
-        return []
-
-    async def check_old(self, exchange, symbol, current):
+    def check_batch(self, ids, prices, volumes):
         """
-        Проверка, изменилась ли цена достаточно сильно с начального значения.
+        Проверка, изменилась ли цена достаточно сильно с начального значения, сразу по всем парам снимка.
 
-        :param exchange: Название биржи (например, 'binance')
-        :param symbol: Торговая пара (например, 'BTC/USDT')
-        :param current: Текущая цена актива
+        :param ids: id пар (SymbolIndex)
+        :param prices: Текущие цены пар
+        :param volumes: Объёмы (не используются)
         :return: Список алертов (если есть), иначе пустой список
         """
-        key = (exchange, symbol)
+        self.ensure_capacity(ids)
+        initial = self.initial_price[ids]
 
         # Если начальная цена ещё не установлена — сохраняем и ничего не возвращаем
-        if key not in self.initial_prices:
-            self.initial_prices[key] = {"price":current,"up_checked": False, "down_checked":False}
+        new = np.isnan(initial)
+        if new.any():
+            self.initial_price[ids[new]] = prices[new]
+
+        # Вычисляем процентное изменение от начальной цены (защита от деления на ноль)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            diff = np.abs(prices - initial) / initial * 100
+        fired = np.flatnonzero(~new & (initial != 0) & (diff >= self.threshold_percent))
+        if not len(fired):
             return []
-        action= "none"
-        initial = self.initial_prices[key]["price"]
-        up_checked = self.initial_prices[key]["up_checked"]
-        down_checked = self.initial_prices[key]["down_checked"]
 
-        # Защита от деления на ноль и двойного срабатывания стратегии
-        if initial == 0 or (up_checked and down_checked):
-            return []
+        # Сработавшие пары отсчитывают изменение от новой цены
+        self.initial_price[ids[fired]] = prices[fired]
+        return [self._alert(ids[i], float(prices[i]), float(initial[i]), float(diff[i])) for i in fired]
 
-        # Вычисляем процентное изменение от начальной цены
-        diff = abs(current - initial) / initial * 100
-        # logging.info(f"InitialThresholdStrategy: изменение {diff:.2f}% для {exchange} {symbol}")
-
-        # Если изменение превышает заданный порог
-        if diff >= self.threshold_percent:
-            if current > initial:
-                direction = "📈 выросла"
-                if not self.initial_prices[key]["up_checked"]:
-                    self.initial_prices[key]["up_checked"] = True
-                    action="sell"
-            else:
-                direction = "📉 упала"
-                if not self.initial_prices[key]["down_checked"]:
-                    self.initial_prices[key]["down_checked"] = True
-                    action = "buy"
-
-            # Возвращаем словарь с данными об алерте
-            return [{
-                "exchange": exchange,
-                "pair": symbol,
-                "old": initial,
-                "new": current,
-                "diff": diff,
-                "direction": direction,
-                "strategy": f"InitialThresholdStrategy ({self.threshold_percent}%)",
-                "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-                "action": action,
-            }]
-
-        # Иначе изменений недостаточно — возвращаем пустой список
-        return []
+    def threshold_distance(self, ids, prices):
+        self.ensure_capacity(ids)
+        initial = self.initial_price[ids]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            distance = self.threshold_percent - np.abs(prices - initial) / initial * 100
+        return np.where(np.isnan(distance) | (initial == 0), np.inf, np.maximum(distance, 0))
@@ -1,83 +1,132 @@
 import time
 
-class MartingaleStrategy:
+import numpy as np
+
+from strategies.base import BatchStrategy
+
+
+class MartingaleStrategy(BatchStrategy):
+    columns = {
+        "entry": (np.float64, np.nan),   # Средняя цена входа (NaN — позиции нет)
+        "step": (np.int64, 0),           # Сколько усреднений уже сделано
+        "amount": (np.float64, 0.0),     # Суммарный объём позиции
+    }
+
     def __init__(self, threshold_percent=1.0, max_steps=5, initial_amount=10):
+        super().__init__()
         self.threshold_percent = threshold_percent
         self.max_steps = max_steps
         self.initial_amount = initial_amount
-        self.positions = {}  # {(exchange, symbol): {"entry": price, "step": int, "amount": float}}
 
-    async def check(self, exchange: str, symbol: str, current_price: float):
-        key = (exchange, symbol)
-        action = "none"
-        alerts = []
+    def _average(self, sid, current: float, entry: float, st: int, total: float, drop_percent: float) -> dict:
+        """Усреднение: докупка удвоенным объёмом и пересчёт средней цены входа."""
+        exchange, symbol = self.pair(sid)
+        amount = self.initial_amount * (2 ** st)
 
-        position = self.positions.get(key)
+        # пересчёт средней цены входа
+        new_total_amount = total + amount
+        new_avg_price = (entry * total + current * amount) / new_total_amount
 
-        if not position:
-            # первая покупка
-            self.positions[key] = {
-                "entry": current_price,
-                "step": 0,
-                "amount": self.initial_amount,
-                "direction": "buy"
-            }
-            return []
+        self.entry[sid] = new_avg_price
+        self.step[sid] = st + 1
+        self.amount[sid] = new_total_amount
+
+        return {
+            "exchange": exchange,
+            "pair": symbol,
+            "old": entry,
+            "new": current,
+            "diff": drop_percent,
+            "direction": "📉 усреднение",
+            "strategy": f"Martingale ({self.threshold_percent}% step, {st+1}/{self.max_steps})",
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "action": "buy",
+            "amount": amount,
+            "avg_price": new_avg_price,
+            "step": st + 1,
+        }
+
+    def _exit(self, sid, current: float, entry: float, st: int, total: float) -> dict:
+        """Выход из позиции и сброс состояния пары."""
+        exchange, symbol = self.pair(sid)
+        self.entry[sid] = np.nan
+        self.step[sid] = 0
+        self.amount[sid] = 0.0
 
-        entry_price = position["entry"]
-        step = position["step"]
-        total_amount = position["amount"]
-        direction = position["direction"]
+        return {
+            "exchange": exchange,
+            "pair": symbol,
+            "old": entry,
+            "new": current,
+            "diff": ((current - entry) / entry) * 100,
+            "direction": "📈 откат вверх",
+            "strategy": f"Martingale EXIT",
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "action": "sell",
+            "amount": total,
+            "avg_price": entry,
+            "step": st,
+        }
 
-        drop_percent = ((entry_price - current_price) / entry_price) * 100
+    def check_one(self, sid, price, volume):
+        entry_price = self.entry.item(sid)
+
+        # первая покупка
+        if entry_price != entry_price:
+            self.entry[sid] = price
+            self.step[sid] = 0
+            self.amount[sid] = self.initial_amount
+            return []
+
+        step = self.step.item(sid)
+        drop_percent = ((entry_price - price) / entry_price) * 100
 
         # усреднение при падении
         if drop_percent >= self.threshold_percent and step < self.max_steps:
-            amount = self.initial_amount * (2 ** step)
-
-            # пересчёт средней цены входа
-            new_total_amount = total_amount + amount
-            new_avg_price = (entry_price * total_amount + current_price * amount) / new_total_amount
-
-            self.positions[key] = {
-                "entry": new_avg_price,
-                "step": step + 1,
-                "amount": new_total_amount,
-                "direction": "buy"
-            }
-
-            alerts.append({
-                "exchange": exchange,
-                "pair": symbol,
-                "old": entry_price,
-                "new": current_price,
-                "diff": drop_percent,
-                "direction": "📉 усреднение",
-                "strategy": f"Martingale ({self.threshold_percent}% step, {step+1}/{self.max_steps})",
-                "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-                "action": "buy",
-                "amount": amount,
-                "avg_price": new_avg_price,
-                "step": step + 1,
-            })
+            return [self._average(sid, price, entry_price, step, self.amount.item(sid), drop_percent)]
 
         # выход из позиции при росте выше avg_price на threshold_percent
-        elif current_price > entry_price * (1 + self.threshold_percent / 100):
-            alerts.append({
-                "exchange": exchange,
-                "pair": symbol,
-                "old": entry_price,
-                "new": current_price,
-                "diff": ((current_price - entry_price) / entry_price) * 100,
-                "direction": "📈 откат вверх",
-                "strategy": f"Martingale EXIT",
-                "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-                "action": "sell",
-                "amount": total_amount,
-                "avg_price": entry_price,
-                "step": step,
-            })
-
-            del self.positions[key]
+        if price > entry_price * (1 + self.threshold_percent / 100):
+            return [self._exit(sid, price, entry_price, step, self.amount.item(sid))]
+        return []
+
+    def check_batch(self, ids, prices, volumes):
+        self.ensure_capacity(ids)
+        entry_price = self.entry[ids]
+        step = self.step[ids]
+        total_amount = self.amount[ids]
 
+        # первая покупка
+        new = np.isnan(entry_price)
+        if new.any():
+            opened = ids[new]
+            self.entry[opened] = prices[new]
+            self.step[opened] = 0
+            self.amount[opened] = self.initial_amount
+
+        with np.errstate(invalid="ignore"):
+            drop_percent = ((entry_price - prices) / entry_price) * 100
+            # усреднение при падении
+            average = (drop_percent >= self.threshold_percent) & (step < self.max_steps)
+            # выход из позиции при росте выше avg_price на threshold_percent
+            exit_ = ~average & (prices > entry_price * (1 + self.threshold_percent / 100))
+
+        alerts = []
+        for i in np.flatnonzero(average | exit_):
+            args = (ids[i], float(prices[i]), float(entry_price[i]), int(step[i]), float(total_amount[i]))
+            if average[i]:
+                alerts.append(self._average(*args, float(drop_percent[i])))
+            else:
+                alerts.append(self._exit(*args))
         return alerts
+
+    def threshold_distance(self, ids, prices):
+        self.ensure_capacity(ids)
+        entry_price = self.entry[ids]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # До усреднения (если шаги остались) и до выхода выше avg_price на threshold_percent
+            to_average = np.where(self.step[ids] < self.max_steps,
+                                  self.threshold_percent - (entry_price - prices) / entry_price * 100, np.inf)
+            to_exit = (entry_price * (1 + self.threshold_percent / 100) - prices) / prices * 100
+            distance = np.minimum(to_average, to_exit)
+        return np.where(np.isnan(distance), np.inf, np.maximum(distance, 0))
@@ -1,49 +1,180 @@
 import time
 
-class MovingAverageCrossStrategy:
-    def __init__(self, fast_period: int = 5, slow_period: int = 20):
+import numpy as np
+
+from strategies.base import BatchStrategy
+
+
+class MovingAverageCrossStrategy(BatchStrategy):
+    def __init__(self, fast_period: int = 5, slow_period: int = 20, ma_type: str = "sma"):
+        """
+        :param fast_period: Период быстрой скользящей средней
+        :param slow_period: Период медленной скользящей средней
+        :param ma_type: 'sma' — простые средние, 'ema' — экспоненциальные
+        """
+        if ma_type not in ("sma", "ema"):
+            raise ValueError(f"Неизвестный тип скользящей средней: {ma_type}")
+        # Состояние пары: кольцевой буфер последних slow_period цен и бегущие суммы/EMA
+        self.columns = {
+            "buffer": (np.float64, 0.0, (slow_period,)),
+            "pos": (np.int64, 0),              # Куда будет записана следующая цена
+            "count": (np.int64, 0),            # Сколько цен получено всего
+            "fast_sum": (np.float64, 0.0),
+            "slow_sum": (np.float64, 0.0),
+            "fast_ema": (np.float64, np.nan),
+            "slow_ema": (np.float64, np.nan),
+            "prev_diff": (np.float64, np.nan),
+            "last_price": (np.float64, np.nan),
+        }
+        super().__init__()
         self.fast_period = fast_period
         self.slow_period = slow_period
-        self.prices = {}
-        self.prev_diff = {}
+        self.ma_type = ma_type
+        self.fast_alpha = 2 / (fast_period + 1)
+        self.slow_alpha = 2 / (slow_period + 1)
+
+    @property
+    def warmup_size(self) -> int:
+        """Сколько последних цен нужно для прогрева (см. seed)."""
+        return self.slow_period + 1
+
+    def _update(self, ids: np.ndarray, prices: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """O(1) на пару обновление средних; возвращает (fast - slow, маска заполненных окон)."""
+        self.ensure_capacity(ids)
+        size, fast = self.slow_period, self.fast_period
+        pos = self.pos[ids]
+        count = self.count[ids]
+
+        # Цена, выпадающая из медленного окна, и цена, выпадающая из быстрого
+        leaving_slow = np.where(count >= size, self.buffer[ids, pos], 0.0)
+        leaving_fast = np.where(count >= fast, self.buffer[ids, (pos - fast) % size], 0.0)
+
+        self.buffer[ids, pos] = prices
+        self.slow_sum[ids] += prices - leaving_slow
+        self.fast_sum[ids] += prices - leaving_fast
+        count = self.count[ids] = count + 1
+        pos = self.pos[ids] = (pos + 1) % size
+
+        # На каждом обороте буфера пересчитываем суммы точно, чтобы не копилась ошибка float
+        wrapped = ids[pos == 0]
+        if len(wrapped):
+            self.slow_sum[wrapped] = self.buffer[wrapped].sum(axis=1)
+            self.fast_sum[wrapped] = self.buffer[wrapped, size - fast:].sum(axis=1)
+
+        if self.ma_type == "ema":
+            fast_ema = self.fast_ema[ids]
+            slow_ema = self.slow_ema[ids]
+            first = np.isnan(fast_ema)
+            fast_ema = np.where(first, prices, fast_ema + self.fast_alpha * (prices - fast_ema))
+            slow_ema = np.where(first, prices, slow_ema + self.slow_alpha * (prices - slow_ema))
+            self.fast_ema[ids] = fast_ema
+            self.slow_ema[ids] = slow_ema
+            diff = fast_ema - slow_ema
+        else:
+            diff = self.fast_sum[ids] / fast - self.slow_sum[ids] / size
+
+        return diff, count >= size
+
+    def _update_one(self, sid: int, price: float) -> tuple[float, bool]:
+        """То же, что _update, для одной пары на скалярах."""
+        size, fast = self.slow_period, self.fast_period
+        pos = self.pos.item(sid)
+        count = self.count.item(sid)
+        row = self.buffer[sid]
+
+        leaving_slow = row.item(pos) if count >= size else 0.0
+        leaving_fast = row.item((pos - fast) % size) if count >= fast else 0.0
 
-    async def check(self, exchange, symbol, old, current):
-        key = (exchange, symbol)
-        self.prices.setdefault(key, []).append(current)
-        if len(self.prices[key]) < self.slow_period:
+        row[pos] = price
+        slow_sum = self.slow_sum.item(sid) + (price - leaving_slow)
+        fast_sum = self.fast_sum.item(sid) + (price - leaving_fast)
+        count += 1
+        pos = (pos + 1) % size
+
+        # На каждом обороте буфера пересчитываем суммы точно, чтобы не копилась ошибка float
+        if pos == 0:
+            slow_sum = row.sum().item()
+            fast_sum = row[size - fast:].sum().item()
+
+        self.slow_sum[sid] = slow_sum
+        self.fast_sum[sid] = fast_sum
+        self.count[sid] = count
+        self.pos[sid] = pos
+
+        if self.ma_type == "ema":
+            fast_ema = self.fast_ema.item(sid)
+            slow_ema = self.slow_ema.item(sid)
+            if fast_ema != fast_ema:
+                fast_ema = slow_ema = price
+            else:
+                fast_ema = fast_ema + self.fast_alpha * (price - fast_ema)
+                slow_ema = slow_ema + self.slow_alpha * (price - slow_ema)
+            self.fast_ema[sid] = fast_ema
+            self.slow_ema[sid] = slow_ema
+            diff = fast_ema - slow_ema
+        else:
+            diff = fast_sum / fast - slow_sum / size
+
+        return diff, count >= size
+
+    def seed(self, exchange: str, symbol: str, prices):
+        """Прогрев по историческим ценам (от старых к новым) без генерации сигналов."""
+        sid = self.index.intern(exchange, symbol)
+        self._grow(sid + 1)
+        for price in prices:
+            price = float(price)
+            diff, ready = self._update_one(sid, price)
+            if ready:
+                self.prev_diff[sid] = diff
+            self.last_price[sid] = price
+
+    def _alert(self, sid, old: float, current: float, diff: float, up: bool) -> dict:
+        exchange, symbol = self.pair(sid)
+        if up:
+            # Пересечение вверх (бычий сигнал)
+            direction = "📈 Пересечение вверх: fast MA выше slow MA"
+        else:
+            # Пересечение вниз (медвежий сигнал)
+            direction = "📉 Пересечение вниз: fast MA ниже slow MA"
+        return {
+            "exchange": exchange,
+            "symbol": symbol,
+            "old": None if old != old else old,
+            "new": current,
+            "diff": abs(diff),
+            "direction": direction,
+            "strategy": "MovingAverageCrossStrategy",
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+    def check_one(self, sid, price, volume):
+        diff, ready = self._update_one(sid, price)
+        old = self.last_price.item(sid)
+        self.last_price[sid] = price
+        if not ready:
             return []
-        prices = self.prices[key][-self.slow_period:]
-        fast_ma = sum(prices[-self.fast_period:]) / self.fast_period
-        slow_ma = sum(prices) / self.slow_period
-        diff = fast_ma - slow_ma
-
-        prev = self.prev_diff.get(key)
-        self.prev_diff[key] = diff
-
-        alerts = []
-        if prev is not None:
-            if prev < 0 and diff > 0:
-                # Пересечение вверх (бычий сигнал)
-                alerts.append({
-                    "exchange": exchange,
-                    "symbol": symbol,
-                    "old": old,
-                    "new": current,
-                    "diff": abs(diff),
-                    "direction": "📈 Пересечение вверх: fast MA выше slow MA",
-                    "strategy": "MovingAverageCrossStrategy",
-                    "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-                })
-            elif prev > 0 and diff < 0:
-                # Пересечение вниз (медвежий сигнал)
-                alerts.append({
-                    "exchange": exchange,
-                    "symbol": symbol,
-                    "old": old,
-                    "new": current,
-                    "diff": abs(diff),
-                    "direction": "📉 Пересечение вниз: fast MA ниже slow MA",
-                    "strategy": "MovingAverageCrossStrategy",
-                    "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-                })
-        return alerts
\ No newline at end of file
+
+        prev = self.prev_diff.item(sid)
+        self.prev_diff[sid] = diff
+        # NaN в prev (окно только что заполнилось) не даёт пересечения
+        if prev < 0 < diff:
+            return [self._alert(sid, old, price, diff, up=True)]
+        if prev > 0 > diff:
+            return [self._alert(sid, old, price, diff, up=False)]
+        return []
+
+    def check_batch(self, ids, prices, volumes):
+        diff, ready = self._update(ids, prices)
+        old = self.last_price[ids]
+        self.last_price[ids] = prices
+
+        prev = self.prev_diff[ids]
+        self.prev_diff[ids] = np.where(ready, diff, prev)
+
+        # NaN в prev (окно только что заполнилось) не даёт пересечения
+        cross_up = ready & (prev < 0) & (diff > 0)
+        cross_down = ready & (prev > 0) & (diff < 0)
+        return [
+            self._alert(ids[i], float(old[i]), float(prices[i]), float(diff[i]), up=bool(cross_up[i]))
+            for i in np.flatnonzero(cross_up | cross_down)
+        ]
@@ -1,33 +1,64 @@
-class StaticInitialThresholdStrategy:
+import numpy as np
+
+from strategies.base import BatchStrategy
+
+
+class StaticInitialThresholdStrategy(BatchStrategy):
+    columns = {
+        "initial_price": (np.float64, np.nan),  # Начальная цена, устанавливается один раз
+    }
+
     def __init__(self, threshold_percent: float):
+        super().__init__()
         self.threshold_percent = threshold_percent
-        self.initial_price: dict[str, float] = {}
 
-    async def check(self, exchange: str, symbol: str, current_price: float) -> list[dict]:
-        alerts = []
+    def _alert(self, sid, action: str) -> dict:
+        exchange, symbol = self.pair(sid)
+        return {
+            "exchange": exchange,
+            "pair": symbol,
+            "action": action,
+            "strategy": f"StaticInitialThresholdStrategy ({self.threshold_percent}%)",
+            "amount": None
+        }
+
+    def check_one(self, sid, price, volume):
+        start_price = self.initial_price.item(sid)
 
         # Устанавливаем начальную цену один раз
-        if symbol not in self.initial_price:
-            self.initial_price[symbol] = current_price
+        if start_price != start_price:
+            self.initial_price[sid] = price
             return []
 
-        start_price = self.initial_price[symbol]
-        change = (current_price - start_price) / start_price * 100
+        change = (price - start_price) / start_price * 100
 
-        # Если цена упала на threshold% — покупаем
+        # Если цена упала на threshold% — покупаем, выросла на threshold% — продаём
         if change <= -self.threshold_percent:
-            alerts.append({
-                "action": "buy",
-                "strategy": f"StaticInitialThresholdStrategy ({self.threshold_percent}%)",
-                "amount": None
-            })
-
-        # Если цена выросла на threshold% — продаём
-        elif change >= self.threshold_percent:
-            alerts.append({
-                "action": "sell",
-                "strategy": f"StaticInitialThresholdStrategy ({self.threshold_percent}%)",
-                "amount": None
-            })
-
-        return alerts
+            return [self._alert(sid, "buy")]
+        if change >= self.threshold_percent:
+            return [self._alert(sid, "sell")]
+        return []
+
+    def check_batch(self, ids, prices, volumes):
+        self.ensure_capacity(ids)
+        start_price = self.initial_price[ids]
+
+        # Устанавливаем начальную цену один раз
+        new = np.isnan(start_price)
+        if new.any():
+            self.initial_price[ids[new]] = prices[new]
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            change = (prices - start_price) / start_price * 100
+
+        # Если цена упала на threshold% — покупаем, выросла на threshold% — продаём
+        buy = change <= -self.threshold_percent
+        sell = change >= self.threshold_percent
+        return [self._alert(ids[i], "buy" if buy[i] else "sell") for i in np.flatnonzero(buy | sell)]
+
+    def threshold_distance(self, ids, prices):
+        self.ensure_capacity(ids)
+        start_price = self.initial_price[ids]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            distance = self.threshold_percent - np.abs(prices - start_price) / start_price * 100
+        return np.where(np.isnan(distance), np.inf, np.maximum(distance, 0))
@@ -1,26 +1,50 @@
 import time
 
+import numpy as np
+
+from strategies.base import BatchStrategy
+
+
+class ThresholdStrategy(BatchStrategy):
+    columns = {
+        "last_price": (np.float64, np.nan),  # Предыдущая цена пары
+    }
 
-class ThresholdStrategy:
     def __init__(self, threshold_percent: float):
+        super().__init__()
         self.threshold_percent = threshold_percent
 
-    async def check(self, exchange, symbol, old, current):
-        if old is None:
+    def _alert(self, sid, current: float, previous: float, diff: float) -> dict:
+        exchange, symbol = self.pair(sid)
+        direction = "📈 выросла" if current > previous else "📉 упала"
+        return {
+            "exchange": exchange,
+            "symbol": symbol,
+            "old_price": previous,
+            "new_price": current,
+            "diff": diff,
+            "direction": direction,
+            "strategy": "ThresholdStrategy",
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            # "volume": volume,  # если есть
+        }
+
+    def check_one(self, sid, price, volume):
+        old = self.last_price.item(sid)
+        self.last_price[sid] = price
+        if old != old or old == 0:  # NaN — старой цены ещё нет
             return []
-        diff = abs(current - old) / old * 100
-
-        if diff >= self.threshold_percent:
-            direction = "📈 выросла" if current > old else "📉 упала"
-            return [{
-                "exchange": exchange,
-                "symbol": symbol,
-                "old_price": old,
-                "new_price": current,
-                "diff": diff,
-                "direction": direction,
-                "strategy": "ThresholdStrategy",
-                "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-                # "volume": volume,  # если есть
-            }]
-        return []
+        diff = abs(price - old) / old * 100
+        if diff < self.threshold_percent:
+            return []
+        return [self._alert(sid, price, old, diff)]
+
+    def check_batch(self, ids, prices, volumes):
+        self.ensure_capacity(ids)
+        old = self.last_price[ids]
+        self.last_price[ids] = prices
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            diff = np.abs(prices - old) / old * 100
+        fired = np.flatnonzero((old != 0) & (diff >= self.threshold_percent))  # NaN (нет старой цены) не срабатывает
+        return [self._alert(ids[i], float(prices[i]), float(old[i]), float(diff[i])) for i in fired]
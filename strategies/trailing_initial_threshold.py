@@ -1,58 +1,97 @@
-class TrailingInitialThresholdStrategy:
+import numpy as np
+
+from strategies.base import BatchStrategy
+
+# Направление последнего действия
+NEUTRAL, BUY, SELL = 0, 1, -1
+
+
+class TrailingInitialThresholdStrategy(BatchStrategy):
+    columns = {
+        "anchor_price": (np.float64, np.nan),  # Якорь: отслеживаемая цена (минимум при покупке, максимум при продаже)
+        "direction": (np.int8, NEUTRAL),       # Направление последнего действия: BUY, SELL, NEUTRAL
+    }
+
     def __init__(self, threshold_percent: float):
+        super().__init__()
         self.threshold_percent = threshold_percent
-        self.anchor_price: dict[str, float] = {}  # Якорь: отслеживаемая цена (минимум при покупке, максимум при продаже)
-        self.direction: dict[str, str] = {}       # Направление последнего действия: 'buy', 'sell', 'neutral'
 
-    async def check(self, exchange: str, symbol: str, current_price: float) -> list[dict]:
-        alerts = []
+    def _alert(self, sid, action: str) -> dict:
+        exchange, symbol = self.pair(sid)
+        return {
+            "exchange": exchange,
+            "pair": symbol,
+            "action": action,
+            "strategy": f"TrailingInitialThresholdStrategy ({self.threshold_percent}%)",
+            "amount": None  # пусть вызывающий код сам определит объём
+        }
 
-        # Если символ новый, инициализируем
-        if symbol not in self.anchor_price:
-            self.anchor_price[symbol] = current_price
-            self.direction[symbol] = 'neutral'
-            return []
+    def check_one(self, sid, price, volume):
+        anchor = self.anchor_price.item(sid)
 
-        anchor = self.anchor_price[symbol]
-        direction = self.direction[symbol]
+        # Если пара новая, инициализируем
+        if anchor != anchor:
+            self.anchor_price[sid] = price
+            self.direction[sid] = NEUTRAL
+            return []
 
         # Изменение цены относительно якорной в процентах
-        change = (current_price - anchor) / anchor * 100
-
-
+        change = (price - anchor) / anchor * 100
 
         # 🎯 Сигнал на покупку: цена упала на threshold% от anchor
         if change <= -self.threshold_percent:
-            alerts.append({
-                "action": "buy",
-                "strategy": f"TrailingInitialThresholdStrategy ({self.threshold_percent}%)",
-                "amount": None  # пусть вызывающий код сам определит объём
-            })
-            # Обновляем якорь и направление
-            self.anchor_price[symbol] = current_price
-            self.direction[symbol] = 'buy'
+            self.anchor_price[sid] = price
+            self.direction[sid] = BUY
+            return [self._alert(sid, "buy")]
 
         # 🎯 Сигнал на продажу: цена выросла на threshold% от anchor
-        elif change >= self.threshold_percent:
-            alerts.append({
-                "action": "sell",
-                "strategy": f"TrailingInitialThresholdStrategy ({self.threshold_percent}%)",
-                "amount": None
-            })
-            self.anchor_price[symbol] = current_price
-            self.direction[symbol] = 'sell'
+        if change >= self.threshold_percent:
+            self.anchor_price[sid] = price
+            self.direction[sid] = SELL
+            return [self._alert(sid, "sell")]
 
+        # Без сигнала: нейтральный якорь следует за ценой, после buy ищем новое дно,
+        # после sell — новый максимум
+        direction = self.direction.item(sid)
+        if direction == BUY:
+            self.anchor_price[sid] = min(anchor, price)
+        elif direction == SELL:
+            self.anchor_price[sid] = max(anchor, price)
         else:
-            # Если ещё нет действия, просто обновляем anchor текущей ценой
-            if direction == 'neutral':
-                self.anchor_price[symbol] = current_price
+            self.anchor_price[sid] = price
+        return []
+
+    def check_batch(self, ids, prices, volumes):
+        self.ensure_capacity(ids)
+        anchor = self.anchor_price[ids]
+        direction = self.direction[ids]
+
+        # Если пара новая, инициализируем
+        new = np.isnan(anchor)
+
+        # Изменение цены относительно якорной в процентах
+        with np.errstate(divide="ignore", invalid="ignore"):
+            change = (prices - anchor) / anchor * 100
+
+        # 🎯 Сигнал на покупку: цена упала на threshold% от anchor
+        buy = change <= -self.threshold_percent
+        # 🎯 Сигнал на продажу: цена выросла на threshold% от anchor
+        sell = ~buy & (change >= self.threshold_percent)
+        quiet = ~new & ~buy & ~sell
 
-            # Если ранее был buy, ищем новое дно для trailing-покупки
-            elif direction == 'buy':
-                self.anchor_price[symbol] = min(anchor, current_price)
+        # Без сигнала: нейтральный якорь следует за ценой, после buy ищем новое дно,
+        # после sell — новый максимум
+        trailed = np.where(direction == BUY, np.minimum(anchor, prices),
+                           np.where(direction == SELL, np.maximum(anchor, prices), prices))
+        self.anchor_price[ids] = np.where(quiet, trailed, prices)
+        self.direction[ids] = np.where(new, NEUTRAL, np.where(buy, BUY, np.where(sell, SELL, direction)))
 
-            # Если ранее был sell, ищем новый максимум для trailing-продажи
-            elif direction == 'sell':
-                self.anchor_price[symbol] = max(anchor, current_price)
+        return [self._alert(ids[i], "buy" if buy[i] else "sell") for i in np.flatnonzero(buy | sell)]
 
-        return alerts
+    def threshold_distance(self, ids, prices):
+        self.ensure_capacity(ids)
+        anchor = self.anchor_price[ids]
+        # Сигнал — при отклонении от якоря на threshold% в любую сторону
+        with np.errstate(divide="ignore", invalid="ignore"):
+            distance = self.threshold_percent - np.abs(prices - anchor) / anchor * 100
+        return np.where(np.isnan(distance), np.inf, np.maximum(distance, 0))
@@ -1,30 +1,51 @@
-import logging
 import time
 
-class VolumeSpikeStrategy:
+import numpy as np
+
+from strategies.base import BatchStrategy
+
+
+class VolumeSpikeStrategy(BatchStrategy):
+    columns = {
+        "last_volume": (np.float64, np.nan),  # Объём на предыдущей проверке
+    }
+
     def __init__(self, spike_percent: float):
+        super().__init__()
         self.spike_percent = spike_percent
-        self.last_volume = {}
-
-    async def check(self, exchange, symbol, old, current, volume):
-        key = f"{exchange}_{symbol}"
-        old_volume = self.last_volume.get(key)
-        alerts = []
-
-        if old_volume and old_volume != 0:
-            diff = abs(volume - old_volume) / old_volume * 100
-            logging.info(f"InitialThresholdStrategy: изменение {diff:.2f}% для {exchange} {symbol}")
-            if diff >= self.spike_percent:
-                direction = "📈 Резкий рост объёма" if volume > old_volume else "📉 Резкое падение объёма"
-                alerts.append({
-                    "exchange": exchange,
-                    "symbol": symbol,
-                    "old": old_volume,
-                    "new": volume,
-                    "diff": diff,
-                    "direction": direction,
-                    "strategy": f"VolumeSpikeStrategy ({self.spike_percent}%)",
-                    "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-                })
-        self.last_volume[key] = volume
-        return alerts
\ No newline at end of file
+
+    def _alert(self, sid, volume: float, previous: float, diff: float) -> dict:
+        exchange, symbol = self.pair(sid)
+        direction = "📈 Резкий рост объёма" if volume > previous else "📉 Резкое падение объёма"
+        return {
+            "exchange": exchange,
+            "symbol": symbol,
+            "old": previous,
+            "new": volume,
+            "diff": diff,
+            "direction": direction,
+            "strategy": f"VolumeSpikeStrategy ({self.spike_percent}%)",
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+    def check_one(self, sid, price, volume):
+        previous = self.last_volume.item(sid)
+        self.last_volume[sid] = volume
+        # Нет прошлого объёма (NaN) или он нулевой — не срабатываем
+        if previous != previous or previous == 0:
+            return []
+        diff = abs(volume - previous) / previous * 100
+        if diff < self.spike_percent:
+            return []
+        return [self._alert(sid, volume, previous, diff)]
+
+    def check_batch(self, ids, prices, volumes):
+        self.ensure_capacity(ids)
+        old_volume = self.last_volume[ids]
+        self.last_volume[ids] = volumes
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            diff = np.abs(volumes - old_volume) / old_volume * 100
+        # Нет прошлого объёма (NaN) или он нулевой (inf) — не срабатываем
+        fired = np.flatnonzero(np.isfinite(diff) & (diff >= self.spike_percent))
+        return [self._alert(ids[i], float(volumes[i]), float(old_volume[i]), float(diff[i])) for i in fired]
@@ -0,0 +1,27 @@
+import asyncio
+import os
+
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+# tgbot.telegram_bot создаёт Bot при импорте, а tgbot.config читает окружение один раз:
+# токен правильного формата нужен до первого импорта модулей проекта
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:test")
+
+from db.sqlite_module import Base, apply_sqlite_pragmas
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """Фабрика сессий на отдельной временной SQLite-базе со всеми таблицами."""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.sqlite3'}", echo=False)
+    apply_sqlite_pragmas(engine)
+
+    async def create():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    asyncio.run(create())
+    yield sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    asyncio.run(engine.dispose())
@@ -0,0 +1,38 @@
+import asyncio
+
+import numpy as np
+
+import services.backtest as backtest
+from emulation.sweep import run_sweep
+from services.backtest import run_backtest
+from strategies.trailing_initial_threshold import TrailingInitialThresholdStrategy
+
+
+def _run(close: np.ndarray, **kwargs):
+    return asyncio.run(run_backtest([TrailingInitialThresholdStrategy(0.5)], "BT/USDT", close, **kwargs))
+
+
+def test_chunked_prices_give_the_same_result(monkeypatch):
+    close = 100 * np.exp(np.cumsum(np.random.default_rng(3).normal(0, 0.003, 5_000)))
+    whole = _run(close)
+    monkeypatch.setattr(backtest, "CHUNK_BARS", 97)  # Границы кусков посреди сделок
+    chunked = _run(close)
+    no_curves = _run(close, curves=False)
+
+    assert whole.trades, "сценарий должен давать сделки"
+    assert chunked.trades == whole.trades
+    np.testing.assert_array_equal(chunked.equity_curve, whole.equity_curve)
+    assert chunked.as_tuple() == whole.as_tuple()
+    assert no_curves.as_tuple() == whole.as_tuple()
+    assert len(no_curves.equity_curve) == 0
+
+
+def test_sweep_workers_match_a_direct_backtest():
+    close = 100 * np.exp(np.cumsum(np.random.default_rng(5).normal(0, 0.003, 3_000)))
+    rows = run_sweep("TrailingInitialThresholdStrategy", {"threshold_percent": [0.5, 1.0]}, close, "SW/USDT",
+                     processes=2)
+    for row in rows:
+        direct = asyncio.run(run_backtest([TrailingInitialThresholdStrategy(row["threshold_percent"])],
+                                          "SW/USDT", close))
+        assert row["equity"] == direct.equity
+        assert row["trades"] == len(direct.trades)
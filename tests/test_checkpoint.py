@@ -0,0 +1,66 @@
+import numpy as np
+
+from services.checkpoint import StrategyCheckpoint
+from strategies.base import SymbolIndex
+from strategies.martingale_strategy import MartingaleStrategy
+from strategies.moving_average import MovingAverageCrossStrategy
+from strategies.threshold import ThresholdStrategy
+from strategies.trailing_initial_threshold import TrailingInitialThresholdStrategy
+
+SYMBOLS = ["A/USDT", "B/USDT", "C/USDT", "D/USDT"]
+STEPS = 300
+STOP = 150  # Шаг, на котором процесс «останавливается» и пишет чекпоинт
+
+
+def _strategies(index: SymbolIndex, threshold: float = 0.5) -> list:
+    strategies = [TrailingInitialThresholdStrategy(0.5), MovingAverageCrossStrategy(3, 8),
+                  MartingaleStrategy(0.5, max_steps=3), ThresholdStrategy(threshold)]
+    for strategy in strategies:
+        # Стратегии берут общий symbol_index; здесь у каждого «процесса» свой
+        strategy.index = index
+        index.strategies.add(strategy)
+    return strategies
+
+
+def _run(strategies: list, index: SymbolIndex, prices: np.ndarray, steps: range) -> list[list[dict]]:
+    """Сигналы каждой стратегии за шаги steps (без времени сигнала — оно из часов)."""
+    ids = index.intern_many("binance", SYMBOLS)
+    volumes = np.ones(len(SYMBOLS))
+    signals = [[] for _ in strategies]
+    for step in steps:
+        for i, strategy in enumerate(strategies):
+            signals[i] += [{k: v for k, v in alert.items() if k != "timestamp"}
+                           for alert in strategy.check_batch(ids, prices[step], volumes)]
+    return signals
+
+
+def test_restored_strategies_continue_as_if_never_stopped(tmp_path):
+    prices = 100 * np.exp(np.cumsum(np.random.default_rng(11).normal(0, 0.004, (STEPS, len(SYMBOLS))), axis=0))
+
+    reference_index = SymbolIndex()
+    reference = _strategies(reference_index)
+    _run(reference, reference_index, prices, range(STOP))
+    expected = _run(reference, reference_index, prices, range(STOP, STEPS))
+
+    before_index = SymbolIndex()
+    before = _strategies(before_index)
+    _run(before, before_index, prices, range(STOP))
+    checkpoint = StrategyCheckpoint(str(tmp_path / "state.npz"), interval=0, index=before_index)
+    checkpoint.strategies = before
+    checkpoint._write(checkpoint.snapshot())
+
+    # Новый процесс: другие пары уже в индексе, свои — в обратном порядке, поэтому id другие
+    after_index = SymbolIndex()
+    after_index.intern("bybit", "X/USDT")
+    for symbol in reversed(SYMBOLS):
+        after_index.intern("binance", symbol)
+    after = _strategies(after_index, threshold=1.0)  # У ThresholdStrategy другие параметры
+    restored = StrategyCheckpoint(str(tmp_path / "state.npz"), interval=0, index=after_index).restore(after)
+
+    assert restored == after[:3]
+    assert np.isnan(after[3].last_price).all()  # Не подходящая по параметрам стратегия не тронута
+    assert list(after_index.intern_many("binance", SYMBOLS)) != list(before_index.intern_many("binance", SYMBOLS))
+
+    actual = _run(after, after_index, prices, range(STOP, STEPS))
+    assert any(expected[:3]), "сценарий должен давать сигналы"
+    assert actual[:3] == expected[:3]
@@ -0,0 +1,140 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from db.sqlite_module import DBManager, GroupCommitWriter, PriceBar, PriceEntry
+
+
+def _flaky_factory(session_factory, commits: int = 0, rollbacks: int = 0):
+    """Фабрика сессий, у которых первые commits commit и первые rollbacks rollback падают."""
+    failures = {"commit": commits, "rollback": rollbacks}
+
+    class FlakySession(AsyncSession):
+        async def commit(self):
+            if failures["commit"]:
+                failures["commit"] -= 1
+                raise RuntimeError("disk I/O error")
+            await super().commit()
+
+        async def rollback(self):
+            if failures["rollback"]:
+                failures["rollback"] -= 1
+                raise RuntimeError("rollback failed")
+            await super().rollback()
+
+    return sessionmaker(bind=session_factory.kw["bind"], class_=FlakySession, expire_on_commit=False)
+
+
+def _bar(ts: int):
+    async def op(session):
+        session.add(PriceBar(exchange="binance", symbol="TON/USDT", timeframe="1m", ts=ts,
+                             open=1.0, high=1.0, low=1.0, close=1.0, volume=0.0))
+        return ts
+    return op
+
+
+async def _failing(session):
+    raise ValueError("bad op")
+
+
+async def _bar_count(session_factory) -> int:
+    async with session_factory() as session:
+        return len((await session.execute(select(PriceBar))).scalars().all())
+
+
+def test_concurrent_writes_share_one_commit(session_factory):
+    async def scenario():
+        writer = GroupCommitWriter(session_factory, max_delay_ms=50)
+        writer.start()
+        async with session_factory() as session:
+            db = DBManager(session, writer=writer)
+            await asyncio.gather(*(db.save_price("binance", f"C{i}/USDT", float(i), 0.0) for i in range(20)))
+            prices = await db.get_all_prices()
+        batches, writes = writer.batches, writer.writes
+        await writer.close()
+        return batches, writes, prices
+
+    batches, writes, prices = asyncio.run(scenario())
+    assert batches == 1 and writes == 20
+    assert len(prices) == 20
+
+
+def test_failed_write_is_removed_and_the_rest_is_committed(session_factory):
+    async def scenario():
+        writer = GroupCommitWriter(session_factory, max_delay_ms=50)
+        writer.start()
+        # Ошибка в op и ошибка ограничения, которая видна только при flush (дубль бара)
+        futures = [writer.submit(op) for op in (_bar(0), _failing, _bar(60_000), _bar(0), _bar(120_000))]
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        await writer.close()
+        return results, await _bar_count(session_factory)
+
+    results, bars = asyncio.run(scenario())
+    assert results[0] == 0 and results[2] == 60_000 and results[4] == 120_000
+    assert isinstance(results[1], ValueError)
+    assert isinstance(results[3], Exception)
+    assert bars == 3
+
+
+def test_failed_commit_fails_the_batch_and_writer_keeps_running(session_factory):
+    async def scenario():
+        writer = GroupCommitWriter(_flaky_factory(session_factory, commits=1), max_delay_ms=20)
+        writer.start()
+        first = await asyncio.gather(writer.submit(_bar(0)), writer.submit(_bar(60_000)), return_exceptions=True)
+        running = writer.running
+        second = await asyncio.wait_for(writer.submit(_bar(120_000)), 5)
+        await writer.close()
+        return first, running, second, await _bar_count(session_factory)
+
+    first, running, second, bars = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in first)
+    assert running
+    assert second == 120_000
+    assert bars == 1
+
+
+def test_failed_rollback_does_not_stop_the_writer(session_factory):
+    async def scenario():
+        writer = GroupCommitWriter(_flaky_factory(session_factory, rollbacks=1), max_delay_ms=20)
+        writer.start()
+        first = await asyncio.wait_for(
+            asyncio.gather(writer.submit(_failing), writer.submit(_bar(0)), return_exceptions=True), 5)
+        running = writer.running
+        second = await asyncio.wait_for(writer.submit(_bar(60_000)), 5)
+        await asyncio.wait_for(writer.close(), 5)
+        return first, running, second
+
+    first, running, second = asyncio.run(scenario())
+    assert isinstance(first[0], ValueError)
+    assert isinstance(first[1], RuntimeError)
+    assert running
+    assert second == 60_000
+
+
+def test_close_waits_for_queued_writes(session_factory):
+    async def scenario():
+        writer = GroupCommitWriter(session_factory, max_delay_ms=1000)
+        writer.start()
+        futures = [writer.submit(_bar(i * 60_000)) for i in range(3)]
+        await writer.close()
+        return writer.running, [future.done() for future in futures], await _bar_count(session_factory)
+
+    running, done, bars = asyncio.run(scenario())
+    assert not running
+    assert done == [True, True, True]
+    assert bars == 3
+
+
+def test_direct_writes_when_writer_is_stopped(session_factory):
+    async def scenario():
+        writer = GroupCommitWriter(session_factory)
+        async with session_factory() as session:
+            db = DBManager(session, writer=writer)
+            await db.save_price("binance", "TON/USDT", 1.0, 0.0)
+            return (await session.execute(select(PriceEntry))).scalars().all()
+
+    entries = asyncio.run(scenario())
+    assert [(e.symbol, e.last_price) for e in entries] == [("TON/USDT", 1.0)]
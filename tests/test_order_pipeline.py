@@ -0,0 +1,85 @@
+import asyncio
+
+import ccxt.async_support as ccxt
+import pytest
+
+import services.order_pipeline as order_pipeline_module
+from db.sqlite_module import DBManager, GroupCommitWriter
+from exchanges.simulator import SimulatedExchange
+from services.order_pipeline import OrderPipeline, order_intent
+from services.portfolio import PortfolioLedger
+
+
+class SimOrderManager:
+    """OrderManager поверх симулятора; первый ответ на create_order теряется после создания ордера."""
+
+    def __init__(self, exchange: SimulatedExchange):
+        self.exchange = exchange
+        self.lost_responses = 1
+
+    async def create_order(self, exchange_name, symbol, order_type, side, amount, price=None, client_order_id=None):
+        order = await self.exchange.create_order(symbol, order_type, side, amount, price,
+                                                 {"clientOrderId": client_order_id})
+        if self.lost_responses:
+            self.lost_responses -= 1
+            raise ccxt.NetworkError("ответ потерян")
+        return order
+
+    async def fetch_order(self, exchange_name, symbol, order_id=None, client_order_id=None):
+        params = {"clientOrderId": client_order_id} if client_order_id and not order_id else {}
+        return await self.exchange.fetch_order(order_id, symbol, params)
+
+
+class FlakyDBManager(DBManager):
+    """Первая запись пачки ордеров падает, как при занятой базе."""
+    failures = 1
+
+    def __init__(self, session):
+        super().__init__(session, writer=GroupCommitWriter())
+
+    async def create_orders(self, orders):
+        if FlakyDBManager.failures:
+            FlakyDBManager.failures -= 1
+            raise RuntimeError("database is locked")
+        return await super().create_orders(orders)
+
+
+class Notifications:
+    def __init__(self):
+        self.texts = []
+
+    def notify(self, chat_id, text, key=None, parse_mode="HTML", reply_markup=None):
+        self.texts.append(text)
+        return True
+
+
+def test_pipeline_places_and_records_each_signal_once(session_factory, monkeypatch):
+    ledger = PortfolioLedger(initial_cash=1000.0)
+    notifications = Notifications()
+    monkeypatch.setattr(order_pipeline_module, "AsyncSessionLocal", session_factory)
+    monkeypatch.setattr(order_pipeline_module, "DBManager", FlakyDBManager)
+    monkeypatch.setattr(order_pipeline_module, "portfolio_ledger", ledger)
+    monkeypatch.setattr(order_pipeline_module, "notifier", notifications)
+
+    exchange = SimulatedExchange(latency_ms=0, error_rate=0, rate_limit=0, seed=1)
+    price = exchange.price("TON/USDT")
+
+    async def scenario():
+        pipeline = OrderPipeline(SimOrderManager(exchange), mode="live", workers=2, max_retries=3)
+        intent = order_intent("test", "sim", "TON/USDT", "buy", 1.0, price, signal=1)
+        accepted = [pipeline.submit(intent), pipeline.submit(dict(intent))]
+        await pipeline.close(timeout=10)
+        async with session_factory() as session:
+            rows = await DBManager(session, writer=GroupCommitWriter()).get_orders(limit=10)
+        return pipeline, accepted, rows
+
+    pipeline, accepted, rows = asyncio.run(scenario())
+    assert accepted == [True, False]
+    assert pipeline.duplicates == 1
+    # Повтор после потерянного ответа нашёл существующий ордер, а не создал второй
+    assert len(exchange.orders) == 1
+    # Запись, упавшая в первый раз, повторена
+    assert [(row.status, row.order_id) for row in rows] == [("closed", "1")]
+    assert pipeline.filled == 1 and pipeline.failed == 0
+    assert ledger.state.portfolio["TON/USDT"]["amount"] == pytest.approx(1.0)
+    assert len(notifications.texts) == 1
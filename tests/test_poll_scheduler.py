@@ -0,0 +1,77 @@
+import numpy as np
+
+from services.poll_scheduler import PollScheduler
+
+SYMBOLS = [f"P{i}/USDT" for i in range(10)]
+
+
+def _scheduler(**kwargs) -> PollScheduler:
+    # Шаг 1 сек, интервал без оценки — 8 сек (уровень 3), самый редкий — 64 сек (уровень 6)
+    params = {"bulk": {"ex": False}, "adaptive": True, "interval": 8, "min_interval": 1, "max_interval": 64,
+              "budget": 0}
+    return PollScheduler({"ex": SYMBOLS}, **{**params, **kwargs})
+
+
+def _observe_twice(scheduler: PollScheduler, moves: np.ndarray, distances: np.ndarray):
+    """Два снимка с интервалом в секунду: после второго у пар есть оценка волатильности."""
+    scheduler.observe("ex", SYMBOLS, np.full(len(SYMBOLS), 100.0), distances, now=0.0)
+    scheduler.observe("ex", SYMBOLS, 100.0 * (1 + moves), distances, now=1.0)
+
+
+def test_non_adaptive_polls_every_pair_every_tick():
+    scheduler = _scheduler(adaptive=False)
+    assert scheduler.tick == 8 and scheduler.max_level == 0
+    for tick in range(5):
+        assert scheduler.take_due("ex", tick) == SYMBOLS
+    scheduler.observe("ex", SYMBOLS, np.full(len(SYMBOLS), 100.0), np.zeros(len(SYMBOLS)), now=0.0)
+    assert scheduler.take_due("ex", 5) == SYMBOLS
+    assert scheduler.request_rate() == len(SYMBOLS) / 8
+
+
+def test_levels_follow_distance_and_volatility():
+    scheduler = _scheduler()
+    assert (scheduler.tick, scheduler.base_level, scheduler.max_level) == (1, 3, 6)
+    moves = np.where(np.arange(10) < 5, 0.01, 0.0)  # Первые пять пар двигаются, остальные стоят
+    distances = np.array([0.0, 5, 5, 5, np.inf, 5, 5, 5, 5, np.inf])
+    _observe_twice(scheduler, moves, distances)
+
+    level = scheduler.exchanges["ex"].level
+    assert level[0] == 0  # На пороге — чаще всего
+    assert (level[5:9] == scheduler.max_level).all()  # Неподвижная пара — реже всего
+    assert level[4] == level[9] == scheduler.base_level  # Расстояние неизвестно
+    # 5% при σ² = log(1.01)² в секунду — ~25 сек до порога, четверть — 6 сек, уровень 2
+    assert (level[1:4] == 2).all()
+
+
+def test_unknown_volatility_keeps_the_base_interval():
+    scheduler = _scheduler()
+    scheduler.observe("ex", SYMBOLS, np.full(len(SYMBOLS), 100.0), np.zeros(len(SYMBOLS)), now=0.0)
+    assert (scheduler.exchanges["ex"].level == scheduler.base_level).all()
+
+
+def test_budget_doubles_the_fastest_intervals_until_it_fits():
+    scheduler = _scheduler(budget=120)  # 2 запроса в секунду
+    moves = np.where(np.arange(10) < 5, 0.01, 0.0)
+    distances = np.where(np.arange(10) < 5, 0.0, 5.0)
+    _observe_twice(scheduler, moves, distances)
+
+    level = scheduler.exchanges["ex"].level
+    assert scheduler.request_rate() <= 2
+    # Пять пар у порога: 5 / 2² + 5 / 64 ≤ 2, а на уровне 1 было бы больше бюджета
+    assert (level[:5] == 2).all()
+    assert (level[5:] == scheduler.max_level).all()  # Редкие пары не трогаются
+
+
+def test_budget_stops_at_max_level():
+    scheduler = _scheduler(budget=1)
+    _observe_twice(scheduler, np.full(10, 0.01), np.zeros(10))
+    assert (scheduler.exchanges["ex"].level == scheduler.max_level).all()
+    assert scheduler.request_rate() > scheduler.budget
+
+
+def test_bulk_exchange_costs_one_request_per_fastest_interval():
+    scheduler = _scheduler(bulk={"ex": True})
+    _observe_twice(scheduler, np.where(np.arange(10) < 1, 0.01, 0.0), np.where(np.arange(10) < 1, 0.0, 5.0))
+    assert scheduler.request_rate() == 1.0  # Одна пара у порога задаёт частоту общего запроса
+    due = [len(scheduler.take_due("ex", tick)) for tick in range(1, 65)]
+    assert due[:3] == [1, 1, 1] and due[63] == 10
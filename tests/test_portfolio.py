@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from db.sqlite_module import DBManager, GroupCommitWriter
+from services.portfolio import PortfolioLedger
+
+
+def _db(session):
+    return DBManager(session, writer=GroupCommitWriter())
+
+
+def _order(status: str, side: str = "buy", price: float = 10.0) -> dict:
+    return {"strategy": "test", "exchange": "binance", "symbol": "TON/USDT", "order_type": "market",
+            "side": side, "amount": 1.0, "price": price, "status": status}
+
+
+def test_late_fills_are_applied_once_across_restarts(session_factory):
+    async def scenario():
+        ledger = PortfolioLedger(initial_cash=1000.0)
+        async with session_factory() as session:
+            db = _db(session)
+            await ledger.load(db)
+            # id 1 и 3 записаны открытыми, id 2 исполнен сразу
+            created = await db.create_orders([_order("open"), _order("closed"), _order("open")])
+            await ledger.apply_orders(db, created)
+            assert ledger.last_order_id == 2
+
+            # id 1 меньше last_order_id — применяется сверкой, id 3 — догонкой
+            closed = await ledger.apply_late_orders(db, {1: "closed", 3: "closed"})
+            repeated = await ledger.apply_late_orders(db, {1: "closed", 3: "closed"})
+
+        async with session_factory() as session:
+            restarted = PortfolioLedger(initial_cash=1000.0)
+            await restarted.load(_db(session))
+        return ledger, restarted, closed, repeated
+
+    ledger, restarted, closed, repeated = asyncio.run(scenario())
+    assert [row.id for row in closed] == [1, 3]
+    assert repeated == []
+    assert ledger.last_order_id == restarted.last_order_id == 3
+    assert ledger.state.portfolio["TON/USDT"]["amount"] == pytest.approx(3.0)
+    assert restarted.state.portfolio["TON/USDT"]["amount"] == pytest.approx(3.0)
+    assert restarted.state.cash == pytest.approx(ledger.state.cash)
+    assert ledger.state.cash == pytest.approx(1000.0 - 3 * 10.0 * 1.001)
+
+
+def test_canceled_late_order_is_not_applied(session_factory):
+    async def scenario():
+        ledger = PortfolioLedger(initial_cash=1000.0)
+        async with session_factory() as session:
+            db = _db(session)
+            await ledger.load(db)
+            await ledger.apply_orders(db, await db.create_orders([_order("open")]))
+            closed = await ledger.apply_late_orders(db, {1: "canceled"})
+            row = await db.get_order_by_id(1)
+            return ledger, closed, row.status
+
+    ledger, closed, status = asyncio.run(scenario())
+    assert closed == []
+    assert status == "canceled"
+    assert ledger.state.portfolio == {}
+    assert ledger.state.cash == pytest.approx(1000.0)
+
+
+def test_restart_catches_up_fills_recorded_after_last_save(session_factory):
+    async def scenario():
+        async with session_factory() as session:
+            db = _db(session)
+            ledger = PortfolioLedger(initial_cash=1000.0)
+            await ledger.load(db)
+            await ledger.apply_orders(db, await db.create_orders([_order("closed")]))
+            # Запись прошла, а учёт не сохранён (сбой между create_orders и apply_orders)
+            await db.create_orders([_order("closed", side="sell", price=12.0)])
+
+        async with session_factory() as session:
+            restarted = PortfolioLedger(initial_cash=1000.0)
+            await restarted.load(_db(session))
+            await restarted.load(_db(session))
+        return restarted
+
+    restarted = asyncio.run(scenario())
+    assert restarted.last_order_id == 2
+    assert restarted.state.portfolio == {}
+    assert restarted.state.realized_pnl == pytest.approx(2.0)
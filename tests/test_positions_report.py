@@ -0,0 +1,32 @@
+import asyncio
+from types import SimpleNamespace
+
+import services.positions_report as positions_report_module
+from services.portfolio import PortfolioLedger
+from services.positions_report import PositionsReport
+
+
+def test_report_totals_come_from_ledger(monkeypatch):
+    ledger = PortfolioLedger(initial_cash=1000.0)
+    ledger.state.apply_fill("buy", "TON/USDT", 10.0, 2.0)
+    ledger.state.apply_fill("buy", "BTC/USDT", 100.0, 1.0)  # Нет среди последних ордеров — биржа из TRACKING
+    ledger.loaded = True
+    monkeypatch.setattr(positions_report_module, "portfolio_ledger", ledger)
+    monkeypatch.setattr(positions_report_module, "TRACKING", {"bybit": ["BTC/USDT"]})
+
+    report = PositionsReport()
+    requested = []
+
+    async def price_pairs(pairs):
+        requested.extend(pairs)
+        return {("binance", "TON/USDT"): 12.0, ("bybit", "BTC/USDT"): 110.0}
+
+    monkeypatch.setattr(report, "price_pairs", price_pairs)
+    order = SimpleNamespace(exchange="binance", symbol="TON/USDT", side="buy", price=10.0, amount=2.0,
+                            status="closed", strategy="test", order_type="market", created_at=None)
+
+    parts = asyncio.run(report.build([order]))
+    assert ("bybit", "BTC/USDT") in requested
+    cash = 1000.0 - (2 * 10.0 + 100.0) * 1.001
+    assert f"кэш <b>{cash:.2f} USDT</b>, активы <b>{cash + 2 * 12.0 + 110.0:.2f} USDT</b>" in parts[-1]
+    assert "<b>Нереализованный PnL:</b> <b>14.00 USDT</b>" in parts[-1]
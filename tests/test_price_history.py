@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+import services.price_history as price_history
+from db.sqlite_module import DBManager, GroupCommitWriter
+from services.price_history import TickRecorder, load_recent_prices
+
+MINUTE = 60_000
+
+
+def test_load_recent_prices_tops_up_ticks_with_latest_bars(session_factory):
+    async def scenario():
+        async with session_factory() as session:
+            db = DBManager(session, writer=GroupCommitWriter())
+            await db.save_ticks([("binance", "TON/USDT", i * MINUTE + 1_000, float(i), 1.0) for i in range(5)])
+            await db.rollup_history("1m", 3 * MINUTE)  # Бары 0, 1, 2; тики 3, 4
+            return [(await load_recent_prices(db, "binance", "TON/USDT", limit)).tolist() for limit in (1, 2, 4, 10)]
+
+    only_ticks, all_ticks, with_bars, everything = asyncio.run(scenario())
+    assert only_ticks == [4.0]
+    assert all_ticks == [3.0, 4.0]
+    assert with_bars == [1.0, 2.0, 3.0, 4.0]
+    assert everything == [0.0, 1.0, 2.0, 3.0, 4.0]
+
+
+class _BrokenSession:
+    async def __aenter__(self):
+        raise RuntimeError("database is locked")
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def test_tick_buffer_keeps_newest_ticks_while_db_is_down(session_factory, monkeypatch):
+    recorder = TickRecorder(max_buffer=3)
+
+    async def scenario():
+        monkeypatch.setattr(price_history, "AsyncSessionLocal", _BrokenSession)
+        recorder.record("binance", "TON/USDT", 1.0, 0.0, ts=1)
+        recorder.record("binance", "TON/USDT", 2.0, 0.0, ts=2)
+        with pytest.raises(RuntimeError):
+            await recorder.flush()
+        recorder.record("binance", "TON/USDT", 3.0, 0.0, ts=3)
+        recorder.record("binance", "TON/USDT", 4.0, 0.0, ts=4)
+        with pytest.raises(RuntimeError):
+            await recorder.flush()
+        recorder.record("binance", "TON/USDT", 5.0, 0.0, ts=5)
+
+        monkeypatch.setattr(price_history, "AsyncSessionLocal", session_factory)
+        written = await recorder.flush()
+        async with session_factory() as session:
+            _, prices, _ = await DBManager(session).get_ticks_range("binance", "TON/USDT")
+        return written, prices
+
+    written, prices = asyncio.run(scenario())
+    assert written == 3
+    assert prices.tolist() == [3.0, 4.0, 5.0]
+    assert recorder.dropped == 2
+    assert len(recorder._buffer) == 0
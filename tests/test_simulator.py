@@ -0,0 +1,128 @@
+import asyncio
+import time
+
+import ccxt.async_support as ccxt
+import numpy as np
+import pytest
+
+from exchanges.simulator import SimulatedExchange
+
+SYMBOL = "TON/USDT"
+# Повторяемые минутные закрытия: бар k — k-я секунда работы симулятора при speed=60
+CLOSES = [100.0, 101.0, 99.0, 97.0, 103.0, 100.0]
+
+
+def _exchange(**kwargs) -> SimulatedExchange:
+    params = {"speed": 60, "spread": 0.002, "latency_ms": 0, "error_rate": 0, "rate_limit": 0, "seed": 1}
+    exchange = SimulatedExchange(data_dir="", **{**params, **kwargs})
+    exchange.close_prices = np.array(CLOSES)
+    exchange.volumes = np.ones(len(CLOSES))
+    exchange.markets[SYMBOL] = {"id": "TONUSDT", "symbol": SYMBOL, "base": "TON", "quote": "USDT", "active": True,
+                                "offset": 0, "scale": 1.0}
+    _at(exchange, 0)
+    return exchange
+
+
+def _at(exchange: SimulatedExchange, bar: int):
+    """Переводит часы симулятора на середину бара."""
+    exchange.started = time.monotonic() - (bar + 0.5) * 60 / exchange.speed
+
+
+async def _place(exchange, *args, **kwargs):
+    # Ошибка «после создания» не выпадает при error_rate=0, поэтому ответ приходит всегда
+    return await exchange.create_order(SYMBOL, *args, **kwargs)
+
+
+def test_market_orders_fill_at_the_touch():
+    async def scenario():
+        exchange = _exchange()
+        buy = await _place(exchange, "market", "buy", 2.0)
+        _at(exchange, 1)
+        sell = await _place(exchange, "market", "sell", 2.0)
+        return buy, sell
+
+    buy, sell = asyncio.run(scenario())
+    assert buy["status"] == "closed" and buy["filled"] == 2.0
+    assert buy["average"] == pytest.approx(100.0 * 1.001)  # ask
+    assert sell["status"] == "closed"
+    assert sell["average"] == pytest.approx(101.0 * 0.999)  # bid
+
+
+def test_limit_order_waits_for_its_price_and_then_fills():
+    async def scenario():
+        exchange = _exchange()
+        order = await _place(exchange, "limit", "buy", 1.0, 98.0)
+        statuses = [order["status"], (await exchange.fetch_order(order["id"]))["status"]]
+        _at(exchange, 2)  # ask 99.099 — ещё выше лимита
+        statuses.append((await exchange.fetch_order(order["id"]))["status"])
+        _at(exchange, 3)  # ask 97.097 — лимит достигнут
+        filled = await exchange.fetch_order(order["id"])
+        return statuses, filled, exchange.open_orders[SYMBOL]
+
+    statuses, filled, waiting = asyncio.run(scenario())
+    assert statuses == ["open", "open", "open"]
+    assert filled["status"] == "closed"
+    assert filled["average"] == 98.0 and filled["filled"] == 1.0 and filled["remaining"] == 0.0
+    assert waiting == []
+
+
+def test_marketable_limit_fills_immediately_and_open_limit_can_be_canceled():
+    async def scenario():
+        exchange = _exchange()
+        crossing = await _place(exchange, "limit", "sell", 1.0, 99.0)  # Ниже bid 99.9
+        resting = await _place(exchange, "limit", "sell", 1.0, 110.0)
+        canceled = await exchange.cancel_order(resting["id"])
+        _at(exchange, 4)
+        after = await exchange.fetch_order(resting["id"])
+        return crossing, canceled, after
+
+    crossing, canceled, after = asyncio.run(scenario())
+    assert crossing["status"] == "closed" and crossing["average"] == pytest.approx(99.9)
+    assert canceled["status"] == "canceled"
+    assert after["status"] == "canceled"  # Отменённый ордер не исполняется и при подходящей цене
+
+
+def test_client_order_id_is_unique_and_fetchable():
+    async def scenario():
+        exchange = _exchange()
+        order = await _place(exchange, "market", "buy", 1.0, params={"clientOrderId": "cid-1"})
+        with pytest.raises(ccxt.DuplicateOrderId):
+            await _place(exchange, "market", "buy", 1.0, params={"clientOrderId": "cid-1"})
+        found = await exchange.fetch_order(None, SYMBOL, {"clientOrderId": "cid-1"})
+        with pytest.raises(ccxt.OrderNotFound):
+            await exchange.fetch_order("999")
+        return order, found, len(exchange.orders)
+
+    order, found, count = asyncio.run(scenario())
+    assert found["id"] == order["id"]
+    assert count == 1
+
+
+def test_error_rate_raises_network_errors_at_the_configured_rate():
+    async def scenario():
+        exchange = _exchange(error_rate=0.2)
+        errors = 0
+        for _ in range(2000):
+            try:
+                await exchange.fetch_ticker(SYMBOL)
+            except ccxt.NetworkError:
+                errors += 1
+        return errors, exchange.errors
+
+    errors, counted = asyncio.run(scenario())
+    assert errors == counted
+    assert 0.15 < errors / 2000 < 0.25
+
+
+def test_rate_limit_raises_rate_limit_exceeded():
+    async def scenario():
+        exchange = _exchange(rate_limit=5)
+        # Все запросы — в пределах одной секунды окна
+        while time.monotonic() % 1 > 0.5:
+            await asyncio.sleep(0.05)
+        results = await asyncio.gather(*(exchange.fetch_ticker(SYMBOL) for _ in range(8)), return_exceptions=True)
+        return results
+
+    results = asyncio.run(scenario())
+    assert sum(isinstance(r, dict) for r in results) == 5
+    assert all(isinstance(r, ccxt.RateLimitExceeded) for r in results if not isinstance(r, dict))
@@ -0,0 +1,87 @@
+import asyncio
+
+from db.sqlite_module import DBManager, GroupCommitWriter
+
+MINUTE = 60_000
+HOUR = 3_600_000
+
+
+def _db(session):
+    # Отдельный незапущенный writer: записи идут напрямую в сессию теста
+    return DBManager(session, writer=GroupCommitWriter())
+
+
+def test_rollup_ticks_to_minute_bars(session_factory):
+    async def scenario():
+        async with session_factory() as session:
+            db = _db(session)
+            await db.save_ticks([
+                ("binance", "TON/USDT", 0, 10.0, 1.0),
+                ("binance", "TON/USDT", 20_000, 12.0, 2.0),
+                ("binance", "TON/USDT", 40_000, 9.0, 3.0),
+                ("binance", "TON/USDT", MINUTE + 1_000, 11.0, 4.0),
+                ("binance", "TON/USDT", 2 * MINUTE + 5_000, 13.0, 5.0),  # Незавершённый бар — остаётся тиком
+            ])
+            # cutoff внутри третьей минуты выравнивается вниз на её начало
+            written = await db.rollup_history("1m", 2 * MINUTE + 30_000)
+            bars = await db.get_bars_range("binance", "TON/USDT", "1m")
+            ts, prices, _ = await db.get_ticks_range("binance", "TON/USDT")
+            return written, bars, ts, prices
+
+    written, bars, ts, prices = asyncio.run(scenario())
+    assert written == 2
+    assert bars["ts"].tolist() == [0, MINUTE]
+    assert bars["open"].tolist() == [10.0, 11.0]
+    assert bars["high"].tolist() == [12.0, 11.0]
+    assert bars["low"].tolist() == [9.0, 11.0]
+    assert bars["close"].tolist() == [9.0, 11.0]
+    assert bars["volume"].tolist() == [3.0, 4.0]
+    assert ts.tolist() == [2 * MINUTE + 5_000]
+    assert prices.tolist() == [13.0]
+
+
+def test_rollup_minute_bars_to_hour_bars(session_factory):
+    async def scenario():
+        async with session_factory() as session:
+            db = _db(session)
+            await db.save_ticks([("bybit", "BTC/USDT", i * MINUTE, 100.0 + i, float(i)) for i in range(3)])
+            await db.rollup_history("1m", HOUR)
+            written = await db.rollup_history("1h", HOUR + 1, source="1m")
+            return written, await db.get_bars_range("bybit", "BTC/USDT", "1h"), \
+                await db.get_bars_range("bybit", "BTC/USDT", "1m")
+
+    written, hourly, minutely = asyncio.run(scenario())
+    assert written == 1
+    assert hourly["open"].tolist() == [100.0]
+    assert hourly["high"].tolist() == [102.0]
+    assert hourly["close"].tolist() == [102.0]
+    assert len(minutely["ts"]) == 0
+
+
+def test_rollup_groups_interleaved_pairs(session_factory):
+    async def scenario():
+        async with session_factory() as session:
+            db = _db(session)
+            # Тики двух пар вперемешку и не по порядку времени; объём может отсутствовать
+            await db.save_ticks([
+                ("binance", "ETH/USDT", 30_000, 5.0, None),
+                ("binance", "TON/USDT", 10_000, 2.0, 1.0),
+                ("okx", "TON/USDT", 5_000, 7.0, 2.0),
+                ("binance", "TON/USDT", 0, 1.0, 3.0),
+                ("binance", "ETH/USDT", 10_000, 4.0, 6.0),
+                ("binance", "TON/USDT", MINUTE + 1, 3.0, 4.0),
+            ])
+            written = await db.rollup_history("1m", 2 * MINUTE)
+            pairs = [("binance", "ETH/USDT"), ("binance", "TON/USDT"), ("okx", "TON/USDT")]
+            return written, {pair: await db.get_bars_range(*pair, "1m") for pair in pairs}
+
+    written, bars = asyncio.run(scenario())
+    assert written == 4
+    eth = bars[("binance", "ETH/USDT")]
+    assert (eth["open"].tolist(), eth["close"].tolist(), eth["volume"].tolist()) == ([4.0], [5.0], [0.0])
+    ton = bars[("binance", "TON/USDT")]
+    assert ton["ts"].tolist() == [0, MINUTE]
+    assert ton["open"].tolist() == [1.0, 3.0]
+    assert ton["close"].tolist() == [2.0, 3.0]
+    assert ton["volume"].tolist() == [1.0, 4.0]
+    assert bars[("okx", "TON/USDT")]["close"].tolist() == [7.0]
@@ -0,0 +1,62 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from strategies.base import symbol_index
+from strategies.initial_threshold import InitialThresholdStrategy
+from strategies.martingale_strategy import MartingaleStrategy
+from strategies.moving_average import MovingAverageCrossStrategy
+from strategies.static_initial_threshold import StaticInitialThresholdStrategy
+from strategies.threshold import ThresholdStrategy
+from strategies.trailing_initial_threshold import TrailingInitialThresholdStrategy
+from strategies.volume_spikes import VolumeSpikeStrategy
+
+FACTORIES = {
+    "InitialThresholdStrategy": lambda: InitialThresholdStrategy(0.5),
+    "TrailingInitialThresholdStrategy": lambda: TrailingInitialThresholdStrategy(0.5),
+    "StaticInitialThresholdStrategy": lambda: StaticInitialThresholdStrategy(0.5),
+    "ThresholdStrategy": lambda: ThresholdStrategy(0.5),
+    "MartingaleStrategy": lambda: MartingaleStrategy(0.5, max_steps=3),
+    "MovingAverageCrossStrategy": lambda: MovingAverageCrossStrategy(3, 8),
+    "VolumeSpikeStrategy": lambda: VolumeSpikeStrategy(50.0),
+}
+SYMBOLS = [f"C{i}/USDT" for i in range(6)]  # Пары общего symbol_index: обе копии стратегии видят те же id
+STEPS = 400
+
+
+def _walk(seed: int = 7) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.004, (STEPS, len(SYMBOLS))), axis=0))
+    volumes = rng.gamma(2.0, 50.0, (STEPS, len(SYMBOLS)))
+    return prices, volumes
+
+
+def _comparable(alerts: list[dict]) -> list[dict]:
+    # Время сигнала берётся из часов, остальное должно совпасть
+    return [{k: v for k, v in alert.items() if k != "timestamp"} for alert in alerts]
+
+
+@pytest.mark.parametrize("name", FACTORIES)
+def test_batch_and_scalar_paths_give_the_same_signals(name):
+    prices, volumes = _walk()
+    scalar = FACTORIES[name]()
+    batch = FACTORIES[name]()
+    ids = symbol_index.intern_many("binance", SYMBOLS)
+
+    async def scalar_run():
+        signals = []
+        for step in range(STEPS):
+            for j, symbol in enumerate(SYMBOLS):
+                signals += await scalar.check("binance", symbol, float(prices[step, j]), float(volumes[step, j]))
+        return signals
+
+    scalar_signals = asyncio.run(scalar_run())
+    batch_signals = []
+    for step in range(STEPS):
+        batch_signals += batch.check_batch(ids, prices[step], volumes[step])
+
+    assert scalar_signals, "сценарий должен давать сигналы"
+    assert sorted(map(repr, _comparable(scalar_signals))) == sorted(map(repr, _comparable(batch_signals)))
+    for column in scalar.columns:
+        np.testing.assert_allclose(getattr(scalar, column)[:len(SYMBOLS)], getattr(batch, column)[:len(SYMBOLS)])
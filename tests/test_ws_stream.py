@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+import websockets
+
+import exchanges.ws_client as ws_client
+from emulation.ws_server import StandInTickerServer
+from exchanges.ws_client import BinanceTickerStream, BybitTickerStream
+
+
+async def _wait_for(condition, timeout: float = 5):
+    async def poll():
+        while not condition():
+            await asyncio.sleep(0.01)
+    await asyncio.wait_for(poll(), timeout)
+
+
+@pytest.mark.parametrize("stream_cls", [BinanceTickerStream, BybitTickerStream])
+def test_stream_receives_ticks_and_resubscribes_after_disconnect(stream_cls, monkeypatch):
+    async def scenario():
+        server = StandInTickerServer(rate=50)
+        async with websockets.serve(server.handler, "127.0.0.1", 0) as ws_server:
+            port = ws_server.sockets[0].getsockname()[1]
+            monkeypatch.setattr(ws_client, "STREAM_URL_OVERRIDE", f"ws://127.0.0.1:{port}")
+            monkeypatch.setattr(ws_client, "STREAM_RECONNECT_MAX_DELAY", 1)
+            ticks = []
+
+            async def on_tick(exchange, symbol, price, volume):
+                ticks.append((exchange, symbol, price))
+
+            stream = stream_cls("test", ["TON/USDT", "BTC/USDT"], on_tick)
+            task = asyncio.create_task(stream.run())
+            try:
+                await _wait_for(lambda: {symbol for _, symbol, _ in ticks} == {"TON/USDT", "BTC/USDT"})
+                first_connection = len(ticks)
+                subscribed = server.subscribe_requests
+
+                await server.drop_connections()
+                await _wait_for(lambda: not stream.connected.is_set())
+                await asyncio.wait_for(stream.connected.wait(), 5)
+                await _wait_for(lambda: len(ticks) > first_connection + 2)
+            finally:
+                task.cancel()
+            return ticks, subscribed, server.subscribe_requests
+
+    ticks, subscribed, total = asyncio.run(scenario())
+    assert subscribed >= 1
+    assert total == 2 * subscribed  # После переподключения подписки отправлены заново
+    assert all(exchange == "test" and price > 0 for exchange, _, price in ticks)
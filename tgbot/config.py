@@ -12,9 +12,97 @@ POSITION_SIZE = float(os.getenv("POSITION_SIZE", 20))  # Размер позиц
 HISTORICAL_DATA_PATH = os.getenv("HISTORICAL_DATA_PATH")
 COIN_NAME = os.getenv("COIN_NAME", "TON")  # Название монеты по умолчанию TON
 
+# Параллельный опрос бирж
+EXCHANGE_CONCURRENCY = int(os.getenv("EXCHANGE_CONCURRENCY", 5))  # Максимум одновременных запросов к одной бирже
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", 10))  # Таймаут одного запроса к бирже, сек
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", 60))  # Сколько держать простаивающее соединение, сек
+
+# Планировщик опроса (check_prices): тики по расписанию, без сдвига на длительность опроса
+POLL_ADAPTIVE = os.getenv("POLL_ADAPTIVE", "0") == "1"  # Свой интервал у каждой пары: по волатильности и близости к порогу стратегии
+POLL_MIN_INTERVAL = float(os.getenv("POLL_MIN_INTERVAL", 5))  # Самый частый опрос пары (примерно, шаг подгоняется под POLL_INTERVAL), сек
+POLL_MAX_INTERVAL = float(os.getenv("POLL_MAX_INTERVAL", 300))  # Самый редкий опрос пары (округляется вниз до POLL_INTERVAL * 2^n), сек
+POLL_REQUEST_BUDGET = float(os.getenv("POLL_REQUEST_BUDGET", 0))  # Запросов опроса в минуту на все биржи, 0 — без ограничения
+
 TRACKING = {
     # "binance": ["TON/USDT","NOT/USDT"],
 
     "binance": ["TON/USDT","NOT/USDT","BTC/USDT","ETH/USDT","XRP/USDT","SOL/USDT"],
     # "bybit": ["TON/USDT", "NOT/USDT", "BTC/USDT", "ETH/USDT", "XRP/USDT", "SOL/USDT"],
 }
+
+# Симулятор биржи (exchanges/simulator.py): офлайн-прогон без настоящих binance/bybit
+SIM_EXCHANGES = [name for name in os.getenv("SIM_EXCHANGES", "").split(",") if name]  # Биржи, заменяемые симулятором, например "sim" или "binance"
+SIM_SYMBOLS = int(os.getenv("SIM_SYMBOLS", 0))  # Отслеживать на симулируемой бирже столько синтетических пар SIMnnnn/USDT (0 — пары из TRACKING)
+SIM_DATA_DIR = os.getenv("SIM_DATA_DIR", f"historydata/{COIN_NAME}")  # Архивы свечей для повтора цен
+SIM_SPEED = float(os.getenv("SIM_SPEED", 60))  # Во сколько раз время симулятора быстрее реального
+SIM_SPREAD = float(os.getenv("SIM_SPREAD", 0.001))  # Спред стакана (доля цены)
+SIM_LATENCY_MS = float(os.getenv("SIM_LATENCY_MS", 50))  # Задержка ответа, мс
+SIM_LATENCY_JITTER = float(os.getenv("SIM_LATENCY_JITTER", 0.5))  # Разброс задержки (доля от SIM_LATENCY_MS)
+SIM_ERROR_RATE = float(os.getenv("SIM_ERROR_RATE", 0))  # Доля запросов, завершающихся сетевой ошибкой
+SIM_RATE_LIMIT = float(os.getenv("SIM_RATE_LIMIT", 0))  # Запросов в секунду до RateLimitExceeded, 0 — без ограничения
+SIM_SEED = int(os.getenv("SIM_SEED", 42))  # Seed случайных задержек, ошибок и синтетических цен
+
+for _name in SIM_EXCHANGES:
+    if SIM_SYMBOLS:
+        TRACKING[_name] = [f"SIM{i:04d}/USDT" for i in range(SIM_SYMBOLS)]
+
+# Потоковый режим (WebSocket)
+STREAM_URL_OVERRIDE = os.getenv("STREAM_URL_OVERRIDE")  # Например ws://127.0.0.1:8765 для локального сервера
+STREAM_RECONNECT_MAX_DELAY = float(os.getenv("STREAM_RECONNECT_MAX_DELAY", 30))  # Максимальная пауза перед переподключением, сек
+
+# Кэш последних цен (запись в price_entries с отложенным сбросом)
+PRICE_FLUSH_INTERVAL = float(os.getenv("PRICE_FLUSH_INTERVAL", 30))  # Период сброса кэша цен в БД, сек
+PRICE_FLUSH_ON_EXIT = os.getenv("PRICE_FLUSH_ON_EXIT", "1") == "1"  # Сбрасывать несохранённые цены при остановке
+
+# История цен (таблица price_ticks и свёртка в бары)
+TICK_RETENTION_HOURS = float(os.getenv("TICK_RETENTION_HOURS", 24))  # Сколько хранить сырые тики до свёртки в 1m-бары
+BAR_1M_RETENTION_DAYS = float(os.getenv("BAR_1M_RETENTION_DAYS", 7))  # Сколько хранить 1m-бары до свёртки в 1h-бары
+HISTORY_ROLLUP_INTERVAL = float(os.getenv("HISTORY_ROLLUP_INTERVAL", 3600))  # Период запуска свёртки, сек
+TICK_BUFFER_MAX = int(os.getenv("TICK_BUFFER_MAX", 200_000))  # Максимум тиков в ожидании записи; при сбоях БД старые отбрасываются
+
+# Состояние стратегий по парам
+STATE_MAX_PAIRS = int(os.getenv("STATE_MAX_PAIRS", 0))  # Максимум пар в состоянии стратегий (LRU), 0 — без ограничения
+STATE_IDLE_TTL = float(os.getenv("STATE_IDLE_TTL", 0))  # Забывать пары без цен дольше стольких секунд, 0 — не забывать
+STRATEGY_CHECKPOINT_PATH = os.getenv("STRATEGY_CHECKPOINT_PATH", "strategy_state.npz")  # Файл чекпоинта состояния стратегий
+STRATEGY_CHECKPOINT_INTERVAL = float(os.getenv("STRATEGY_CHECKPOINT_INTERVAL", 60))  # Период записи чекпоинта, сек (0 — только при остановке)
+
+# Очередь уведомлений в Telegram
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", 1000))  # Максимум сообщений в очереди, лишние отбрасываются
+NOTIFY_RATE_PER_CHAT = float(os.getenv("NOTIFY_RATE_PER_CHAT", 1))  # Сообщений в секунду в один чат
+NOTIFY_BURST = int(os.getenv("NOTIFY_BURST", 3))  # Сколько сообщений в чат можно отправить подряд без паузы
+NOTIFY_MAX_RETRIES = int(os.getenv("NOTIFY_MAX_RETRIES", 5))  # Попыток отправки при RetryAfter и сетевых ошибках
+NOTIFY_CLOSE_TIMEOUT = float(os.getenv("NOTIFY_CLOSE_TIMEOUT", 10))  # Сколько ждать отправки очереди при остановке, сек
+
+# Отчёт по позициям в боте
+REPORT_PRICE_MAX_AGE = float(os.getenv("REPORT_PRICE_MAX_AGE", 30))  # Цена из кэша мониторинга годится, если не старше, сек
+REPORT_CACHE_TTL = float(os.getenv("REPORT_CACHE_TTL", 5))  # Сколько отдавать уже построенный отчёт повторным запросам, сек
+
+# Запись в SQLite
+# По умолчанию — режимы самой SQLite. WAL (чтения бота и отчётов не ждут записи) вместе с synchronous=NORMAL
+# (fsync при чекпоинте, а не на каждый commit) заметно ускоряют запись, но последние транзакции перед
+# отключением питания могут пропасть, а файлы -wal/-shm должны лежать рядом с базой (не для сетевых дисков)
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "DELETE")  # DELETE или WAL
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "FULL")  # FULL — fsync на каждый commit, NORMAL — см. выше
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", -20000))  # Кэш страниц: отрицательное — в КиБ
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000))  # Сколько ждать блокировку вместо ошибки, мс
+SQLITE_GROUP_COMMIT = os.getenv("SQLITE_GROUP_COMMIT", "0") == "1"  # Все записи через одну задачу пачками в одной транзакции
+SQLITE_GROUP_COMMIT_MS = float(os.getenv("SQLITE_GROUP_COMMIT_MS", 5))  # Сколько копить пачку после первой записи, мс
+SQLITE_GROUP_COMMIT_MAX = int(os.getenv("SQLITE_GROUP_COMMIT_MAX", 500))  # Максимум записей в одной транзакции
+
+# Исполнение ордеров
+ORDER_MODE = os.getenv("ORDER_MODE", "emulate")  # emulate — без реальных ордеров, live — ордера на бирже
+ORDER_WORKERS_PER_EXCHANGE = int(os.getenv("ORDER_WORKERS_PER_EXCHANGE", 4))  # Одновременных отправок ордеров на биржу
+ORDER_QUEUE_SIZE = int(os.getenv("ORDER_QUEUE_SIZE", 1000))  # Максимум ожидающих ордеров в очереди одного воркера, лишние отбрасываются
+ORDER_MAX_RETRIES = int(os.getenv("ORDER_MAX_RETRIES", 3))  # Попыток отправки при сетевых ошибках (с тем же client id)
+ORDER_RECORD_BATCH = int(os.getenv("ORDER_RECORD_BATCH", 100))  # Максимум исполнений в одной записи в БД
+ORDER_RECONCILE_INTERVAL = float(os.getenv("ORDER_RECONCILE_INTERVAL", 5))  # Период проверки открытых ордеров, сек
+
+# Метрики
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")  # Адрес эндпоинта /metrics (только локальный по умолчанию)
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))  # Порт эндпоинта /metrics для Prometheus, 0 — не запускать
+
+# Профилирование (бэктесты и цикл опроса)
+PROFILE_MODE = os.getenv("PROFILE_MODE", "off")  # off, sample — выборочный по SIGPROF (дёшево), cprofile — детерминированный по фазам
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 5))  # Период выборки стека в режиме sample, мс процессорного времени
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")  # Куда писать collapsed stacks и сводку
+PROFILE_TOP = int(os.getenv("PROFILE_TOP", 25))  # Сколько функций в сводке top-N
@@ -1,12 +1,230 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
 from aiogram import Bot, Dispatcher
+from aiogram.exceptions import TelegramRetryAfter, TelegramNetworkError, TelegramServerError
 
-from tgbot.config import TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID
+from services.metrics import telegram_send_seconds, queue_depth
+from tgbot.config import TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, NOTIFY_QUEUE_SIZE, NOTIFY_RATE_PER_CHAT, NOTIFY_BURST, \
+    NOTIFY_MAX_RETRIES, NOTIFY_CLOSE_TIMEOUT
 
 bot = Bot(token=TELEGRAM_BOT_TOKEN)
 dp = Dispatcher()
 
+MESSAGE_LIMIT = 4096  # Максимальная длина сообщения Telegram
+DIGEST_SEPARATOR = "\n\n〰️〰️〰️\n\n"
+
+
+class TokenBucket:
+    """Ограничитель частоты: rate токенов в секунду, не больше capacity подряд."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def available_in(self) -> float:
+        """Через сколько секунд будет токен (0 — уже есть)."""
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return max(self.updated - time.monotonic(), 0.0) + (1 - self.tokens) / self.rate
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+    def pause(self, seconds: float):
+        """Ни одного токена ближайшие seconds секунд (RetryAfter от Telegram)."""
+        self.tokens = 0.0
+        self.updated = max(self.updated, time.monotonic() + seconds)
+
+
+class NotificationDispatcher:
+    """
+    Фоновая отправка сообщений в Telegram.
+
+    notify() только кладёт сообщение в ограниченную очередь и сразу возвращается, так что цикл
+    мониторинга никогда не ждёт Telegram. Фоновая задача отправляет сообщения с ограничением
+    частоты по каждому чату (token bucket); после RetryAfter откладывается только чат, который его получил.
+    Сообщения с одинаковым ключом (пара), ещё ожидающие отправки, склеиваются в один дайджест.
+    """
+
+    def __init__(self, bot: Bot, maxsize: int = NOTIFY_QUEUE_SIZE, rate: float = NOTIFY_RATE_PER_CHAT,
+                 burst: int = NOTIFY_BURST, max_retries: int = NOTIFY_MAX_RETRIES):
+        self.bot = bot
+        self.maxsize = maxsize
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self._queue: deque[dict] = deque()
+        self._pending: dict[tuple, dict] = {}  # {(chat_id, key, parse_mode): сообщение в очереди}
+        self._buckets: dict[int | str, TokenBucket] = {}
+        self._wakeup = asyncio.Event()
+        self._worker: asyncio.Task | None = None
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    def notify(self, chat_id, text: str, key: str = None, parse_mode: str | None = "HTML", reply_markup=None) -> bool:
+        """
+        Ставит сообщение в очередь. Не ждёт отправки.
+
+        :param key: Ключ склейки (например "binance:TON/USDT"): ожидающие сообщения с тем же ключом
+                    отправляются одним дайджестом
+        :return: False, если очередь переполнена и сообщение отброшено
+        """
+        message = self._pending.get((chat_id, key, parse_mode)) if key is not None else None
+        if message is not None:
+            message["texts"].append(text)
+            if reply_markup is not None:
+                message["reply_markup"] = reply_markup
+            self.coalesced += 1
+            return True
+
+        if len(self._queue) >= self.maxsize:
+            self.dropped += 1
+            logging.warning(f"Очередь уведомлений переполнена ({self.maxsize}), сообщение отброшено")
+            return False
+
+        message = {"chat_id": chat_id, "key": key, "texts": [text], "parse_mode": parse_mode,
+                   "reply_markup": reply_markup}
+        self._queue.append(message)
+        if key is not None:
+            self._pending[self._pending_key(message)] = message
+        self._ensure_worker()
+        self._wakeup.set()
+        return True
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    @staticmethod
+    def render(message: dict) -> str:
+        """Текст сообщения; несколько склеенных — дайджест из последних, сколько влезает в лимит Telegram."""
+        texts = message["texts"]
+        if len(texts) == 1:
+            return texts[0][:MESSAGE_LIMIT]
 
-async def send_price_alert(exchange, pair, old, new, diff, direction, timestamp, strategy=None):
+        header = f"🗂 <b>Сигналов: {len(texts)}</b>" if message["parse_mode"] == "HTML" else f"🗂 Сигналов: {len(texts)}"
+        body: list[str] = []
+        size = len(header)
+        for text in reversed(texts):
+            if size + len(DIGEST_SEPARATOR) + len(text) > MESSAGE_LIMIT - 32:
+                break
+            body.append(text)
+            size += len(DIGEST_SEPARATOR) + len(text)
+        skipped = len(texts) - len(body)
+        if skipped:
+            header += f"\n(ещё {skipped} ранних пропущено)"
+        return DIGEST_SEPARATOR.join([header] + body[::-1])
+
+    def _bucket(self, chat_id) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._buckets[chat_id] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    async def _run(self):
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            # Первое сообщение в чат, у которого есть токен: ожидание одного чата не задерживает другие
+            waits = {}
+            message = None
+            for candidate in self._queue:
+                chat_id = candidate["chat_id"]
+                if chat_id not in waits:
+                    waits[chat_id] = self._bucket(chat_id).available_in()
+                if waits[chat_id] == 0:
+                    message = candidate
+                    break
+
+            if message is None:
+                # Пока ждём, новые сообщения по тем же парам продолжают склеиваться с ожидающими
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=min(waits.values()))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._queue.remove(message)
+            self._pending.pop(self._pending_key(message), None)
+            self._bucket(message["chat_id"]).take()
+            await self._send(message)
+
+    @staticmethod
+    def _pending_key(message: dict) -> tuple:
+        return message["chat_id"], message["key"], message["parse_mode"]
+
+    def _retry_later(self, message: dict, delay: float):
+        """Возвращает сообщение в начало очереди и приостанавливает отправку в его чат на delay секунд."""
+        message["attempts"] = message.get("attempts", 0) + 1
+        if message["attempts"] >= self.max_retries:
+            self.dropped += 1
+            logging.error(f"Сообщение в чат {message['chat_id']} не отправлено за {self.max_retries} попыток")
+            return
+        self._bucket(message["chat_id"]).pause(delay)
+        self._queue.appendleft(message)
+        if message["key"] is not None:
+            self._pending.setdefault(self._pending_key(message), message)
+
+    async def _send(self, message: dict):
+        start = time.perf_counter()
+        try:
+            await self.bot.send_message(
+                message["chat_id"],
+                self.render(message),
+                parse_mode=message["parse_mode"],
+                reply_markup=message["reply_markup"],
+                disable_web_page_preview=True,
+            )
+            self.sent += 1
+            telegram_send_seconds.observe(time.perf_counter() - start)
+        except TelegramRetryAfter as e:
+            logging.warning(f"Telegram просит подождать {e.retry_after} сек перед отправкой в чат {message['chat_id']}")
+            self._retry_later(message, e.retry_after)
+        except (TelegramNetworkError, TelegramServerError) as e:
+            logging.warning(f"Ошибка сети Telegram: {e!r}")
+            self._retry_later(message, min(2 ** message.get("attempts", 0), 30))
+        except Exception as e:
+            self.dropped += 1
+            logging.error(f"Ошибка при отправке сообщения в Telegram: {e!r}")
+
+    async def close(self, timeout: float = NOTIFY_CLOSE_TIMEOUT):
+        """Ждёт отправки очереди (не дольше timeout) и останавливает фоновую задачу."""
+        if self._worker is None:
+            return
+        deadline = time.monotonic() + timeout
+        while self._queue and time.monotonic() < deadline and not self._worker.done():
+            await asyncio.sleep(0.1)
+        if self._queue:
+            logging.warning(f"Не отправлено уведомлений при остановке: {len(self._queue)}")
+        self._worker.cancel()
+        self._worker = None
+
+
+# Общий на процесс диспетчер уведомлений
+notifier = NotificationDispatcher(bot)
+queue_depth.labels("notifications").set_function(lambda: len(notifier._queue))
+
+
+def send_price_alert(exchange, pair, old, new, diff, direction, timestamp, strategy=None):
+    """Ставит алерт в очередь уведомлений; алерты по одной паре склеиваются."""
     sign = "+" if new > old else "-"
     icon = "📈" if new > old else "📉"
     old_icon = "🔻" if new > old else "🔺"
@@ -28,12 +246,7 @@ async def send_price_alert(exchange, pair, old, new, diff, direction, timestamp,
     if strategy:
         text += f"\n📐 <b>Стратегия:</b> <i>{strategy}</i>"
 
-    await bot.send_message(
-        TELEGRAM_CHAT_ID,
-        text,
-        parse_mode="HTML",
-        disable_web_page_preview=True,
-    )
+    notifier.notify(TELEGRAM_CHAT_ID, text, key=f"{exchange}:{pair}")
 
 
 async def send_text(message):
@@ -41,6 +254,3 @@ async def send_text(message):
         await bot.send_message(TELEGRAM_CHAT_ID, message, parse_mode="HTML")
     except Exception as e:
         print(f"Ошибка при отправке сообщения в Telegram: {e}")
-
-
-